@@ -0,0 +1,339 @@
+# analytics.py
+# Whole-graph analytics over a sparse adjacency matrix: PageRank, degree,
+# approximate betweenness and weakly connected components.
+#
+# The nodes and relations are loaded once per graph revision into NumPy
+# arrays (node ids sorted, edges as positions into them); from the
+# memory-mapped columns of the current snapshot when KNOWLEDGE_SNAPSHOT_PATH
+# names one of this database taken at this revision (snapshot.matches),
+# otherwise from the tables. Every metric
+# works on a SciPy CSR matrix built from those arrays, restricted to some
+# relation types if asked, with row = source and column = target. Parallel
+# edges between the same two nodes count once.
+#
+#   pagerank      power iteration; nodes without outgoing edges spread
+#                 their rank evenly, as in the usual formulation
+#   degree        in, out and total, from bincount
+#   betweenness   Brandes' algorithm from ANALYTICS_BETWEENNESS_SAMPLES
+#                 random pivots, scaled up to an estimate of the exact
+#                 value (Brandes & Pich). The BFS runs level by level as
+#                 sparse matrix products, for a batch of pivots at once.
+#   components    weakly connected components (scipy.sparse.csgraph)
+#
+# Results are kept per (metric, parameters) until the revision moves, at
+# most ANALYTICS_CACHE_SIZE of them. A burst of identical requests computes
+# once; cached results and other computations do not wait for it.
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+import config
+import http_cache
+import snapshot
+
+
+class Graph:
+    """The graph at one revision: sorted node ids and edges as positions into them."""
+
+    def __init__(self, node_ids, sources, targets, types, revision):
+        self.revision = revision
+        self.ids = np.unique(np.asarray(node_ids, dtype=np.int64))
+        src = np.searchsorted(self.ids, sources)
+        tgt = np.searchsorted(self.ids, targets)
+        n = len(self.ids)
+        # Edges whose endpoint is not a node (should not happen) are dropped
+        known = (src < n) & (tgt < n)
+        known[known] &= (self.ids[src[known]] == sources[known]) & (self.ids[tgt[known]] == targets[known])
+        self.sources = src[known]
+        self.targets = tgt[known]
+        self.types = np.asarray(types, dtype=np.int64)[known]
+
+    @property
+    def node_count(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return len(self.sources)
+
+    def edges(self, types=None):
+        if types is None:
+            return self.sources, self.targets
+        keep = np.isin(self.types, list(types))
+        return self.sources[keep], self.targets[keep]
+
+    def matrix(self, types=None, undirected=False):
+        src, tgt = self.edges(types)
+        if undirected:
+            src, tgt = np.concatenate([src, tgt]), np.concatenate([tgt, src])
+        n = self.node_count
+        a = sparse.csr_matrix((np.ones(len(src)), (src, tgt)), shape=(n, n))
+        a.sum_duplicates()
+        a.data[:] = 1.0
+        return a
+
+    def position(self, node_id):
+        p = int(np.searchsorted(self.ids, node_id))
+        return p if p < len(self.ids) and self.ids[p] == node_id else None
+
+
+def _fetch_array(cur, sql, width):
+    chunks = []
+    cur.execute(sql)
+    while True:
+        rows = cur.fetchmany(100000)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.int64).reshape(-1, width))
+    return np.concatenate(chunks) if chunks else np.zeros((0, width), dtype=np.int64)
+
+
+def load(conn, revision):
+    snap = snapshot.current()
+    if (snap is not None and snap.versions.get(http_cache.REVISION_KEY, 0) == revision
+            and {"nodes", "relations"} <= set(snap.tables())
+            and snapshot.matches(snap, conn, http_cache.REVISION_KEY)):
+        return Graph(np.asarray(snap.array("nodes", "id")),
+                     *(np.asarray(snap.array("relations", c))
+                       for c in ("source_node_id", "target_node_id", "relation_type_id")),
+                     revision)
+    cur = conn.cursor()
+    nodes = _fetch_array(cur, "SELECT id FROM nodes", 1)
+    edges = _fetch_array(cur, "SELECT source_node_id, target_node_id, relation_type_id FROM relations", 3)
+    return Graph(nodes[:, 0], edges[:, 0], edges[:, 1], edges[:, 2], revision)
+
+
+# -- metrics ----------------------------------------------------------------
+
+def pagerank(graph, types=None, damping=None, tol=None, max_iter=None):
+    """Returns (scores summing to 1, iterations run)."""
+    damping = config.ANALYTICS_PAGERANK_DAMPING if damping is None else damping
+    tol = tol or config.ANALYTICS_PAGERANK_TOL
+    max_iter = max_iter or config.ANALYTICS_PAGERANK_MAX_ITER
+    n = graph.node_count
+    if n == 0:
+        return np.zeros(0), 0
+    a = graph.matrix(types)
+    out = np.asarray(a.sum(axis=1)).ravel()
+    dangling = out == 0
+    inv = np.divide(1.0, out, out=np.zeros(n), where=~dangling)
+    # Column-stochastic transition matrix, transposed for M @ r
+    m = (sparse.diags(inv) @ a).T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        new = damping * (m @ rank + rank[dangling].sum() / n) + (1.0 - damping) / n
+        error = np.abs(new - rank).sum()
+        rank = new
+        if error < n * tol:
+            break
+    return rank, iterations
+
+
+def degree(graph, types=None):
+    """Returns (in, out) edge counts per node."""
+    src, tgt = graph.edges(types)
+    n = graph.node_count
+    return np.bincount(tgt, minlength=n), np.bincount(src, minlength=n)
+
+
+def betweenness(graph, types=None, samples=None, directed=False, seed=0):
+    """Approximate normalized betweenness from a sample of BFS pivots; returns (scores, pivots used)."""
+    n = graph.node_count
+    samples = samples or config.ANALYTICS_BETWEENNESS_SAMPLES
+    k = min(samples, n)
+    scores = np.zeros(n)
+    if n < 3 or k == 0:
+        return scores, k
+    a = graph.matrix(types, undirected=not directed)
+    at = a.T.tocsr()
+    pivots = np.random.default_rng(seed).choice(n, size=k, replace=False)
+    batch = max(1, config.ANALYTICS_BETWEENNESS_BATCH)
+    for start in range(0, k, batch):
+        chunk = pivots[start:start + batch]
+        cols = np.arange(len(chunk))
+        dist = np.full((n, len(chunk)), -1, dtype=np.int32)
+        sigma = np.zeros((n, len(chunk)))
+        dist[chunk, cols] = 0
+        sigma[chunk, cols] = 1.0
+        frontier = sigma.copy()
+        level = 0
+        # Forward: each level's path counts are the sums over its predecessors
+        while True:
+            reached = at @ frontier
+            reached[dist >= 0] = 0.0
+            found = reached > 0
+            if not found.any():
+                break
+            level += 1
+            dist[found] = level
+            sigma[found] = reached[found]
+            frontier = reached
+        # Backward: accumulate dependencies from the deepest level up
+        delta = np.zeros_like(sigma)
+        safe_sigma = np.where(sigma > 0, sigma, 1.0)
+        for d in range(level, 0, -1):
+            x = np.where(dist == d, (1.0 + delta) / safe_sigma, 0.0)
+            parents = dist == d - 1
+            delta[parents] += (sigma * (a @ x))[parents]
+        delta[chunk, cols] = 0.0
+        scores += delta.sum(axis=1)
+    # Scale the sample up to all n sources, then normalize by the number of
+    # ordered pairs (undirected pairs were counted from both ends)
+    scores *= n / k
+    scores /= (n - 1) * (n - 2)
+    return scores, k
+
+
+class Components:
+    """Weakly connected components of the graph (restricted to some types)."""
+
+    def __init__(self, graph, types=None):
+        n = graph.node_count
+        if n:
+            self.count, self.labels = csgraph.connected_components(graph.matrix(types), directed=True,
+                                                                   connection="weak")
+        else:
+            self.count, self.labels = 0, np.zeros(0, dtype=np.int32)
+        self.ids = graph.ids
+        self.sizes = np.bincount(self.labels, minlength=self.count)
+        indeg, outdeg = degree(graph, types)
+        self.isolated = (indeg + outdeg) == 0
+        # Node positions grouped by component, in id order within each
+        self._members = np.argsort(self.labels, kind="stable")
+        self._starts = np.concatenate([[0], np.cumsum(self.sizes)])
+
+    @property
+    def isolated_count(self):
+        return int(self.isolated.sum())
+
+    @property
+    def largest(self):
+        return int(self.sizes.max()) if self.count else 0
+
+    def nodes(self, component, limit=None):
+        start = self._starts[component]
+        size = self.sizes[component]
+        return self.ids[self._members[start:start + min(size, limit or size)]].tolist()
+
+    def listing(self, limit, include_isolated=False):
+        """The limit largest components as {size, node_ids, truncated}."""
+        order = np.lexsort((np.arange(self.count), -self.sizes))
+        if not include_isolated:
+            # A single node without edges is its own component
+            order = order[(self.sizes[order] > 1) | ~self.isolated[self._members[self._starts[order]]]]
+        cap = config.ANALYTICS_COMPONENT_NODES
+        return [{"size": int(self.sizes[c]), "node_ids": self.nodes(c, cap), "truncated": bool(self.sizes[c] > cap)}
+                for c in order[:limit].tolist()]
+
+    def of_node(self, node_id):
+        p = int(np.searchsorted(self.ids, node_id))
+        if p == len(self.ids) or self.ids[p] != node_id:
+            return None
+        return {"id": node_id, "size": int(self.sizes[self.labels[p]]), "isolated": bool(self.isolated[p])}
+
+
+def components_by_type(graph):
+    """Per relation type: the nodes its edges touch and the components they form."""
+    result = []
+    for type_id in np.unique(graph.types).tolist():
+        src, tgt = graph.edges({type_id})
+        touched, positions = np.unique(np.concatenate([src, tgt]), return_inverse=True)
+        m = len(src)
+        a = sparse.csr_matrix((np.ones(m), (positions[:m], positions[m:])), shape=(len(touched),) * 2)
+        count, labels = csgraph.connected_components(a, directed=True, connection="weak")
+        result.append({
+            "type_id": type_id,
+            "edges": int(m),
+            "nodes": int(len(touched)),
+            "components": int(count),
+            "largest": int(np.bincount(labels).max()) if count else 0,
+        })
+    return result
+
+
+# -- cache ------------------------------------------------------------------
+
+_graph = None
+_results = OrderedDict()
+_lock = threading.Lock()  # _graph, _results and _running; never held while computing
+_load_lock = threading.Lock()  # one graph load at a time
+_running = {}  # (revision, key) -> Event set when that computation ends
+
+
+def _graph_for(conn, revision):
+    global _graph
+    with _lock:
+        graph = _graph
+    if graph is not None and graph.revision == revision:
+        return graph
+    with _load_lock:
+        with _lock:
+            graph = _graph
+        if graph is None or graph.revision != revision:
+            graph = load(conn, revision)
+            with _lock:
+                if _graph is None or _graph.revision < revision:
+                    _graph = graph
+                    _results.clear()
+    return graph
+
+
+def compute(conn, key, fn):
+    """fn(graph) for the current revision, cached under key.
+
+    Returns (value, graph, seconds or None when it came from the cache).
+    fn runs without the module lock, so cached reads never wait for it;
+    concurrent requests for the same key wait for one computation.
+    """
+    revision, _ = http_cache.current(conn)
+    graph = _graph_for(conn, revision)
+    while True:
+        with _lock:
+            if _graph is graph and key in _results:
+                _results.move_to_end(key)
+                return _results[key], graph, None
+            done = _running.get((revision, key))
+            if done is None:
+                done = _running[(revision, key)] = threading.Event()
+                break
+        done.wait()
+    try:
+        started = time.perf_counter()
+        value = fn(graph)
+        seconds = time.perf_counter() - started
+        with _lock:
+            if _graph is graph:
+                _results[key] = value
+                while len(_results) > config.ANALYTICS_CACHE_SIZE:
+                    _results.popitem(last=False)
+        return value, graph, seconds
+    finally:
+        with _lock:
+            del _running[(revision, key)]
+        done.set()
+
+
+def top(scores, limit):
+    """Positions of the limit highest scores, best first (ties by position)."""
+    limit = min(limit, len(scores))
+    if limit == 0:
+        return np.zeros(0, dtype=np.int64)
+    part = np.argpartition(-scores, limit - 1)[:limit]
+    return part[np.lexsort((part, -scores[part]))]
+
+
+def rank_of(scores, p):
+    return int((scores > scores[p]).sum()) + 1
+
+
+def ranks(scores, positions):
+    """rank_of for each of top()'s positions, from their order alone: equal scores share a rank."""
+    result = []
+    for i, p in enumerate(positions):
+        result.append(result[-1] if i and scores[p] == scores[positions[i - 1]] else i + 1)
+    return result
@@ -1,21 +1,51 @@
-from flask import Flask, jsonify, request, g
+from flask import Flask, Response, jsonify, request, g, send_file, stream_with_context
 from dotenv import load_dotenv
 import sqlite3
 import openai
 import json
-import spacy
+import os
+import tempfile
+import time
 
-from nlp_utils import parse_node_label
-
-nlp = spacy.load("en_core_web_sm")
+from nlp_utils import parse_node_labels, parse_summaries
+from validation import typed_value, validate_attribute_value
 
 load_dotenv()
 import config
+import database
+import migrations
+import pagination
+import graph_index
+import closure
+import bulk_import
+import parse_cache
+import nlp_models
+import summary_jobs
+import layout
+import search
+import http_cache
+import changes
+import attribute_query
+import batch
+import metrics
+import snapshot
+import analytics
+import similarity
+import extraction
+import serialization
 
 app = Flask(__name__)
+metrics.init_app(app)
+serialization.init_app(app)
 openai.api_key = config.OPENAI_API_KEY  
 DB_PATH=config.DB_PATH
 
+if config.DB_AUTO_MIGRATE:
+    migrations.migrate(config.DB_PATH)
+
+if config.NLP_PRELOAD:
+    nlp_models.preload()
+
 
 # @app.route("/api/node/create", methods=["POST"])
 # def create_node():
@@ -41,19 +71,23 @@ DB_PATH=config.DB_PATH
 
 
 @app.route("/api/nodes", methods=["GET"])
+@http_cache.cached
 def list_nodes():
-    conn = sqlite3.connect(config.DB_PATH)
+    if pagination.is_paged(request.args):
+        return pagination.respond(get_db(), pagination.NODES, request.args)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("SELECT id, title, summary, is_instance FROM nodes")
     rows = cur.fetchall()
-    conn.close()
-    return jsonify([{"id": r[0], "label": r[1], "summary": r[2], "is_instance": bool(r[3])} for r in rows])
+    return serialization.rows_response(("id", "label", "summary", "is_instance"), rows,
+                                       converters={"is_instance": bool})
 
 
 
 @app.route("/api/node/<int:node_id>/neighbors")
+@http_cache.cached
 def neighbors(node_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
 
     cur.execute("SELECT id, title, summary, is_instance FROM nodes WHERE id=?", (node_id,))
@@ -73,13 +107,172 @@ def neighbors(node_id):
         nodes.append({"id": nid, "label": title, "summary": summary, "is_instance": bool(is_instance)})
         links.append({"source": source, "target": target, "label": relname})
 
-    conn.close()
     return jsonify({"nodes": nodes, "links": links})
 
 
+@app.route("/api/node/<int:node_id>/neighborhood")
+@http_cache.cached
+def neighborhood(node_id):
+    direction = request.args.get("direction", "both")
+    if direction not in graph_index.DIRECTIONS:
+        return jsonify({"error": f"direction must be one of: {', '.join(graph_index.DIRECTIONS)}"}), 400
+    try:
+        depth = int(request.args.get("depth", 1))
+        max_edges = int(request.args.get("limit", config.GRAPH_INDEX_MAX_EDGES))
+    except ValueError:
+        return jsonify({"error": "depth and limit must be integers"}), 400
+    depth = max(1, min(depth, config.GRAPH_INDEX_MAX_DEPTH))
+    max_edges = max(1, min(max_edges, config.GRAPH_INDEX_MAX_EDGES))
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        types = graph_index.resolve_types(cur, request.args.get("types"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    index = graph_index.get_index(conn)
+    node_ids, edges, truncated = index.neighborhood(node_id, depth, direction, types, max_edges)
+    type_names = graph_index.relation_type_names(cur, {t for _, _, t in edges.values()})
+
+    nodes = graph_index.fetch_nodes(cur, node_ids)
+    links = [
+        {"id": eid, "source": source, "target": target, "label": type_names.get(type_id)}
+        for eid, (source, target, type_id) in edges.items()
+    ]
+    return jsonify({"nodes": nodes, "links": links, "truncated": truncated})
+
+
+def _relation_type_arg(cur):
+    # ?type= accepts an id or a name; defaults to "is_a"
+    value = request.args.get("type", "").strip()
+    if value.isdigit():
+        return int(value)
+    return closure.find_type(cur, (value,) if value else ("is_a", "is a"))
+
+
+@app.route("/api/node/<int:node_id>/ancestors")
+def node_ancestors(node_id):
+    return _reachable_nodes(node_id, reverse=False)
+
+
+@app.route("/api/node/<int:node_id>/descendants")
+def node_descendants(node_id):
+    return _reachable_nodes(node_id, reverse=True)
+
+
+def _reachable_nodes(node_id, reverse):
+    conn = get_db()
+    cur = conn.cursor()
+    type_id = _relation_type_arg(cur)
+    if type_id is None:
+        return jsonify({"error": "Unknown relation type"}), 404
+    reached = closure.reachable_from(cur, node_id, type_id, reverse=reverse)
+    depths = dict(reached)
+    nodes = graph_index.fetch_nodes(cur, [n for n, _ in reached])
+    for node in nodes:
+        node["depth"] = depths[node["id"]]
+    return jsonify({"node_id": node_id, "relation_type_id": type_id, "nodes": nodes})
+
+
+@app.route("/api/reachable")
+def reachable():
+    try:
+        source = int(request.args["from"])
+        target = int(request.args["to"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "'from' and 'to' node ids are required"}), 400
+    conn = get_db()
+    cur = conn.cursor()
+    type_id = _relation_type_arg(cur)
+    if type_id is None:
+        return jsonify({"error": "Unknown relation type"}), 404
+    depth = closure.path_depth(cur, source, target, type_id)
+    return jsonify({"from": source, "to": target, "relation_type_id": type_id,
+                    "reachable": depth is not None, "depth": depth})
+
+
+@app.route("/api/path")
+@http_cache.cached
+def find_path():
+    # How is X related to Y: ?from=&to= [&k=3&max_depth=6&direction=both&types=is_a,part_of]
+    try:
+        source = int(request.args["from"])
+        target = int(request.args["to"])
+        k = int(request.args.get("k", 1))
+        max_depth = int(request.args.get("max_depth", config.PATH_MAX_DEPTH))
+    except (KeyError, ValueError):
+        return jsonify({"error": "'from' and 'to' node ids are required; 'k' and 'max_depth' must be integers"}), 400
+    direction = request.args.get("direction", "both")
+    if direction not in graph_index.DIRECTIONS:
+        return jsonify({"error": f"direction must be one of: {', '.join(graph_index.DIRECTIONS)}"}), 400
+    k = max(1, min(k, config.PATH_MAX_K))
+    max_depth = max(1, min(max_depth, config.PATH_MAX_DEPTH))
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        types = graph_index.resolve_types(cur, request.args.get("types"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    nodes = {n["id"]: n for n in graph_index.fetch_nodes(cur, {source, target})}
+    if len(nodes) < len({source, target}):
+        return jsonify({"error": "Node not found"}), 404
+
+    index = graph_index.get_index(conn)
+    paths, truncated = index.shortest_paths(source, target, k, max_depth, direction, types,
+                                            config.PATH_MAX_VISITS)
+    # Edges walked against their stored direction read with the inverse name
+    type_ids = list({typ for _, steps in paths for _, _, typ in steps})
+    names = {}
+    if type_ids:
+        cur.execute(f"SELECT id, name, inverse_name FROM relation_types WHERE id IN ({','.join('?' * len(type_ids))})",
+                    type_ids)
+        names = {r[0]: (r[1], r[2] or r[1]) for r in cur.fetchall()}
+    result_paths = []
+    links = {}
+    for node_ids, steps in paths:
+        path_links = []
+        for (eid, reverse, typ), u, v in zip(steps, node_ids, node_ids[1:]):
+            name, inverse = names.get(typ, (None, None))
+            link = {"id": eid, "source": u, "target": v, "label": inverse if reverse else name, "reversed": reverse}
+            path_links.append(link)
+            links[(eid, reverse)] = link
+        result_paths.append({"length": len(steps), "node_ids": node_ids, "links": path_links})
+    missing = {n for p in paths for n in p[0]} - nodes.keys()
+    nodes.update({n["id"]: n for n in graph_index.fetch_nodes(cur, missing)})
+    path_nodes = list(dict.fromkeys(n for p in paths for n in p[0]))
+    return jsonify({
+        "from": source, "to": target, "found": bool(paths), "truncated": truncated,
+        "nodes": [nodes[n] for n in path_nodes if n in nodes],
+        "links": list(links.values()),
+        "paths": result_paths,
+    })
+
+@app.route("/api/node/<int:node_id>/similar")
+@http_cache.cached
+def similar_nodes(node_id):
+    # Related concepts: ?k=10&field=content (title + summary) | title
+    try:
+        k = int(request.args.get("k", config.SIMILARITY_DEFAULT_K))
+    except ValueError:
+        return jsonify({"error": "'k' must be an integer"}), 400
+    field = request.args.get("field", "content")
+    if field not in similarity.FIELDS:
+        return jsonify({"error": f"field must be one of: {', '.join(similarity.FIELDS)}"}), 400
+    conn = get_db()
+    found = similarity.similar(conn, node_id, field, max(1, min(k, config.SIMILARITY_MAX_K)))
+    if found is None:
+        return jsonify({"error": "Node not found"}), 404
+    scores = dict(found)
+    nodes = graph_index.fetch_nodes(conn.cursor(), scores)
+    return jsonify({"id": node_id, "field": field,
+                    "nodes": [dict(n, score=scores[n["id"]]) for n in nodes]})
+
+
 @app.route("/api/node/<int:node_id>", methods=["DELETE"])
 def delete_node(node_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
 
     # Check for related links
@@ -87,15 +280,14 @@ def delete_node(node_id):
     relation_count = cur.fetchone()[0]
 
     if relation_count > 0:
-        conn.close()
         return jsonify({
             "success": False,
             "message": f"Node has {relation_count} relation(s). Cannot delete."
         }), 409
 
     cur.execute("DELETE FROM nodes WHERE id=?", (node_id,))
+    extraction.node_deleted(conn, node_id)
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 
@@ -106,28 +298,21 @@ def update_node():
     title = data.get("title", "")
     summary = data.get("summary", "")
 
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
+    cur.execute("SELECT summary FROM nodes WHERE id=?", (node_id,))
+    row = cur.fetchone()
     cur.execute("UPDATE nodes SET title=?, summary=? WHERE id=?", (title, summary, node_id))
+    if row and row[0] != summary:
+        parse_cache.cache.invalidate(row[0], conn)
     conn.commit()
-    conn.close()
 
     return jsonify({"success": True})
 
 
 def generate_summary(title):
-    from openai import OpenAI
-
-    client = OpenAI(api_key=config.OPENAI_API_KEY)
-
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "user", "content": f"Give a one-sentence explanation of '{title}' suitable for students."}
-        ]
-    )
-
-    return response.choices[0].message.content.strip()
+    # Cached, with a timeout and retries; prefer /api/summaries/jobs for many nodes
+    return summary_jobs.service.summarize(title)
 
 @app.route("/api/relation-type", methods=["POST"])
 def create_relation_type():
@@ -140,22 +325,22 @@ def create_relation_type():
     if not name:
         return jsonify({"error": "Relation name is required"}), 400
 
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
 
     # Check for existing relation type (case-insensitive)
     cur.execute("SELECT id FROM relation_types WHERE LOWER(name)=?", (name.lower(),))
     if cur.fetchone():
-        conn.close()
         return jsonify({"error": "Relation type already exists"}), 409
 
     cur.execute("""
     INSERT INTO relation_types (name, inverse_name, is_symmetric, is_transitive)
     VALUES (?, ?, ?, ?)
     """, (name, inverse_name, is_symmetric, is_transitive))
+    # A new type may complete an inverse pair with an existing one
+    closure.rebuild_types(conn, closure.family(cur, cur.lastrowid).type_ids)
 
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 @app.route("/api/relation-type/<int:type_id>", methods=["PATCH"])
@@ -166,8 +351,9 @@ def update_relation_type(type_id):
     is_transitive = int(data.get("transitive", False))
     inverse_name = data.get("inverse_name", "").strip()
 
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
+    before = closure.family(cur, type_id)
 
     cur.execute("""
     UPDATE relation_types
@@ -175,19 +361,20 @@ def update_relation_type(type_id):
     WHERE id=?
     """, (name, inverse_name, is_symmetric, is_transitive, type_id))
 
-    
+    after = closure.family(cur, type_id)
+    if before is not None:
+        closure.rebuild_types(conn, before.type_ids | after.type_ids)
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 
 @app.route("/api/relation-types", methods=["GET"])
+@http_cache.cached
 def list_relation_types():
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("SELECT id, name, inverse_name, is_symmetric, is_transitive FROM relation_types")
     rows = cur.fetchall()
-    conn.close()
     return jsonify([
     {
         "id": r[0], "name": r[1], "inverse_name": r[2],
@@ -197,12 +384,6 @@ def list_relation_types():
 ])
 
 
-
-def normalize_relation_name(name):
-    stopwords = {"is", "an", "a", "the"}
-    tokens = [w for w in name.lower().split() if w not in stopwords]
-    return " ".join(tokens)
-
 @app.route('/api/node/create', methods=['POST'])
 def create_node():
     data = request.get_json()
@@ -210,7 +391,7 @@ def create_node():
     if not title:
         return jsonify({'error': 'Title required'}), 400
 
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
 
     # Check if node already exists
@@ -218,13 +399,20 @@ def create_node():
     row = cur.fetchone()
     if row:
         node_id = row[0]
+        duplicates = []
     else:
+        # Near misses ("cells" for "Cell"): created anyway, reported for review
+        duplicates = similarity.duplicates(conn, title)
         cur.execute("INSERT INTO nodes (title) VALUES (?)", (title,))
         node_id = cur.lastrowid
         conn.commit()
 
-    conn.close()
-    return jsonify({"id": node_id, "title": title})
+    result = {"id": node_id, "title": title}
+    if duplicates:
+        labels = {n["id"]: n["label"] for n in graph_index.fetch_nodes(cur, [d for d, _ in duplicates])}
+        result["possible_duplicates"] = [{"id": d, "label": labels.get(d), "score": score}
+                                         for d, score in duplicates if d in labels]
+    return jsonify(result)
 
 @app.route("/api/relation/create", methods=["POST"])
 def create_relation():
@@ -233,7 +421,7 @@ def create_relation():
     target = data["target"]
     relation_type_id = data["relation_id"]
 
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
 
     # Check for duplicate
@@ -243,33 +431,50 @@ def create_relation():
     """, (source, target, relation_type_id))
     row = cur.fetchone()
     if row:
-        conn.close()
         return jsonify({"message": "Relation already exists", "id": row[0]})
 
-    # Insert new relation
+    rel_id = _insert_relation(conn, source, target, relation_type_id)
+    return jsonify({"success": True, "id": rel_id})
+
+
+def _insert_relation(conn, source, target, relation_type_id, before_commit=None):
+    # Insert new relation, with the closure and the in-memory index
+    cur = conn.cursor()
     cur.execute("""
         INSERT INTO relations (source_node_id, target_node_id, relation_type_id)
         VALUES (?, ?, ?)
     """, (source, target, relation_type_id))
     rel_id = cur.lastrowid
+    closure.edge_added(conn, source, target, relation_type_id)
+    version = database.bump_version(conn, graph_index.VERSION_KEY)
+    if before_commit:
+        before_commit(rel_id)
     conn.commit()
-    conn.close()
-
-    return jsonify({"success": True, "id": rel_id})
+    graph_index.edge_added(rel_id, source, target, relation_type_id, version)
+    return rel_id
 
 
 @app.route("/api/relation/<int:relation_id>", methods=["DELETE"])
 def delete_relation(relation_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
+    cur.execute("SELECT source_node_id, target_node_id, relation_type_id FROM relations WHERE id=?", (relation_id,))
+    row = cur.fetchone()
     cur.execute("DELETE FROM relations WHERE id=?", (relation_id,))
+    if row:
+        closure.edge_removed(conn, *row)
+    version = database.bump_version(conn, graph_index.VERSION_KEY) if row else None
     conn.commit()
-    conn.close()
+    if row:
+        graph_index.edge_removed(relation_id, *row, version)
     return jsonify({"success": True})
 
 @app.route("/api/relations", methods=["GET"])
+@http_cache.cached
 def list_relations():
-    conn = sqlite3.connect(config.DB_PATH)
+    if pagination.is_paged(request.args):
+        return pagination.respond(get_db(), pagination.RELATIONS, request.args)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("""
         SELECT r.id, s.title, rt.name, t.title, r.modality, r.subject_quantifier, r.object_quantifier
@@ -279,19 +484,16 @@ def list_relations():
         JOIN relation_types rt ON r.relation_type_id = rt.id
     """)
     rows = cur.fetchall()
-    conn.close()
-    return jsonify([
-        {"id": r[0], "source_label": r[1], "label": r[2], "target_label": r[3], "modality": r[4], "subject_quantifier": r[5], "object_quantifier": r[6]}
-        for r in rows
-    ])
+    return serialization.rows_response(("id", "source_label", "label", "target_label", "modality",
+                                        "subject_quantifier", "object_quantifier"), rows)
 
 @app.route("/api/attributes", methods=["GET"])
+@http_cache.cached
 def list_attributes():
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("SELECT id, name, description, data_type, allowed_values, unit, applicable_nodes FROM attributes")
     rows = cur.fetchall()
-    conn.close()
     return jsonify([
         {
             "id": r[0],
@@ -318,7 +520,7 @@ def create_attribute():
     # Ensure applicable_nodes is a list, then store as JSON string
     if not isinstance(applicable_nodes, list):
         applicable_nodes = []
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     try:
         cur.execute(
@@ -328,9 +530,7 @@ def create_attribute():
         conn.commit()
         attr_id = cur.lastrowid
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({"error": "Attribute with this name already exists."}), 409
-    conn.close()
     return jsonify({
         "id": attr_id,
         "name": name,
@@ -353,28 +553,28 @@ def update_attribute(attr_id):
     # Ensure applicable_nodes is a list, then store as JSON string
     if not isinstance(applicable_nodes, list):
         applicable_nodes = []
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute(
         "UPDATE attributes SET name=?, description=?, data_type=?, allowed_values=?, unit=?, applicable_nodes=? WHERE id=?",
         (name, description, data_type, allowed_values, unit, json.dumps(applicable_nodes), attr_id)
     )
+    # Typed copies of existing values follow the new data_type
+    attribute_query.retype(conn, attr_id)
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 @app.route("/api/attribute/<int:attr_id>", methods=["DELETE"])
 def delete_attribute(attr_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("DELETE FROM attributes WHERE id=?", (attr_id,))
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 @app.route("/api/node/<int:node_id>/attributes", methods=["GET"])
 def get_node_attributes(node_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute('''
         SELECT na.id, na.attribute_id, a.name, a.description, a.data_type, a.allowed_values, a.unit, na.value, na.quantifier
@@ -383,7 +583,6 @@ def get_node_attributes(node_id):
         WHERE na.node_id = ?
     ''', (node_id,))
     rows = cur.fetchall()
-    conn.close()
     return jsonify([
         {
             "id": r[0],
@@ -398,33 +597,6 @@ def get_node_attributes(node_id):
         } for r in rows
     ])
 
-def validate_attribute_value(data_type, value, allowed_values=None):
-    if data_type == "integer":
-        try:
-            int(value)
-            return True
-        except Exception:
-            return False
-    elif data_type == "float":
-        try:
-            float(value)
-            return True
-        except Exception:
-            return False
-    elif data_type == "boolean":
-        return str(value).lower() in ("true", "false", "1", "0")
-    elif data_type == "date":
-        import re
-        return bool(re.match(r"^\d{4}-\d{2}-\d{2}$", str(value)))
-    elif data_type == "array":
-        return isinstance(value, str) and len(value.strip()) > 0
-    elif data_type == "string":
-        return isinstance(value, str)
-    if allowed_values:
-        allowed = [v.strip() for v in allowed_values.split(";") if v.strip()]
-        return value in allowed
-    return True
-
 @app.route("/api/node/<int:node_id>/attribute", methods=["POST"])
 def add_node_attribute(node_id):
     data = request.get_json()
@@ -435,26 +607,23 @@ def add_node_attribute(node_id):
         return jsonify({"error": "attribute_id is required."}), 400
 
     # Fetch attribute metadata for validation
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("SELECT data_type, allowed_values FROM attributes WHERE id=?", (attribute_id,))
     attr_row = cur.fetchone()
     if not attr_row:
-        conn.close()
         return jsonify({"error": "Attribute not found."}), 404
     data_type, allowed_values = attr_row
 
     if not validate_attribute_value(data_type, value, allowed_values):
-        conn.close()
         return jsonify({"error": f"Invalid value for data_type '{data_type}'."}), 400
 
     cur.execute(
-        "INSERT INTO node_attributes (node_id, attribute_id, value, quantifier) VALUES (?, ?, ?, ?)",
-        (node_id, attribute_id, value, quantifier)
+        "INSERT INTO node_attributes (node_id, attribute_id, value, quantifier, value_num) VALUES (?, ?, ?, ?, ?)",
+        (node_id, attribute_id, value, quantifier, typed_value(data_type, value))
     )
     conn.commit()
     na_id = cur.lastrowid
-    conn.close()
     return jsonify({"id": na_id, "node_id": node_id, "attribute_id": attribute_id, "value": value, "quantifier": quantifier})
 
 @app.route("/api/node_attribute/<int:na_id>", methods=["PATCH"])
@@ -462,48 +631,47 @@ def update_node_attribute(na_id):
     data = request.get_json()
     value = data.get("value", "")
     quantifier = data.get("quantifier", None)
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     # Fetch attribute_id and data_type for validation
     cur.execute("SELECT attribute_id FROM node_attributes WHERE id=?", (na_id,))
     row = cur.fetchone()
     if not row:
-        conn.close()
         return jsonify({"error": "Node attribute not found."}), 404
     attribute_id = row[0]
     cur.execute("SELECT data_type, allowed_values FROM attributes WHERE id=?", (attribute_id,))
     attr_row = cur.fetchone()
     if not attr_row:
-        conn.close()
         return jsonify({"error": "Attribute not found."}), 404
     data_type, allowed_values = attr_row
 
     if not validate_attribute_value(data_type, value, allowed_values):
-        conn.close()
         return jsonify({"error": f"Invalid value for data_type '{data_type}'."}), 400
 
+    value_num = typed_value(data_type, value)
     if quantifier is not None:
-        cur.execute("UPDATE node_attributes SET value=?, quantifier=? WHERE id=?", (value, quantifier, na_id))
+        cur.execute("UPDATE node_attributes SET value=?, value_num=?, quantifier=? WHERE id=?",
+                    (value, value_num, quantifier, na_id))
     else:
-        cur.execute("UPDATE node_attributes SET value=? WHERE id=?", (value, na_id))
+        cur.execute("UPDATE node_attributes SET value=?, value_num=? WHERE id=?", (value, value_num, na_id))
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 @app.route("/api/node_attribute/<int:na_id>", methods=["DELETE"])
 def delete_node_attribute(na_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("DELETE FROM node_attributes WHERE id=?", (na_id,))
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 # Handles GET /api/nodes/<node_id>/possible-attributes
 @app.route('/api/nodes/<int:node_id>/possible-attributes', methods=['GET'])
 def get_possible_attributes(node_id):
     db = get_db()
-    direct = db.execute(
+    cur = db.cursor()
+    cur.row_factory = sqlite3.Row
+    direct = cur.execute(
         '''
         SELECT a.* FROM attributes a
         JOIN possible_node_attributes pna ON a.id = pna.attribute_id
@@ -512,18 +680,20 @@ def get_possible_attributes(node_id):
         (node_id,)
     ).fetchall()
 
-    # Fix: inherited attributes should come from parent (target_node_id) of "is_a" relation
-    inherited = db.execute(
-        '''
-        SELECT DISTINCT a.* FROM attributes a
-        JOIN possible_node_attributes pna ON a.id = pna.attribute_id
-        JOIN relations r ON r.target_node_id = pna.node_id
-        WHERE r.source_node_id = ? AND r.relation_type_id = (
-            SELECT id FROM relation_types WHERE name = 'is_a' OR name = 'is a' LIMIT 1
-        )
-        ''',
-        (node_id,)
-    ).fetchall()
+    # Inherited attributes come from every ancestor along "is_a", however deep
+    plain = db.cursor()
+    is_a = closure.find_type(plain, ("is_a", "is a"))
+    ancestors = [n for n, _ in closure.reachable_from(plain, node_id, is_a)] if is_a else []
+    inherited = []
+    if ancestors:
+        inherited = cur.execute(
+            f'''
+            SELECT DISTINCT a.* FROM attributes a
+            JOIN possible_node_attributes pna ON a.id = pna.attribute_id
+            WHERE pna.node_id IN ({",".join("?" * len(ancestors))})
+            ''',
+            ancestors
+        ).fetchall()
 
     return jsonify({
         'direct': [dict(row) for row in direct],
@@ -555,189 +725,523 @@ def delete_possible_attribute(node_id, attribute_id):
     # ...existing code...
     return jsonify({'status': 'deleted', 'node_id': node_id, 'attribute_id': attribute_id})
 
+@app.route("/api/import/<kind>", methods=["POST"])
+def import_bulk(kind):
+    # Body is the raw CSV/NDJSON, or a multipart upload in the "file" field
+    fmt = request.args.get("format", "csv")
+    upload = request.files.get("file")
+    stream = bulk_import.text_stream(upload.stream if upload else request.stream)
+    try:
+        report = bulk_import.run_import(
+            get_db(), kind, stream, fmt,
+            create_missing=request.args.get("create_missing") == "1",
+            defer_indexes={"1": True, "0": False}.get(request.args.get("defer_indexes")),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report)
+
 @app.route("/api/node/<int:node_id>", methods=["GET"])
+@http_cache.cached
 def get_node(node_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     cur.execute("SELECT id, title, summary, is_instance FROM nodes WHERE id=?", (node_id,))
     row = cur.fetchone()
-    conn.close()
     if not row:
         return jsonify({"error": "Node not found"}), 404
     return jsonify({"id": row[0], "label": row[1], "summary": row[2], "is_instance": bool(row[3])})
 
 def get_db():
+    # Borrow a pooled connection for the lifetime of the request
     if 'db' not in g:
-        g.db = sqlite3.connect(config.DB_PATH)
-        g.db.row_factory = sqlite3.Row
+        g.db = database.get_pool().acquire()
     return g.db
 
 @app.teardown_appcontext
 def close_db(exception):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        database.get_pool().release(db)
+
+@app.route("/api/db/stats", methods=["GET"])
+def db_stats():
+    return jsonify(database.get_pool().stats())
+
+@app.route("/api/cache/stats", methods=["GET"])
+def http_cache_stats():
+    return jsonify(http_cache.cache.stats())
+
+@app.route("/api/snapshot", methods=["GET"])
+def export_snapshot():
+    # Uncompressed tar of a fresh snapshot directory; unpack and use with
+    # `python snapshot.py restore` or KNOWLEDGE_SNAPSHOT_PATH
+    out = tempfile.TemporaryFile()
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = snapshot.export(config.DB_PATH, os.path.join(tmp, "snapshot"))
+        snapshot.write_tar(os.path.join(tmp, "snapshot"), out)
+    out.seek(0)
+    revision = manifest["versions"].get(http_cache.REVISION_KEY, 0)
+    return send_file(out, mimetype="application/x-tar", as_attachment=True,
+                     download_name=f"graph-snapshot-{revision}.tar")
+
+@app.route("/api/db/slow-queries", methods=["GET"])
+def slow_queries():
+    # Newest first, with their EXPLAIN QUERY PLAN
+    return jsonify(metrics.slow_queries())
+
+metrics.add_collector("knowledge_db_pool", lambda: database.get_pool().stats())
+metrics.add_collector("knowledge_http_cache", http_cache.cache.stats)
+metrics.add_collector("knowledge_parse_cache", lambda: parse_cache.cache.stats())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/api/relation-type/<int:type_id>", methods=["DELETE"])
 def delete_relation_type(type_id):
-    conn = sqlite3.connect(config.DB_PATH)
+    conn = get_db()
     cur = conn.cursor()
     # Check if any relations use this relation type
     cur.execute("SELECT COUNT(*) FROM relations WHERE relation_type_id=?", (type_id,))
     count = cur.fetchone()[0]
     if count > 0:
-        conn.close()
         return jsonify({"success": False, "message": "Cannot delete: relation type is in use."}), 409
+    fam = closure.family(cur, type_id)
     cur.execute("DELETE FROM relation_types WHERE id=?", (type_id,))
+    if fam is not None:
+        # Its inverse partner, if any, loses the pairing
+        closure.rebuild_types(conn, fam.type_ids)
     conn.commit()
-    conn.close()
     return jsonify({"success": True})
 
 
 # NLP Support functions
+# Parsing runs in the nlp_pool worker processes behind parse_cache; see
+# nlp_utils for the parsers themselves.
 
 
-def parse_summary_text(text):
-    doc = nlp(text)
-    relations = []
-    attributes = []
-    debug_tokens = []
-
-    for sent in doc.sents:
-        for token in sent:
-            # Save all tokens for inspection
-            debug_tokens.append({
-                "text": token.text,
-                "lemma": token.lemma_,
-                "pos": token.pos_,
-                "tag": token.tag_,
-                "dep": token.dep_,
-                "head": token.head.text
-            })
-
-            # RELATIONS: subject-verb-object
-            if token.dep_ == "ROOT" and token.pos_ == "VERB":
-                subj = [w for w in token.lefts if w.dep_ in ("nsubj", "nsubjpass")]
-                obj = [w for w in token.rights if w.dep_ in ("dobj", "attr", "prep", "pobj", "xcomp", "acomp")]
-                for s in subj:
-                    for o in obj:
-                        relations.append({
-                            "subject": s.text,
-                            "predicate": token.lemma_,
-                            "object": o.text
-                        })
-
-            # RELATIONS: copula ("X is a Y")
-            if token.dep_ == "attr" and token.head.pos_ == "AUX":
-                subj = [w for w in token.head.lefts if w.dep_ == "nsubj"]
-                if subj:
-                    relations.append({
-                        "subject": subj[0].text,
-                        "predicate": token.head.lemma_,
-                        "object": token.text
-                    })
-
-            # RELATIONS: relative clauses ("who developed...")
-            if token.dep_ == "relcl" and token.head.pos_ in ("NOUN", "PROPN"):
-                subj = token.head.text
-                obj = [w for w in token.rights if w.dep_ in ("dobj", "pobj", "xcomp")]
-                for o in obj:
-                    relations.append({
-                        "subject": subj,
-                        "predicate": token.lemma_,
-                        "object": o.text
-                    })
-
-            # ATTRIBUTES: adjective modifiers or compound descriptors
-            if token.pos_ == "NOUN":
-                for child in token.children:
-                    if child.dep_ in ("amod", "compound"):
-                        attributes.append({
-                            "entity": token.text,
-                            "attribute": child.text
-                        })
-
-    return {
-        "common_nouns": list({t.text for t in doc if t.pos_ == "NOUN" and t.ent_type_ == ""}),
-        "proper_nouns": list({t.text for t in doc if t.pos_ == "PROPN"}),
-        "relations": relations,
-        "attributes": attributes,
-        "prepositions": [t.text for t in doc if t.pos_ == "ADP"],
-        "logical_connectives": [t.text for t in doc if t.pos_ == "CCONJ"],
-        "debug_tokens": debug_tokens,  # for inspection
-        "highlighted_summary": highlight_text(doc, relations, attributes)
-    }
+@app.route("/api/nlp/parse-summary", methods=["POST"])
+def parse_summary():
+    data = request.get_json()
+    text = data.get("text", "").strip()
+    if not text:
+        return jsonify({"error": "No summary text provided."}), 400
 
+    result = parse_cache.parse("summary", parse_summaries, [text])[0]
+    return jsonify(result)
 
-from markupsafe import escape
+@app.route('/api/nlp/parse-node-label', methods=['POST'])
+def api_parse_node_label():
+    data = request.get_json()
+    text = data.get('text', '')
+    result = parse_cache.parse("label", parse_node_labels, [text])[0]
+    return jsonify(result)
 
-def highlight_text(doc, relations, attributes):
-    relation_verbs = {r["predicate"] for r in relations}
-    attribute_words = {a["attribute"].lower() for a in attributes}
 
-    noun_chunks = list(doc.noun_chunks)
-    chunk_starts = {chunk.start for chunk in noun_chunks}
-    highlighted = []
-    i = 0
+def _batch_texts():
+    data = request.get_json(silent=True) or {}
+    texts = data.get("texts")
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return None, (jsonify({"error": "'texts' must be a list of strings."}), 400)
+    if len(texts) > config.NLP_MAX_BATCH:
+        return None, (jsonify({"error": f"At most {config.NLP_MAX_BATCH} texts per batch."}), 413)
+    return texts, None
+
+
+@app.route("/api/nlp/parse-summary/batch", methods=["POST"])
+def parse_summary_batch():
+    texts, error = _batch_texts()
+    if error:
+        return error
+    stripped = [t.strip() for t in texts]
+    parsed = iter(parse_cache.parse("summary", parse_summaries, [t for t in stripped if t]))
+    results = [next(parsed) if t else {"error": "No summary text provided."} for t in stripped]
+    return jsonify({"results": results})
+
+
+@app.route("/api/nlp/parse-node-label/batch", methods=["POST"])
+def parse_node_label_batch():
+    texts, error = _batch_texts()
+    if error:
+        return error
+    return jsonify({"results": parse_cache.parse("label", parse_node_labels, texts)})
+
+
+@app.route("/api/nlp/models", methods=["GET"])
+def nlp_model_stats():
+    # Models loaded in this web process (the NLP pool workers load their own)
+    return jsonify(nlp_models.stats())
+
+
+@app.route("/api/nlp/cache/stats", methods=["GET"])
+def nlp_cache_stats():
+    return jsonify(parse_cache.cache.stats())
+
+
+@app.route("/api/summaries/jobs", methods=["POST"])
+def create_summary_job():
+    # {"node_ids": [...]} or {"missing": true} for every node without a summary
+    data = request.get_json(silent=True) or {}
+    conn = get_db()
+    node_ids = data.get("node_ids")
+    if node_ids is None and data.get("missing"):
+        node_ids = [r[0] for r in conn.execute(
+            "SELECT id FROM nodes WHERE summary IS NULL OR TRIM(summary) = '' ORDER BY id")]
+    if not isinstance(node_ids, list) or not all(isinstance(n, int) for n in node_ids):
+        return jsonify({"error": "'node_ids' must be a list of node ids."}), 400
+    if len(node_ids) > config.SUMMARY_MAX_JOB:
+        return jsonify({"error": f"At most {config.SUMMARY_MAX_JOB} nodes per job."}), 413
+    job_id = summary_jobs.service.submit(conn, node_ids, overwrite=bool(data.get("overwrite")))
+    return jsonify({"job_id": job_id, "total": len(set(node_ids))}), 202
+
+
+@app.route("/api/summaries/jobs/<int:job_id>", methods=["GET"])
+def get_summary_job(job_id):
+    job = summary_jobs.service.job(get_db(), job_id, items=request.args.get("items") == "1")
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+
+@app.route("/api/extraction/runs", methods=["POST"])
+def create_extraction_run():
+    # {"full": true} re-extracts every summary, not only those changed since the last run
+    data = request.get_json(silent=True) or {}
+    run_id, running = extraction.service.submit(get_db(), full=bool(data.get("full")))
+    if run_id is None:
+        return jsonify({"error": "A run is already in progress.", "run_id": running}), 409
+    return jsonify({"run_id": run_id}), 202
+
+
+@app.route("/api/extraction/runs/<int:run_id>", methods=["GET"])
+def get_extraction_run(run_id):
+    run = extraction.get_run(get_db(), run_id)
+    if run is None:
+        return jsonify({"error": "Run not found"}), 404
+    return jsonify(run)
+
+
+@app.route("/api/extraction/proposals", methods=["GET"])
+def list_relation_proposals():
+    # ?status=pending&after=<id>&limit=100, oldest first
+    status = request.args.get("status", "pending")
+    if status not in extraction.PROPOSAL_STATUSES:
+        return jsonify({"error": f"status must be one of: {', '.join(extraction.PROPOSAL_STATUSES)}"}), 400
+    try:
+        after = int(request.args.get("after", 0))
+        limit = max(1, min(int(request.args.get("limit", config.EXTRACTION_PAGE_SIZE)), config.MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "'after' and 'limit' must be integers"}), 400
+    conn = get_db()
+    rows = conn.execute("""
+        SELECT p.id, p.node_id, p.source_node_id, p.target_node_id, p.relation_type_id, rt.name,
+               p.predicate, p.subject, p.object, p.status, p.relation_id
+        FROM relation_proposals p LEFT JOIN relation_types rt ON rt.id = p.relation_type_id
+        WHERE p.status = ? AND p.id > ?
+        ORDER BY p.id LIMIT ?
+    """, (status, after, limit)).fetchall()
+    keys = ("id", "node_id", "source", "target", "relation_type_id", "relation_type", "predicate", "subject",
+            "object", "status", "relation_id")
+    proposals = [dict(zip(keys, r)) for r in rows]
+    return jsonify({
+        "proposals": proposals,
+        "next_after": proposals[-1]["id"] if len(proposals) == limit else None,
+    })
 
-    while i < len(doc):
-        token = doc[i]
 
-        # If token starts a noun chunk
-        if i in chunk_starts:
-            chunk = next(c for c in noun_chunks if c.start == i)
-            span_tokens = []
-            for tok in chunk:
-                if tok.pos_ == "DET":
-                    span_tokens.append(escape(tok.text) + tok.whitespace_)
-                else:
-                    span_tokens.append(f"<strong>{escape(tok.text)}</strong>" + tok.whitespace_)
-            highlighted.append("".join(span_tokens))
-            i = chunk.end
-            continue
+@app.route("/api/extraction/proposals/<int:proposal_id>", methods=["POST"])
+def review_relation_proposal(proposal_id):
+    # {"action": "accept" | "reject", "relation_id": <type id, overrides the proposed one>}
+    data = request.get_json(silent=True) or {}
+    action = data.get("action")
+    if action not in ("accept", "reject"):
+        return jsonify({"error": "'action' must be 'accept' or 'reject'."}), 400
+    conn = get_db()
+    row = conn.execute(
+        "SELECT source_node_id, target_node_id, relation_type_id, status FROM relation_proposals WHERE id=?",
+        (proposal_id,),
+    ).fetchone()
+    if row is None:
+        return jsonify({"error": "Proposal not found"}), 404
+    source, target, relation_type_id, status = row
+    if status != "pending":
+        return jsonify({"error": f"Proposal is already {status}."}), 409
+
+    def review(new_status, relation_id=None):
+        conn.execute(
+            "UPDATE relation_proposals SET status=?, relation_type_id=?, relation_id=?, updated_at=? WHERE id=?",
+            (new_status, relation_type_id, relation_id, time.time(), proposal_id),
+        )
 
-        # Otherwise apply additional styling
-        word = escape(token.text)
-        styles = []
+    if action == "reject":
+        review("rejected")
+        conn.commit()
+        return jsonify({"success": True, "status": "rejected"})
+
+    gone = [n for n in {source, target}
+            if conn.execute("SELECT 1 FROM nodes WHERE id=?", (n,)).fetchone() is None]
+    if gone:
+        # Left over from before the node was deleted
+        for node_id in gone:
+            extraction.node_deleted(conn, node_id)
+        conn.commit()
+        return jsonify({"error": f"Node(s) {', '.join(map(str, sorted(gone)))} no longer exist."}), 409
+
+    relation_type_id = data.get("relation_id", relation_type_id)
+    if not isinstance(relation_type_id, int):
+        return jsonify({"error": "The proposal has no relation type; pass 'relation_id'."}), 400
+    if conn.execute("SELECT 1 FROM relation_types WHERE id=?", (relation_type_id,)).fetchone() is None:
+        return jsonify({"error": "Relation type not found"}), 404
+    existing = conn.execute(
+        "SELECT id FROM relations WHERE source_node_id = ? AND target_node_id = ? AND relation_type_id = ?",
+        (source, target, relation_type_id),
+    ).fetchone()
+    if existing:
+        review("accepted", existing[0])
+        conn.commit()
+        rel_id = existing[0]
+    else:
+        rel_id = _insert_relation(conn, source, target, relation_type_id,
+                                  before_commit=lambda rel_id: review("accepted", rel_id))
+    return jsonify({"success": True, "status": "accepted", "id": rel_id})
 
-        if token.pos_ == "PROPN":
-            styles.append("font-weight:bold; color:blue")
-        if token.lemma_ in relation_verbs and token.pos_ == "VERB":
-            styles.append("font-style:italic")
-        if token.text.lower() in attribute_words:
-            styles.append("color:gray")
-        if token.pos_ == "ADP":
-            styles.append("color:blue")
 
-        if styles:
-            word = f"<span style=\"{' '.join(styles)}\">{word}</span>"
+@app.route("/api/search", methods=["GET"])
+@http_cache.cached
+def search_nodes():
+    # ?q=cell bio -> nodes matching "cell" and a word starting with "bio", best first
+    try:
+        limit = int(request.args.get("limit", config.SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer."}), 400
+    limit = max(1, min(limit, config.SEARCH_MAX_LIMIT))
+    prefix = request.args.get("prefix", "1") != "0"
+    results = search.search(get_db().cursor(), request.args.get("q", ""), limit, prefix=prefix)
+    return jsonify({"results": results})
 
-        highlighted.append(word + token.whitespace_)
-        i += 1
 
-    return "".join(highlighted)
+def _since_arg():
+    # ?since=<rev>, or the Last-Event-ID an EventSource sends when it reconnects
+    value = request.args.get("since", request.headers.get("Last-Event-ID"))
+    return int(value) if value is not None else None
 
 
+@app.route("/api/changes", methods=["GET"])
+def list_changes():
+    try:
+        since = _since_arg()
+        limit = int(request.args.get("limit", config.CHANGELOG_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "'since' and 'limit' must be integers."}), 400
+    limit = max(1, min(limit, config.CHANGELOG_PAGE_SIZE))
+    try:
+        delta = changes.changes_since(get_db(), since, limit)
+    except changes.ResyncRequired as e:
+        # Log truncated past `since`: reload the full lists, then resume from "revision"
+        return jsonify({"error": str(e), "resync_required": True, "revision": e.revision}), 410
+    changes.maybe_compact()
+    return jsonify(delta)
+
+
+@app.route("/api/changes/stream", methods=["GET"])
+def stream_changes():
+    try:
+        since = _since_arg()
+    except ValueError:
+        return jsonify({"error": "'since' must be an integer."}), 400
+    response = Response(stream_with_context(changes.stream(since)), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/api/query/attributes", methods=["GET", "POST"])
+def query_attributes():
+    # GET ?where=mass:gt:10&where=state:in:solid,liquid&match=all|any
+    # POST {"filter": {"and": [{"attribute": "mass", "op": "gt", "value": 10}, {"or": [...]}]}}
+    posted = request.method == "POST"
+    data = (request.get_json(silent=True) or {}) if posted else {}
+    args = data if posted else request.args
+    try:
+        limit = int(args.get("limit", config.MAX_PAGE_SIZE))
+        cursor = int(args.get("cursor", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'limit' and 'cursor' must be integers."}), 400
+    limit = max(1, min(limit, config.MAX_PAGE_SIZE))
+    try:
+        tree = data.get("filter") if posted else attribute_query.parse_args(request.args)
+        if tree is None:
+            raise attribute_query.QueryError("'filter' is required")
+        result = attribute_query.query(get_db().cursor(), tree, limit, cursor)
+    except attribute_query.QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+
+@app.route("/api/batch", methods=["POST"])
+def run_batch():
+    # Ordered edits through the regular handlers, one transaction; see batch.py
+    data = request.get_json(silent=True) or {}
+    ops = data.get("ops")
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "'ops' must be a non-empty list."}), 400
+    if len(ops) > config.BATCH_MAX_OPS:
+        return jsonify({"error": f"At most {config.BATCH_MAX_OPS} ops per batch."}), 413
+    try:
+        return jsonify(batch.run(app, get_db(), ops))
+    except batch.BatchError as e:
+        return jsonify({"error": str(e), "failed": e.index, "result": e.result, "committed": False}), e.status
+
+
+@app.route("/api/layout", methods=["GET"])
+def get_layout():
+    # Stored positions only; when they are out of date a refresh is queued
+    # and the next request sees its result
+    conn = get_db()
+    stale = layout.is_stale(conn)
+    if stale:
+        layout.service.schedule()
+    return jsonify({"stale": stale, "nodes": layout.positions(conn.cursor())})
+
+
+@app.route("/api/layout", methods=["POST"])
+def refresh_layout():
+    # {"full": true} lays out from scratch instead of adjusting the stored positions
+    data = request.get_json(silent=True) or {}
+    queued = layout.service.schedule(full=bool(data.get("full")))
+    return jsonify({"queued": queued}), 202
+
+
+@app.route("/api/layout/node/<int:node_id>", methods=["PUT"])
+def pin_node_position(node_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        x, y = float(data["x"]), float(data["y"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "'x' and 'y' must be numbers."}), 400
+    conn = get_db()
+    if conn.execute("SELECT 1 FROM nodes WHERE id=?", (node_id,)).fetchone() is None:
+        return jsonify({"error": "Node not found"}), 404
+    layout.pin(conn, node_id, x, y, pinned=data.get("pinned", True))
+    return jsonify({"success": True})
 
 
-@app.route("/api/nlp/parse-summary", methods=["POST"])
-def parse_summary():
-    data = request.get_json()
-    text = data.get("text", "").strip()
-    if not text:
-        return jsonify({"error": "No summary text provided."}), 400
 
-    result = parse_summary_text(text)
+def _analytics_args():
+    # ?types= (ids or names), ?limit=, ?node=; raises ValueError
+    try:
+        limit = int(request.args.get("limit", config.ANALYTICS_DEFAULT_LIMIT))
+        node_id = int(request.args["node"]) if request.args.get("node") else None
+    except ValueError:
+        raise ValueError("'limit' and 'node' must be integers.")
+    types = graph_index.resolve_types(get_db().cursor(), request.args.get("types"))
+    return (tuple(sorted(types)) if types is not None else None), max(0, min(limit, config.MAX_PAGE_SIZE)), node_id
+
+
+def _analytics_result(metric, graph, seconds, **extra):
+    return dict({"metric": metric, "revision": graph.revision, "nodes": graph.node_count,
+                 "edges": graph.edge_count, "cached": seconds is None,
+                 "seconds": round(seconds, 3) if seconds is not None else None}, **extra)
+
+
+def _ranking(metric, scores, graph, seconds, limit, node_id, fields=None, **extra):
+    # The top nodes by score and, with ?node=, that node's own score and rank
+    positions = analytics.top(scores, limit).tolist()
+    items = graph_index.fetch_nodes(get_db().cursor(), [int(graph.ids[p]) for p in positions])
+    for item, p, rank in zip(items, positions, analytics.ranks(scores, positions)):
+        item.update(score=float(scores[p]), rank=rank, **(fields(p) if fields else {}))
+    result = _analytics_result(metric, graph, seconds, items=items, **extra)
+    if node_id is not None:
+        p = graph.position(node_id)
+        if p is None:
+            return jsonify({"error": "Node not found"}), 404
+        result["node"] = dict({"id": node_id, "score": float(scores[p]), "rank": analytics.rank_of(scores, p)},
+                              **(fields(p) if fields else {}))
     return jsonify(result)
 
-@app.route('/api/nlp/parse-node-label', methods=['POST'])
-def api_parse_node_label():
-    data = request.get_json()
-    text = data.get('text', '')
-    result = parse_node_label(text)
+
+@app.route("/api/analytics/pagerank", methods=["GET"])
+@http_cache.cached
+def analytics_pagerank():
+    try:
+        types, limit, node_id = _analytics_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    (scores, iterations), graph, seconds = analytics.compute(
+        get_db(), ("pagerank", types), lambda g: analytics.pagerank(g, types))
+    return _ranking("pagerank", scores, graph, seconds, limit, node_id, iterations=iterations)
+
+
+@app.route("/api/analytics/degree", methods=["GET"])
+@http_cache.cached
+def analytics_degree():
+    # ?sort=in|out|total (default total)
+    sort = request.args.get("sort", "total")
+    if sort not in ("in", "out", "total"):
+        return jsonify({"error": "sort must be one of: in, out, total"}), 400
+    try:
+        types, limit, node_id = _analytics_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    (indeg, outdeg), graph, seconds = analytics.compute(
+        get_db(), ("degree", types), lambda g: analytics.degree(g, types))
+    scores = {"in": indeg, "out": outdeg, "total": indeg + outdeg}[sort]
+    return _ranking(f"degree.{sort}", scores, graph, seconds, limit, node_id,
+                    fields=lambda p: {"in": int(indeg[p]), "out": int(outdeg[p])})
+
+
+@app.route("/api/analytics/betweenness", methods=["GET"])
+@http_cache.cached
+def analytics_betweenness():
+    # Approximate: ?samples= BFS pivots (more is slower and closer); ?directed=1
+    try:
+        samples = int(request.args.get("samples", config.ANALYTICS_BETWEENNESS_SAMPLES))
+    except ValueError:
+        return jsonify({"error": "'samples' must be an integer."}), 400
+    try:
+        types, limit, node_id = _analytics_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    samples = max(1, min(samples, config.ANALYTICS_BETWEENNESS_MAX_SAMPLES))
+    directed = request.args.get("directed") == "1"
+    (scores, used), graph, seconds = analytics.compute(
+        get_db(), ("betweenness", types, samples, directed),
+        lambda g: analytics.betweenness(g, types, samples, directed))
+    return _ranking("betweenness", scores, graph, seconds, limit, node_id, samples=used, directed=directed)
+
+
+@app.route("/api/analytics/components", methods=["GET"])
+@http_cache.cached
+def analytics_components():
+    # Weakly connected components, largest first. Nodes without any edge
+    # (of ?types=) are only counted, unless ?isolated=1.
+    try:
+        types, limit, node_id = _analytics_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    summary, graph, seconds = analytics.compute(
+        get_db(), ("components", types), lambda g: analytics.Components(g, types))
+    listing = summary.listing(limit, include_isolated=request.args.get("isolated") == "1")
+    result = _analytics_result("components", graph, seconds, components=summary.count,
+                               isolated=summary.isolated_count, largest=summary.largest, items=listing)
+    if node_id is not None:
+        found = summary.of_node(node_id)
+        if found is None:
+            return jsonify({"error": "Node not found"}), 404
+        result["node"] = found
     return jsonify(result)
 
 
+@app.route("/api/analytics/components/by-type", methods=["GET"])
+@http_cache.cached
+def analytics_components_by_type():
+    # Per relation type: the nodes its edges touch and the pieces they form
+    per_type, graph, seconds = analytics.compute(get_db(), ("components.by-type",), analytics.components_by_type)
+    names = graph_index.relation_type_names(get_db().cursor(), [t["type_id"] for t in per_type])
+    return jsonify(_analytics_result("components.by-type", graph, seconds,
+                                     types=[dict(t, type=names.get(t["type_id"])) for t in per_type]))
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,172 @@
+# attribute_query.py
+# Node lookups by attribute value for /api/query/attributes.
+#
+# A filter is a tree of {"and": [...]}, {"or": [...]} and leaves such as
+#   {"attribute": "mass", "op": "gt", "value": 10}
+#   {"attribute": "boiling_point", "op": "between", "value": [300, 400]}
+#   {"attribute": "state", "op": "in", "value": ["solid", "liquid"]}
+# Each leaf becomes one index range scan returning node ids:
+#   - integer, float, boolean and date attributes compare value_num through
+#     idx_node_attributes_num (attribute_id, value_num, node_id)
+#   - everything else compares the text value through
+#     idx_node_attributes_value (attribute_id, value, node_id)
+# AND and OR become INTERSECT and UNION of those id lists, so the cost
+# follows the size of the matching sets, never the size of the table.
+import config
+from validation import TYPED, typed_value
+
+OPS = {
+    "eq": "=", "=": "=", "==": "=",
+    "ne": "<>", "!=": "<>",
+    "lt": "<", "<": "<",
+    "lte": "<=", "<=": "<=",
+    "gt": ">", ">": ">",
+    "gte": ">=", ">=": ">=",
+    "between": "between",
+    "in": "in",
+}
+ORDERED_OPS = {"<", "<=", ">", ">=", "between"}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_node_attributes_num "
+    "ON node_attributes(attribute_id, value_num, node_id) WHERE value_num IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_node_attributes_value "
+    "ON node_attributes(attribute_id, value, node_id)",
+]
+
+
+def install(conn):
+    """Add value_num, fill it for existing rows and index it."""
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(node_attributes)")]
+    if "value_num" not in columns:
+        # NUMERIC affinity keeps integers exact and still compares with floats
+        conn.execute("ALTER TABLE node_attributes ADD COLUMN value_num NUMERIC")
+    for (attr_id,) in conn.execute("SELECT id FROM attributes").fetchall():
+        retype(conn, attr_id)
+    for stmt in INDEXES:
+        conn.execute(stmt)
+
+
+def retype(conn, attribute_id):
+    """Recompute value_num for every value of one attribute (after its data_type changed)."""
+    row = conn.execute("SELECT data_type FROM attributes WHERE id=?", (attribute_id,)).fetchone()
+    data_type = row[0] if row else None
+    if data_type not in TYPED:
+        conn.execute("UPDATE node_attributes SET value_num=NULL WHERE attribute_id=? AND value_num IS NOT NULL",
+                     (attribute_id,))
+        return
+    rows = conn.execute("SELECT id, value FROM node_attributes WHERE attribute_id=?", (attribute_id,)).fetchall()
+    conn.executemany("UPDATE node_attributes SET value_num=? WHERE id=?",
+                     [(typed_value(data_type, value), na_id) for na_id, value in rows])
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _attribute(cur, ref, cache):
+    key = str(ref).strip().lower()
+    if key not in cache:
+        if key.isdigit():
+            cur.execute("SELECT id, data_type FROM attributes WHERE id=?", (int(key),))
+        else:
+            cur.execute("SELECT id, data_type FROM attributes WHERE LOWER(name)=?", (key,))
+        row = cur.fetchone()
+        if row is None:
+            raise QueryError(f"Unknown attribute '{ref}'")
+        cache[key] = row
+    return cache[key]
+
+
+def _operand(data_type, value):
+    if data_type not in TYPED:
+        return str(value)
+    typed = typed_value(data_type, value)
+    if typed is None:
+        raise QueryError(f"'{value}' is not a valid {data_type}")
+    return typed
+
+
+def _leaf(cur, node, cache):
+    if "attribute" not in node:
+        raise QueryError("Each filter needs an 'attribute'")
+    attr_id, data_type = _attribute(cur, node["attribute"], cache)
+    op = OPS.get(str(node.get("op", "eq")).lower())
+    if op is None:
+        raise QueryError(f"Unknown operator '{node.get('op')}'. Use one of: {', '.join(sorted(set(OPS)))}")
+    if data_type == "boolean" and op in ORDERED_OPS:
+        raise QueryError("Boolean attributes only support eq, ne and in")
+    column = "value_num" if data_type in TYPED else "value"
+    value = node.get("value")
+    sql = f"SELECT node_id FROM node_attributes WHERE attribute_id = ? AND {column} "
+    if op == "between":
+        if not isinstance(value, list) or len(value) != 2:
+            raise QueryError("'between' takes a [low, high] pair")
+        return sql + "BETWEEN ? AND ?", [attr_id, _operand(data_type, value[0]), _operand(data_type, value[1])]
+    if op == "in":
+        if not isinstance(value, list) or not value:
+            raise QueryError("'in' takes a non-empty list")
+        operands = list(dict.fromkeys(_operand(data_type, v) for v in value))
+        return sql + f"IN ({','.join('?' * len(operands))})", [attr_id] + operands
+    if value is None or isinstance(value, (list, dict)):
+        raise QueryError(f"'{node.get('op', 'eq')}' takes a single value")
+    return sql + f"{op} ?", [attr_id, _operand(data_type, value)]
+
+
+def compile_filter(cur, node, cache=None, counter=None):
+    """(sql, params) for a compound SELECT of the node ids matching node."""
+    cache = {} if cache is None else cache
+    counter = counter if counter is not None else [0]
+    if not isinstance(node, dict):
+        raise QueryError("Filters must be objects")
+    for combinator, set_op in (("and", "INTERSECT"), ("or", "UNION")):
+        if combinator in node:
+            children = node[combinator]
+            if not isinstance(children, list) or not children:
+                raise QueryError(f"'{combinator}' takes a non-empty list of filters")
+            parts = [compile_filter(cur, child, cache, counter) for child in children]
+            if len(parts) == 1:
+                return parts[0]
+            # Parenthesised compound selects aren't allowed; nest through subqueries
+            sql = f" {set_op} ".join(f"SELECT node_id FROM ({p[0]})" for p in parts)
+            return sql, [param for p in parts for param in p[1]]
+    counter[0] += 1
+    if counter[0] > config.ATTRIBUTE_QUERY_MAX_FILTERS:
+        raise QueryError(f"At most {config.ATTRIBUTE_QUERY_MAX_FILTERS} filters per query")
+    return _leaf(cur, node, cache)
+
+
+def parse_args(args):
+    """Filter tree from GET arguments: where=mass:gt:10 (repeatable), match=all|any.
+
+    'between' and 'in' take comma-separated values: where=state:in:solid,liquid
+    """
+    leaves = []
+    for clause in args.getlist("where"):
+        parts = clause.split(":", 2)
+        if len(parts) != 3:
+            raise QueryError(f"Bad filter '{clause}'; expected attribute:op:value")
+        name, op, value = parts
+        if OPS.get(op.lower()) in ("between", "in"):
+            value = [v.strip() for v in value.split(",")]
+        leaves.append({"attribute": name, "op": op, "value": value})
+    if not leaves:
+        raise QueryError("At least one 'where' filter is required")
+    match = args.get("match", "all")
+    if match not in ("all", "any"):
+        raise QueryError("'match' must be 'all' or 'any'")
+    return {"and" if match == "all" else "or": leaves}
+
+
+def query(cur, tree, limit, cursor=None):
+    """One page of matching nodes, keyset-paginated on id."""
+    sql, params = compile_filter(cur, tree)
+    cur.execute(f"""
+        SELECT id, title, summary, is_instance FROM nodes
+        WHERE id IN ({sql}) AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """, params + [cursor or 0, limit])
+    rows = cur.fetchall()
+    items = [{"id": r[0], "label": r[1], "summary": r[2], "is_instance": bool(r[3])} for r in rows]
+    return {"items": items, "next_cursor": rows[-1][0] if len(rows) == limit else None}
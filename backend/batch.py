@@ -0,0 +1,140 @@
+# batch.py
+# /api/batch: run an ordered list of edits through the existing route
+# handlers in one transaction.
+#
+#   POST /api/batch
+#   {"ops": [
+#     {"op": "create_node", "ref": "cell", "args": {"title": "Cell"}},
+#     {"op": "create_node", "ref": "org", "args": {"title": "Organism"}},
+#     {"op": "create_relation", "args": {"source": "$cell", "target": "$org", "relation_id": 3}},
+#     {"op": "add_node_attribute", "args": {"node_id": "$cell", "attribute_id": 2, "value": "10"}}
+#   ]}
+#
+# Each op names a mutating view in app.py; URL parameters (node_id, na_id,
+# ...) are taken from args and everything else becomes the JSON body. The
+# view runs unchanged in a nested request context sharing this request's
+# pooled connection, whose commits are deferred by
+# database.single_transaction, so the whole batch is one BEGIN IMMEDIATE
+# and one commit. The first op answering with an error status (or raising)
+# rolls everything back.
+#
+# "$name" in args is replaced by the id from the op with that "ref" (or by
+# its position, "$0"); "$name.field" picks another field of its response.
+import time
+
+import database
+import graph_index
+
+# op name -> HTTP method; the op name is the view function's endpoint
+OPS = {
+    "create_node": "POST",
+    "update_node": "POST",
+    "delete_node": "DELETE",
+    "create_relation": "POST",
+    "delete_relation": "DELETE",
+    "create_relation_type": "POST",
+    "update_relation_type": "PATCH",
+    "delete_relation_type": "DELETE",
+    "create_attribute": "POST",
+    "update_attribute": "PATCH",
+    "delete_attribute": "DELETE",
+    "add_node_attribute": "POST",
+    "update_node_attribute": "PATCH",
+    "delete_node_attribute": "DELETE",
+    "assign_possible_attributes": "POST",
+}
+
+
+class BatchError(Exception):
+    def __init__(self, index, message, status=400, result=None):
+        super().__init__(message)
+        self.index = index
+        self.status = status
+        self.result = result
+
+
+def _resolve(value, outputs, index):
+    if isinstance(value, str) and value.startswith("$") and len(value) > 1:
+        name, _, field = value[1:].partition(".")
+        if name not in outputs:
+            raise BatchError(index, f"Unknown reference '{value}'")
+        body = outputs[name]
+        field = field or "id"
+        if not isinstance(body, dict) or field not in body:
+            raise BatchError(index, f"Reference '{value}' has no field '{field}'")
+        return body[field]
+    if isinstance(value, dict):
+        return {k: _resolve(v, outputs, index) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, outputs, index) for v in value]
+    return value
+
+
+def _rule(app, endpoint, method):
+    for rule in app.url_map.iter_rules(endpoint):
+        if method in rule.methods:
+            return rule
+    return None
+
+
+def _call(app, index, op, args):
+    method = OPS.get(op)
+    rule = _rule(app, op, method) if method else None
+    if rule is None:
+        raise BatchError(index, f"Unknown op '{op}'. Use one of: {', '.join(OPS)}")
+    view_args = {}
+    for name in rule.arguments:
+        if name not in args:
+            raise BatchError(index, f"'{op}' needs '{name}'")
+        try:
+            view_args[name] = int(args[name])
+        except (TypeError, ValueError):
+            raise BatchError(index, f"'{name}' must be an integer")
+    body = {k: v for k, v in args.items() if k not in rule.arguments}
+    path = rule.build(view_args, append_unknown=False)[1]
+    try:
+        with app.test_request_context(path, method=method, json=body):
+            response = app.make_response(app.view_functions[op](**view_args))
+    except Exception as e:
+        # e.g. a KeyError for a missing field; report it like an error response
+        raise BatchError(index, f"Op {index} ('{op}') raised {type(e).__name__}: {e}", 400)
+    return response.status_code, response.get_json(silent=True)
+
+
+def run(app, conn, ops):
+    """Apply ops and return {"results", "timing"}; raises BatchError after rolling back."""
+    outputs = {}
+    results = []
+    started = time.perf_counter()
+    try:
+        with database.single_transaction(conn):
+            for index, spec in enumerate(ops):
+                if not isinstance(spec, dict) or "op" not in spec:
+                    raise BatchError(index, "Each op must be an object with an 'op'")
+                t0 = time.perf_counter()
+                args = _resolve(spec.get("args") or {}, outputs, index)
+                if not isinstance(args, dict):
+                    raise BatchError(index, "'args' must be an object")
+                status, body = _call(app, index, spec["op"], args)
+                result = {"op": spec["op"], "status": status, "result": body,
+                          "ms": round((time.perf_counter() - t0) * 1000, 3)}
+                if status >= 400:
+                    raise BatchError(index, f"Op {index} ('{spec['op']}') failed", status, result)
+                results.append(result)
+                outputs[str(index)] = body
+                if "ref" in spec:
+                    outputs[str(spec["ref"])] = body
+            t_commit = time.perf_counter()
+    except BaseException:
+        # Edits already announced to the in-memory index were rolled back.
+        graph_index.invalidate()
+        raise
+    finished = time.perf_counter()
+    return {
+        "results": results,
+        "timing": {
+            "ops_ms": round(sum(r["ms"] for r in results), 3),
+            "commit_ms": round((finished - t_commit) * 1000, 3),
+            "total_ms": round((finished - started) * 1000, 3),
+        },
+    }
@@ -0,0 +1,580 @@
+# benchmarks/api.py
+# Latency, throughput and memory of every API route over synthetic graphs.
+#
+# Usage (from backend/):
+#   python benchmarks/api.py [--sizes 1000,10000] [--requests 200] [--output api.json]
+#   python benchmarks/api.py --http http://localhost:5000 --threads 8 --duration 30 [--pid 1234]
+#   python benchmarks/api.py --compare before.json after.json
+#
+# In-process mode builds one graph per size with synthetic.py and, in a
+# fresh interpreter per size (the app reads its config at import, and peak
+# RSS is only comparable per process), runs every scenario in SCENARIOS
+# through the Flask test client: the reads, then the writes, then the
+# reads that depend on them (change sync), then the deletes that consume
+# what the writes created. Each scenario reports p50/p95/p99/mean/max
+# latency, throughput and the process's RSS after it ran. Routes without a
+# scenario are listed under "uncovered", so new routes get noticed.
+#
+# HTTP mode sends the read scenarios to a running server (gunicorn, flask
+# run, ...) from --threads threads for --duration seconds; --pid adds the
+# server's peak RSS (Linux).
+#
+# The HTTP response cache is off unless --http-cache is given, so repeated
+# reads measure the views and not the cache. The NLP routes need the spaCy
+# model; without it they report their error statuses like any other route.
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+
+class Scenario:
+    """One kind of request: make(ctx) -> (path, body) or None when there is nothing to send.
+
+    A dict or list body is sent as JSON, bytes as-is. store(ctx, response
+    JSON) records what a write created, for the scenarios after it.
+    """
+
+    def __init__(self, name, method, rule, make, store=None, phase="read", stream=False):
+        self.name = name
+        self.method = method
+        self.rule = rule
+        self.make = make
+        self.store = store
+        self.phase = phase
+        self.stream = stream
+
+
+class Context:
+    """Ids of the graph under test and of the rows the write scenarios created."""
+
+    def __init__(self, rng, nodes, revision, db_path=None):
+        self.rng = rng
+        self.nodes = nodes  # [(id, title, summary)]
+        self.revision = revision
+        self.db_path = db_path
+        self.serial = 0
+        self.created = {k: [] for k in ("nodes", "relations", "relation_types", "attributes",
+                                        "node_attributes", "possible", "jobs")}
+
+    def node(self):
+        return self.rng.choice(self.nodes)[0]
+
+    def title(self):
+        return self.rng.choice(self.nodes)[1]
+
+    def summary(self):
+        return self.rng.choice(self.nodes)[2] or self.title()
+
+    def word(self):
+        return self.rng.choice(self.title().split())
+
+    def next(self):
+        self.serial += 1
+        return self.serial
+
+    def pick(self, kind):
+        items = self.created[kind]
+        return self.rng.choice(items) if items else None
+
+    def take(self, kind):
+        items = self.created[kind]
+        return items.pop() if items else None
+
+    def lookup(self, sql, params):
+        # Ids the routes don't return (e.g. create_relation_type)
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+
+def _maybe(value, make):
+    return None if value is None else make(value)
+
+
+def _store_id(kind, key="id"):
+    def store(ctx, body):
+        if isinstance(body, dict) and key in body:
+            ctx.created[kind].append(body[key])
+    return store
+
+
+def _store_relation_type(ctx, body):
+    name = f"benchmark relation {ctx.serial}"
+    type_id = ctx.lookup("SELECT id FROM relation_types WHERE name=?", (name,))
+    if type_id is not None:
+        ctx.created["relation_types"].append((type_id, name))
+
+
+def _store_attribute(ctx, body):
+    if isinstance(body, dict) and "id" in body:
+        ctx.created["attributes"].append((body["id"], body["name"]))
+
+
+def _store_possible(ctx, body):
+    if isinstance(body, dict) and body.get("assigned"):
+        ctx.created["possible"].append(body["assigned"][0])
+
+
+def _import_body(ctx):
+    lines = [json.dumps({"title": f"Imported node {ctx.next()}", "summary": ctx.summary()}) for _ in range(100)]
+    return "/api/import/nodes?format=ndjson", ("\n".join(lines) + "\n").encode()
+
+
+def _batch_body(ctx):
+    n = ctx.next()
+    return "/api/batch", {"ops": [
+        {"op": "create_node", "ref": "a", "args": {"title": f"Batch node {n}a"}},
+        {"op": "create_node", "ref": "b", "args": {"title": f"Batch node {n}b"}},
+        {"op": "create_relation", "args": {"source": "$a", "target": "$b", "relation_id": ctx.is_a}},
+        {"op": "add_node_attribute", "args": {"node_id": "$a", "attribute_id": ctx.mass, "value": "1.5"}},
+    ]}
+
+
+SCENARIOS = [
+    # reads
+    Scenario("nodes", "GET", "/api/nodes", lambda c: ("/api/nodes", None)),
+    Scenario("nodes.page", "GET", "/api/nodes",
+             lambda c: (f"/api/nodes?limit=500&cursor={c.node()}", None)),
+    Scenario("node", "GET", "/api/node/<int:node_id>", lambda c: (f"/api/node/{c.node()}", None)),
+    Scenario("neighbors", "GET", "/api/node/<int:node_id>/neighbors",
+             lambda c: (f"/api/node/{c.node()}/neighbors", None)),
+    Scenario("neighborhood", "GET", "/api/node/<int:node_id>/neighborhood",
+             lambda c: (f"/api/node/{c.node()}/neighborhood?depth=2", None)),
+    Scenario("ancestors", "GET", "/api/node/<int:node_id>/ancestors",
+             lambda c: (f"/api/node/{c.node()}/ancestors?type=is_a", None)),
+    Scenario("descendants", "GET", "/api/node/<int:node_id>/descendants",
+             lambda c: (f"/api/node/{c.node()}/descendants?type=is_a", None)),
+    Scenario("reachable", "GET", "/api/reachable",
+             lambda c: (f"/api/reachable?from={c.node()}&to={c.node()}&type=is_a", None)),
+    Scenario("path", "GET", "/api/path",
+             lambda c: (f"/api/path?from={c.node()}&to={c.node()}", None)),
+    Scenario("path.k", "GET", "/api/path",
+             lambda c: (f"/api/path?from={c.node()}&to={c.node()}&k=3", None)),
+    Scenario("similar", "GET", "/api/node/<int:node_id>/similar",
+             lambda c: (f"/api/node/{c.node()}/similar", None)),
+    Scenario("similar.title", "GET", "/api/node/<int:node_id>/similar",
+             lambda c: (f"/api/node/{c.node()}/similar?field=title", None)),
+    Scenario("relation_types", "GET", "/api/relation-types", lambda c: ("/api/relation-types", None)),
+    Scenario("relations", "GET", "/api/relations", lambda c: ("/api/relations", None)),
+    Scenario("relations.page", "GET", "/api/relations",
+             lambda c: (f"/api/relations?limit=500&cursor={c.node()}", None)),
+    Scenario("relations.ndjson", "GET", "/api/relations", lambda c: ("/api/relations?format=ndjson", None)),
+    Scenario("attributes", "GET", "/api/attributes", lambda c: ("/api/attributes", None)),
+    Scenario("node.attributes", "GET", "/api/node/<int:node_id>/attributes",
+             lambda c: (f"/api/node/{c.node()}/attributes", None)),
+    Scenario("possible_attributes", "GET", "/api/nodes/<int:node_id>/possible-attributes",
+             lambda c: (f"/api/nodes/{c.node()}/possible-attributes", None)),
+    Scenario("search", "GET", "/api/search", lambda c: (f"/api/search?q={c.word()[:3]}", None)),
+    Scenario("query.attributes", "GET", "/api/query/attributes",
+             lambda c: (f"/api/query/attributes?where=mass:gt:{c.rng.uniform(0, 100):.2f}&limit=100", None)),
+    Scenario("query.attributes.post", "POST", "/api/query/attributes",
+             lambda c: ("/api/query/attributes", {"limit": 100, "filter": {"or": [
+                 {"attribute": "mass", "op": "between", "value": sorted([c.rng.uniform(0, 10), c.rng.uniform(0, 10)])},
+                 {"attribute": "size", "op": "eq", "value": "small"},
+             ]}})),
+    Scenario("layout", "GET", "/api/layout", lambda c: ("/api/layout", None)),
+    Scenario("analytics.pagerank", "GET", "/api/analytics/pagerank",
+             lambda c: (f"/api/analytics/pagerank?node={c.node()}", None)),
+    Scenario("analytics.degree", "GET", "/api/analytics/degree",
+             lambda c: (f"/api/analytics/degree?sort=in&node={c.node()}", None)),
+    Scenario("analytics.betweenness", "GET", "/api/analytics/betweenness",
+             lambda c: ("/api/analytics/betweenness?types=is_a", None)),
+    Scenario("analytics.components", "GET", "/api/analytics/components",
+             lambda c: (f"/api/analytics/components?types=is_a&node={c.node()}", None)),
+    Scenario("analytics.components.by_type", "GET", "/api/analytics/components/by-type",
+             lambda c: ("/api/analytics/components/by-type", None)),
+    Scenario("db.stats", "GET", "/api/db/stats", lambda c: ("/api/db/stats", None)),
+    Scenario("cache.stats", "GET", "/api/cache/stats", lambda c: ("/api/cache/stats", None)),
+    Scenario("nlp.models", "GET", "/api/nlp/models", lambda c: ("/api/nlp/models", None)),
+    Scenario("nlp.cache.stats", "GET", "/api/nlp/cache/stats", lambda c: ("/api/nlp/cache/stats", None)),
+    Scenario("parse.summary", "POST", "/api/nlp/parse-summary",
+             lambda c: ("/api/nlp/parse-summary", {"text": c.summary()})),
+    Scenario("parse.label", "POST", "/api/nlp/parse-node-label",
+             lambda c: ("/api/nlp/parse-node-label", {"text": c.title()})),
+    Scenario("parse.summary.batch", "POST", "/api/nlp/parse-summary/batch",
+             lambda c: ("/api/nlp/parse-summary/batch", {"texts": [c.summary() for _ in range(16)]})),
+    Scenario("parse.label.batch", "POST", "/api/nlp/parse-node-label/batch",
+             lambda c: ("/api/nlp/parse-node-label/batch", {"texts": [c.title() for _ in range(16)]})),
+    # writes
+    Scenario("summaries.job", "POST", "/api/summaries/jobs",
+             lambda c: ("/api/summaries/jobs", {"node_ids": [c.node() for _ in range(5)]}),
+             store=_store_id("jobs", "job_id"), phase="write"),
+    Scenario("summaries.job.status", "GET", "/api/summaries/jobs/<int:job_id>",
+             lambda c: _maybe(c.pick("jobs"), lambda j: (f"/api/summaries/jobs/{j}?items=1", None)),
+             phase="write"),
+    Scenario("node.create", "POST", "/api/node/create",
+             lambda c: ("/api/node/create", {"title": f"Benchmark node {c.next()}"}),
+             store=_store_id("nodes"), phase="write"),
+    Scenario("node.update", "POST", "/api/node/update",
+             lambda c: _maybe(c.pick("nodes"), lambda n: (
+                 "/api/node/update", {"id": n, "title": f"Benchmark node {n}", "summary": c.summary()})),
+             phase="write"),
+    Scenario("relation_type.create", "POST", "/api/relation-type",
+             lambda c: ("/api/relation-type", {"name": f"benchmark relation {c.next()}",
+                                               "inverse_name": f"benchmark inverse {c.serial}"}),
+             store=_store_relation_type, phase="write"),
+    Scenario("relation_type.update", "PATCH", "/api/relation-type/<int:type_id>",
+             lambda c: _maybe(c.pick("relation_types"), lambda t: (
+                 f"/api/relation-type/{t[0]}", {"name": t[1], "inverse_name": f"{t[1]} inverse"})),
+             phase="write"),
+    Scenario("relation.create", "POST", "/api/relation/create",
+             lambda c: _maybe(c.pick("nodes"), lambda n: _maybe(c.pick("relation_types"), lambda t: (
+                 "/api/relation/create", {"source": n, "target": c.node(), "relation_id": t[0]}))),
+             store=_store_id("relations"), phase="write"),
+    Scenario("attribute.create", "POST", "/api/attribute",
+             lambda c: ("/api/attribute", {"name": f"benchmark attribute {c.next()}", "data_type": "float"}),
+             store=_store_attribute, phase="write"),
+    Scenario("attribute.update", "PATCH", "/api/attribute/<int:attr_id>",
+             lambda c: _maybe(c.pick("attributes"), lambda a: (
+                 f"/api/attribute/{a[0]}", {"name": a[1], "data_type": "float", "unit": "kg"})),
+             phase="write"),
+    Scenario("node_attribute.create", "POST", "/api/node/<int:node_id>/attribute",
+             lambda c: _maybe(c.pick("attributes"), lambda a: (
+                 f"/api/node/{c.node()}/attribute", {"attribute_id": a[0], "value": f"{c.rng.uniform(0, 100):.3f}"})),
+             store=_store_id("node_attributes"), phase="write"),
+    Scenario("node_attribute.update", "PATCH", "/api/node_attribute/<int:na_id>",
+             lambda c: _maybe(c.pick("node_attributes"), lambda na: (
+                 f"/api/node_attribute/{na}", {"value": f"{c.rng.uniform(0, 100):.3f}"})),
+             phase="write"),
+    Scenario("possible_attributes.assign", "POST", "/api/nodes/<int:node_id>/possible-attributes",
+             lambda c: _maybe(c.pick("attributes"), lambda a: (
+                 f"/api/nodes/{c.node()}/possible-attributes", {"attribute_ids": [a[0]]})),
+             store=_store_possible, phase="write"),
+    Scenario("layout.pin", "PUT", "/api/layout/node/<int:node_id>",
+             lambda c: (f"/api/layout/node/{c.node()}", {"x": c.rng.uniform(-500, 500), "y": c.rng.uniform(-500, 500)}),
+             phase="write"),
+    Scenario("import.nodes", "POST", "/api/import/<kind>", _import_body, phase="write"),
+    Scenario("batch", "POST", "/api/batch", _batch_body, phase="write"),
+    # reads after the writes
+    Scenario("changes", "GET", "/api/changes",
+             lambda c: (f"/api/changes?since={c.revision}", None), phase="sync"),
+    Scenario("changes.stream", "GET", "/api/changes/stream",
+             lambda c: (f"/api/changes/stream?since={c.revision}", None), phase="sync", stream=True),
+    # deletes of what the writes created
+    Scenario("possible_attributes.delete", "DELETE", "/api/nodes/<int:node_id>/possible-attributes/<int:attribute_id>",
+             lambda c: _maybe(c.take("possible"), lambda p: (
+                 f"/api/nodes/{c.node()}/possible-attributes/{p}", None)),
+             phase="delete"),
+    Scenario("node_attribute.delete", "DELETE", "/api/node_attribute/<int:na_id>",
+             lambda c: _maybe(c.take("node_attributes"), lambda na: (f"/api/node_attribute/{na}", None)),
+             phase="delete"),
+    Scenario("relation.delete", "DELETE", "/api/relation/<int:relation_id>",
+             lambda c: _maybe(c.take("relations"), lambda r: (f"/api/relation/{r}", None)),
+             phase="delete"),
+    Scenario("attribute.delete", "DELETE", "/api/attribute/<int:attr_id>",
+             lambda c: _maybe(c.take("attributes"), lambda a: (f"/api/attribute/{a[0]}", None)),
+             phase="delete"),
+    Scenario("relation_type.delete", "DELETE", "/api/relation-type/<int:type_id>",
+             lambda c: _maybe(c.take("relation_types"), lambda t: (f"/api/relation-type/{t[0]}", None)),
+             phase="delete"),
+    Scenario("node.delete", "DELETE", "/api/node/<int:node_id>",
+             lambda c: _maybe(c.take("nodes"), lambda n: (f"/api/node/{n}", None)),
+             phase="delete"),
+]
+
+
+def percentile(ordered, p):
+    # Nearest rank on a sorted list
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(latencies, statuses, elapsed):
+    ordered = sorted(latencies)
+    ms = lambda s: round(s * 1000, 3)  # noqa: E731
+    result = {
+        "requests": len(ordered),
+        "errors": sum(n for status, n in statuses.items() if int(status) >= 400),
+        "statuses": statuses,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed > 0 else None,
+    }
+    if ordered:
+        result.update({
+            "p50_ms": ms(percentile(ordered, 50)),
+            "p95_ms": ms(percentile(ordered, 95)),
+            "p99_ms": ms(percentile(ordered, 99)),
+            "mean_ms": ms(sum(ordered) / len(ordered)),
+            "max_ms": ms(ordered[-1]),
+        })
+    return result
+
+
+def memory():
+    """(current RSS, peak RSS, peak RSS of the largest child) in MiB."""
+    import resource
+    scale = 2**20 if sys.platform == "darwin" else 2**10  # ru_maxrss is bytes on macOS, KiB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        current = None
+    return current, peak, children
+
+
+def _route_methods(flask_app):
+    found = set()
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint != "static":
+            found.update((rule.rule, m) for m in rule.methods - {"HEAD", "OPTIONS"})
+    return found
+
+
+def _send(client, scenario, path, body):
+    kwargs = {"method": scenario.method}
+    if isinstance(body, bytes):
+        kwargs["data"] = body
+    elif body is not None:
+        kwargs["json"] = body
+    t0 = time.perf_counter()
+    response = client.open(path, buffered=not scenario.stream, **kwargs)
+    if scenario.stream:
+        next(iter(response.response), None)  # time to the first event
+        payload = None
+    else:
+        payload = response.get_json(silent=True)
+    elapsed = time.perf_counter() - t0
+    response.close()
+    return elapsed, response.status_code, payload
+
+
+def worker(db_path, requests, warmup, seed, only):
+    """Run the scenarios in this process against db_path; returns the report for one size."""
+    sys.path.insert(0, BACKEND)
+    t0 = time.perf_counter()
+    import app as app_module
+    import_seconds = time.perf_counter() - t0
+    flask_app = app_module.app
+    client = flask_app.test_client()
+
+    with sqlite3.connect(db_path) as conn:
+        nodes = conn.execute("SELECT id, title, summary FROM nodes").fetchall()
+        is_a = conn.execute("SELECT id FROM relation_types WHERE name='is_a'").fetchone()[0]
+        mass = conn.execute("SELECT id FROM attributes WHERE name='mass'").fetchone()[0]
+    revision = client.get("/api/changes").get_json()["revision"]
+    ctx = Context(random.Random(seed), nodes, revision, db_path)
+    ctx.is_a, ctx.mass = is_a, mass
+
+    endpoints = {}
+    for scenario in SCENARIOS:
+        if only and not any(scenario.name.startswith(o) for o in only):
+            continue
+        if scenario.phase == "read":
+            for _ in range(warmup):
+                request = scenario.make(ctx)
+                if request:
+                    _send(client, scenario, *request)
+        latencies, statuses = [], {}
+        started = time.perf_counter()
+        for _ in range(requests):
+            request = scenario.make(ctx)
+            if request is None:
+                continue
+            elapsed, status, payload = _send(client, scenario, *request)
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if scenario.store and status < 400:
+                scenario.store(ctx, payload)
+        result = summarize(latencies, statuses, time.perf_counter() - started)
+        current, peak, _ = memory()
+        result.update({"method": scenario.method, "rule": scenario.rule, "phase": scenario.phase,
+                       "rss_mb": round(current, 1) if current is not None else None,
+                       "peak_rss_mb": round(peak, 1)})
+        endpoints[scenario.name] = result
+
+    covered = {(s.rule, s.method) for s in SCENARIOS}
+    _, peak, children = memory()
+    return {
+        "import_seconds": round(import_seconds, 3),
+        "peak_rss_mb": round(peak, 1),
+        "child_peak_rss_mb": round(children, 1),  # e.g. an NLP pool worker
+        "endpoints": endpoints,
+        "uncovered": sorted(f"{m} {r}" for r, m in _route_methods(flask_app) - covered),
+    }
+
+
+def run_size(size, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "graph.db")
+        graph = synthetic.build(db_path, size, args.degree, args.attributes, args.seed)
+        env = dict(os.environ, KNOWLEDGE_DB_PATH=db_path,
+                   KNOWLEDGE_HTTP_CACHE="1" if args.http_cache else "0",
+                   KNOWLEDGE_SUMMARY_CLIENT=os.environ.get("KNOWLEDGE_SUMMARY_CLIENT", "stub"))
+        command = [sys.executable, os.path.abspath(__file__), "--worker", db_path,
+                   "--requests", str(args.requests), "--warmup", str(args.warmup), "--seed", str(args.seed)]
+        if args.only:
+            command += ["--only", args.only]
+        out = subprocess.run(command, cwd=BACKEND, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            sys.exit(f"size {size} failed:\n{out.stderr}")
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["graph"] = graph
+    return result
+
+
+# -- HTTP load generator ------------------------------------------------------
+
+def _http_get_json(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def run_http(args):
+    base = args.http.rstrip("/")
+    page = _http_get_json(f"{base}/api/nodes?limit=5000&fields=id,label,summary")
+    nodes = [(n["id"], n["label"], n.get("summary")) for n in page["items"]]
+    if not nodes:
+        sys.exit("the server has no nodes; load a graph first (benchmarks/synthetic.py)")
+    revision = _http_get_json(f"{base}/api/changes")["revision"]
+    scenarios = [s for s in SCENARIOS if s.phase == "read" and not s.stream
+                 and (not args.only or any(s.name.startswith(o) for o in args.only.split(",")))]
+    results = {s.name: ([], {}) for s in scenarios}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def load(seed):
+        ctx = Context(random.Random(seed), nodes, revision)
+        local = {s.name: ([], {}) for s in scenarios}
+        while time.perf_counter() < deadline:
+            scenario = ctx.rng.choice(scenarios)
+            path, body = scenario.make(ctx)
+            data = None
+            headers = {}
+            if body is not None:
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                headers["Content-Type"] = "application/json"
+            request = urllib.request.Request(base + path, data=data, method=scenario.method, headers=headers)
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except OSError:
+                status = 599  # connection refused / reset / timeout
+            latencies, statuses = local[scenario.name]
+            latencies.append(time.perf_counter() - t0)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        with lock:
+            for name, (latencies, statuses) in local.items():
+                results[name][0].extend(latencies)
+                for status, n in statuses.items():
+                    results[name][1][status] = results[name][1].get(status, 0) + n
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=load, args=(args.seed + i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    report = {
+        "url": base,
+        "threads": args.threads,
+        "duration_seconds": round(elapsed, 2),
+        "endpoints": {name: summarize(lat, st, elapsed) for name, (lat, st) in results.items()},
+    }
+    report["throughput_rps"] = round(sum(e["requests"] for e in report["endpoints"].values()) / elapsed, 1)
+    if args.pid:
+        try:
+            with open(f"/proc/{args.pid}/status") as f:
+                fields = dict(line.split(":", 1) for line in f)
+            report["server_peak_rss_mb"] = round(int(fields["VmHWM"].split()[0]) / 1024, 1)
+        except (OSError, KeyError):
+            report["server_peak_rss_mb"] = None
+    return report
+
+
+# -- comparison ---------------------------------------------------------------
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'size':>8}  {'endpoint':<28} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} "
+          f"{'p95 after':>10} {'p95 ratio':>9}")
+    for size, result in after.get("sizes", {}).items():
+        old = before.get("sizes", {}).get(size, {}).get("endpoints", {})
+        for name, new in result["endpoints"].items():
+            prev = old.get(name)
+            if not prev or "p95_ms" not in prev or "p95_ms" not in new:
+                continue
+            ratio = new["p95_ms"] / prev["p95_ms"] if prev["p95_ms"] else float("inf")
+            print(f"{size:>8}  {name:<28} {prev['p50_ms']:>11} {new['p50_ms']:>10} {prev['p95_ms']:>11} "
+                  f"{new['p95_ms']:>10} {ratio:>8.2f}x")
+
+
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the API routes over synthetic graphs.")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated node counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and size")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured requests per read scenario")
+    parser.add_argument("--degree", type=int, default=3)
+    parser.add_argument("--attributes", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma-separated scenario name prefixes")
+    parser.add_argument("--http-cache", action="store_true", help="keep the HTTP response cache on")
+    parser.add_argument("--http", help="base URL of a running server to load-test instead")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds, with --http")
+    parser.add_argument("--pid", type=int, help="server process id, with --http")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--output")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    if args.worker:
+        only = args.only.split(",") if args.only else None
+        print(json.dumps(worker(args.worker, args.requests, args.warmup, args.seed, only)))
+        sys.exit()
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("worker", "compare", "output")},
+        },
+    }
+    if args.http:
+        report["http"] = run_http(args)
+    else:
+        report["sizes"] = {size: run_size(int(size), args) for size in args.sizes.split(",")}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,163 @@
+# benchmarks/serialization.py
+# Bytes on the wire and encode time of the full node and relation lists,
+# per response format and compression.
+#
+# Usage (from backend/):
+#   python benchmarks/serialization.py [--nodes 10000] [--db graph.db] [--repeat 5] [--output serialization.json]
+#
+# For /api/nodes and /api/relations (the legacy full lists) the rows are
+# fetched once, then each format is encoded --repeat times from them:
+#   jsonify          dicts per row through Flask's default provider
+#                    (stdlib json, sorted keys), as the routes did before
+#   json.stdlib      serialization.rows_response with orjson switched off
+#   json             rows_response, orjson when installed
+#   json.dicts       a dict per row through serialization.dumps (orjson), as
+#                    rows_response did before it encoded from the columns
+#   columns          application/vnd.knowledge-graph.columns+json
+#   msgpack          application/msgpack (needs msgpack)
+#   columns.msgpack  application/vnd.knowledge-graph.columns+msgpack
+# and each body is compressed with gzip and brotli (if installed) at the
+# configured level. Reported: body bytes, median encode and compression
+# milliseconds, and the median time of the whole request through the test
+# client with that Accept and Accept-Encoding (HTTP cache off), which adds
+# the SQL and Flask around them. dicts_ms is the median time of building
+# the dicts per row alone, the part json skips.
+import argparse
+import gc
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import synthetic  # noqa: E402
+
+ROUTES = {
+    "nodes": ("SELECT id, title, summary, is_instance FROM nodes",
+              ("id", "label", "summary", "is_instance"), {"is_instance": bool}),
+    "relations": ("""
+        SELECT r.id, s.title, rt.name, t.title, r.modality, r.subject_quantifier, r.object_quantifier
+        FROM relations r
+        JOIN nodes s ON r.source_node_id = s.id
+        JOIN nodes t ON r.target_node_id = t.id
+        JOIN relation_types rt ON r.relation_type_id = rt.id
+    """, ("id", "source_label", "label", "target_label", "modality", "subject_quantifier",
+          "object_quantifier"), {}),
+}
+
+
+def _median_ms(fn, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        # Fetching tens of thousands of rows sets off the cyclic GC at random points otherwise
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return round(statistics.median(times) * 1000, 2), result
+
+
+def run(args):
+    import app
+    import config
+    import serialization
+    from flask.json.provider import DefaultJSONProvider
+
+    formats = {
+        "json.stdlib": serialization.JSON,
+        "json": serialization.JSON,
+        "columns": serialization.COLUMNS_JSON,
+    }
+    if serialization.msgpack is not None:
+        formats.update({"msgpack": serialization.MSGPACK, "columns.msgpack": serialization.COLUMNS_MSGPACK})
+    encodings = {"identity": None, "gzip": lambda b: gzip.compress(b, config.SERIALIZE_GZIP_LEVEL, mtime=0)}
+    if serialization.brotli is not None:
+        encodings["br"] = lambda b: serialization.brotli.compress(b, quality=config.SERIALIZE_BROTLI_QUALITY)
+
+    flask_app = app.app
+    default_provider = DefaultJSONProvider(flask_app)
+    client = flask_app.test_client()
+    results = {}
+    with app.database.connection() as conn:
+        for route, (sql, names, converters) in ROUTES.items():
+            rows = conn.execute(sql).fetchall()
+            report = results[route] = {"rows": len(rows), "formats": {}}
+
+            def dicts():
+                items = [dict(zip(names, row)) for row in rows]
+                for name, conv in converters.items():
+                    for item in items:
+                        item[name] = conv(item[name])
+                return items
+
+            def legacy():
+                items = dicts()
+                with flask_app.app_context():
+                    return default_provider.response(items).get_data()
+
+            report["dicts_ms"], _ = _median_ms(dicts, args.repeat)
+            encoders = {"jsonify": legacy, "json.dicts": lambda: serialization.dumps(dicts())}
+            for name, mimetype in ["jsonify", None], ["json.dicts", None], *formats.items():
+                config.SERIALIZE_ORJSON = name != "json.stdlib"
+                if name in encoders:
+                    encode_ms, body = _median_ms(encoders[name], args.repeat)
+                else:
+                    def encode():
+                        with flask_app.test_request_context(headers={"Accept": mimetype}):
+                            return serialization.rows_response(names, rows, converters).get_data()
+                    encode_ms, body = _median_ms(encode, args.repeat)
+                entry = report["formats"][name] = {}
+                for encoding, compress in encodings.items():
+                    compress_ms, data = _median_ms(lambda: compress(body), args.repeat) if compress else (0.0, body)
+                    # The old route answers the same whatever the Accept header
+                    headers = {"Accept": mimetype or "application/json",
+                               "Accept-Encoding": "identity" if encoding == "identity" else encoding}
+                    if name in encoders:
+                        request_ms = None
+                    else:
+                        request_ms, _ = _median_ms(lambda: client.get(f"/api/{route}", headers=headers).get_data(),
+                                                   args.repeat)
+                    entry[encoding] = {"bytes": len(data), "encode_ms": encode_ms, "compress_ms": compress_ms,
+                                       "request_ms": request_ms}
+            config.SERIALIZE_ORJSON = True
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare response formats and compression for the list routes.")
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--db", help="an existing database instead of a synthetic graph")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        graph = None
+        if db_path is None:
+            db_path = os.path.join(tmp, "graph.db")
+            graph = synthetic.build(db_path, args.nodes)
+        os.environ.update(KNOWLEDGE_DB_PATH=db_path, KNOWLEDGE_HTTP_CACHE="0",
+                          KNOWLEDGE_METRICS_SLOW_QUERY_MS="0", KNOWLEDGE_NLP_WORKERS="0")
+        os.chdir(BACKEND)
+        results = run(args)
+
+    print(f"{'route':<10} {'format':<16} {'encoding':<9} {'bytes':>10} {'encode ms':>10} {'compress ms':>12} "
+          f"{'request ms':>11}")
+    for route, report in results.items():
+        print(f"{route:<10} {'(dicts only)':<16} {'':<9} {'':>10} {report['dicts_ms']:>10}")
+        for name, entry in report["formats"].items():
+            for encoding, r in entry.items():
+                print(f"{route:<10} {name:<16} {encoding:<9} {r['bytes']:>10} {r['encode_ms']:>10} "
+                      f"{r['compress_ms']:>12} {r['request_ms'] if r['request_ms'] is not None else '-':>11}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"graph": graph, "args": {k: v for k, v in vars(args).items() if k != "output"},
+                       "routes": results}, f, indent=2)
@@ -0,0 +1,170 @@
+# benchmarks/serving.py
+# Throughput of the production server (gunicorn.conf.py) against the dev
+# server (python app.py), on one synthetic graph.
+#
+# Usage (from backend/):
+#   python benchmarks/serving.py [--nodes 10000] [--duration 20] [--threads 16]
+#                                [--servers dev,gthread,gevent] [--workers 4] [--output serving.json]
+#
+# Each server is started on its own port over the same database, waited
+# for, and loaded by the HTTP mode of api.py (the read scenarios from
+# --threads client threads for --duration seconds). The full layout and
+# the spaCy parses are skipped by default (--skip): they measure compute
+# that no server choice speeds up, and a 10k-node first layout alone would
+# take most of a short run. Reported per server:
+# requests per second, errors, the p50/p95 of the per-endpoint medians and
+# p95s, and the resident memory of the server's whole process tree after
+# the run (master and workers; shared pages are counted once per process).
+#
+#   dev      app.run(debug=True) as in app.py, minus the reloader
+#   gthread  gunicorn, --workers x SERVER_THREADS, preloaded
+#   gevent   gunicorn, --workers gevent workers, preloaded (needs gevent)
+#
+# The load generator runs on the same machine; on few cores it competes
+# with the server, so compare servers within one run, not across machines.
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import api  # noqa: E402
+import synthetic  # noqa: E402
+
+DEV_SERVER = "import app; app.app.run(debug=True, use_reloader=False, port={port})"
+
+
+def _only(args):
+    skip = tuple(p for p in (args.skip or "").split(",") if p)
+    names = [s.name for s in api.SCENARIOS
+             if not s.name.startswith(skip) and (not args.only or s.name.startswith(tuple(args.only.split(","))))]
+    return ",".join(names)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _command(server, port, workers):
+    if server == "dev":
+        return [sys.executable, "-c", DEV_SERVER.format(port=port)], {}
+    env = {
+        "KNOWLEDGE_SERVER_BIND": f"127.0.0.1:{port}",
+        "KNOWLEDGE_SERVER_WORKERS": str(workers),
+        "KNOWLEDGE_SERVER_WORKER_CLASS": server,
+    }
+    return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"], env
+
+
+def _wait(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _tree_rss_mb(pid):
+    """Resident memory of pid and its descendants, from /proc (Linux)."""
+    total = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                fields = dict(line.split(":", 1) for line in f)
+            total += int(fields["VmRSS"].split()[0])
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    pending += [int(c) for c in f.read().split()]
+        except (OSError, KeyError):
+            continue
+    return round(total / 1024, 1) if total else None
+
+
+def run_server(server, db_path, args):
+    port = _free_port()
+    command, extra = _command(server, port, args.workers)
+    env = dict(os.environ, KNOWLEDGE_DB_PATH=db_path, **extra,
+               KNOWLEDGE_HTTP_CACHE="1" if args.http_cache else "0",
+               KNOWLEDGE_METRICS_SLOW_QUERY_MS="0")
+    process = subprocess.Popen(command, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, text=True)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        if not _wait(base + "/api/changes", process):
+            process.kill()
+            return {"error": (process.communicate()[1] or "did not start")[-2000:]}
+        load = argparse.Namespace(http=base, threads=args.threads, duration=args.duration,
+                                  seed=args.seed, only=_only(args), pid=None)
+        report = api.run_http(load)
+        endpoints = [e for e in report["endpoints"].values() if "p95_ms" in e]
+        return {
+            "throughput_rps": report["throughput_rps"],
+            "requests": sum(e["requests"] for e in endpoints),
+            "errors": sum(e["errors"] for e in endpoints),
+            "p50_ms": round(statistics.median(e["p50_ms"] for e in endpoints), 3),
+            "p95_ms": round(statistics.median(e["p95_ms"] for e in endpoints), 3),
+            "rss_mb": _tree_rss_mb(process.pid),
+            "endpoints": report["endpoints"],
+        }
+    finally:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the production server with the dev server.")
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--db", help="an existing database instead of a synthetic graph")
+    parser.add_argument("--servers", default="dev,gthread,gevent")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() * 2 + 1)
+    parser.add_argument("--threads", type=int, default=16, help="client threads")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma-separated scenario name prefixes")
+    parser.add_argument("--skip", default="layout,parse", help="comma-separated scenario name prefixes")
+    parser.add_argument("--http-cache", action="store_true", help="keep the HTTP response cache on")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        graph = None
+        if db_path is None:
+            db_path = os.path.join(tmp, "graph.db")
+            graph = synthetic.build(db_path, args.nodes, seed=args.seed)
+        results = {server: run_server(server, db_path, args) for server in args.servers.split(",")}
+
+    print(f"{'server':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'rss MB':>8}")
+    for server, r in results.items():
+        if "error" in r:
+            print(f"{server:<10} failed: {r['error'].strip().splitlines()[-1]}")
+            continue
+        print(f"{server:<10} {r['throughput_rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['errors']:>7} "
+              f"{r['rss_mb']:>8}")
+    if args.output:
+        meta = {"commit": api._commit(), "cpus": os.cpu_count(), "graph": graph,
+                "args": {k: v for k, v in vars(args).items() if k != "output"}}
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "servers": results}, f, indent=2)
@@ -0,0 +1,100 @@
+# benchmarks/startup.py
+# Measures import time and resident memory of the API process, with and
+# without the spaCy model, in fresh interpreters.
+#
+# Usage (from backend/):
+#   python benchmarks/startup.py [--runs 5] [--output startup.json]
+#
+# Scenarios:
+#   crud     import app only; the model must not be loaded
+#   first    import app, then parse one summary in-process (lazy load)
+#   preload  KNOWLEDGE_NLP_PRELOAD=1: model loaded while importing app
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+first_parse = None
+if sys.argv[1] == "first":
+    import nlp_utils
+    nlp_utils.parse_summary_text("Cells are the basic units of life.")
+    first_parse = time.perf_counter() - t1
+
+def rss_mb():
+    # Current resident set size from /proc (Linux); peak RSS elsewhere.
+    try:
+        with open("/proc/self/statm") as f:
+            import os
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+import nlp_models
+print(json.dumps({
+    "import_seconds": t1 - t0,
+    "first_parse_seconds": first_parse,
+    "rss_mb": rss_mb(),
+    "model_loaded": nlp_models.is_loaded(),
+}))
+"""
+
+SCENARIOS = {
+    "crud": {"KNOWLEDGE_NLP_PRELOAD": "0"},
+    "first": {"KNOWLEDGE_NLP_PRELOAD": "0"},
+    "preload": {"KNOWLEDGE_NLP_PRELOAD": "1"},
+}
+
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    with open(os.path.join(BACKEND, "db", "schema.sql")) as f:
+        conn.executescript(f.read())
+    conn.close()
+
+
+def run(scenario, db_path):
+    env = dict(os.environ, KNOWLEDGE_DB_PATH=db_path, KNOWLEDGE_NLP_WORKERS="0", **SCENARIOS[scenario])
+    out = subprocess.run([sys.executable, "-c", CHILD, scenario], cwd=BACKEND, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    result = {"model_loaded": samples[0]["model_loaded"]}
+    for key in ("import_seconds", "first_parse_seconds", "rss_mb"):
+        values = [s[key] for s in samples if s[key] is not None]
+        if values:
+            result[key] = {"median": round(statistics.median(values), 3),
+                           "min": round(min(values), 3), "max": round(max(values), 3)}
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API startup time and memory.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "graph.db")
+        make_db(db_path)
+        report = {name: summarize([run(name, db_path) for _ in range(args.runs)]) for name in SCENARIOS}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
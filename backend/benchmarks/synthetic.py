@@ -0,0 +1,146 @@
+# benchmarks/synthetic.py
+# Synthetic knowledge graphs of any size, for the benchmarks.
+#
+# The shapes follow db/schema.sql and db/sample-data.sql: short titles with
+# a sentence of summary built from the sample vocabulary, edges over the
+# relation types seeded by schema.sql, and values for its attributes (plus
+# the string and date attributes of the sample data), so the typed
+# attribute queries have something to range over.
+#
+# Every node except the first gets one "is_a" parent among the earlier
+# nodes, so "is_a" forms a random recursive tree (depth ~ ln n, like a real
+# taxonomy). The remaining edges use the non-transitive types and pick
+# their targets by preferential attachment, which gives the few heavily
+# linked hubs a real graph has.
+#
+# Usage (from backend/):
+#   python benchmarks/synthetic.py graph.db --nodes 10000 [--degree 3] [--attributes 2] [--seed 0]
+#
+# The database is created from db/schema.sql; the app's migrations run the
+# first time it is opened (KNOWLEDGE_DB_PATH=graph.db python app.py).
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Added to the attributes schema.sql seeds, as in db/sample-data.sql
+EXTRA_ATTRIBUTES = [
+    ("size", "size property", "string", "small,medium,large", ""),
+    ("date of birth", "date of birth", "date", "", ""),
+]
+
+VALUES = {
+    "float": lambda rng, allowed: f"{rng.lognormvariate(0, 3):.4g}",
+    "integer": lambda rng, allowed: str(rng.randint(0, 10000)),
+    "string": lambda rng, allowed: rng.choice(allowed.split(",")) if allowed else "x",
+    "date": lambda rng, allowed: f"{rng.randint(1500, 2000)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+    "boolean": lambda rng, allowed: rng.choice(["true", "false"]),
+}
+
+_QUOTED_RE = re.compile(r"'((?:[^']|'')*)'")
+_WORD_RE = re.compile(r"[a-z]{4,}")
+
+
+def vocabulary():
+    """Distinct words of four letters or more from the sample summaries."""
+    with open(os.path.join(BACKEND, "db", "sample-data.sql")) as f:
+        rows = [line for line in f if line.startswith("INSERT INTO pages")]
+    text = " ".join(s for line in rows for s in _QUOTED_RE.findall(line))
+    return sorted(set(_WORD_RE.findall(text.lower())))
+
+
+def _summary(rng, words, title, parent):
+    tail = " ".join(rng.choice(words) for _ in range(rng.randint(6, 16)))
+    return f"{title} is a kind of {parent} that {tail}."
+
+
+def build(path, nodes, degree=3, attributes=2, seed=0):
+    """Create the database at path and fill it; returns row counts and timing."""
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    words = vocabulary()
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(path)
+    with open(os.path.join(BACKEND, "db", "schema.sql")) as f:
+        conn.executescript(f.read())
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(attributes)")]
+    if "applicable_nodes" not in columns:
+        # Read and written by the attribute routes but missing from schema.sql
+        conn.execute("ALTER TABLE attributes ADD COLUMN applicable_nodes TEXT")
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO attributes (name, description, data_type, allowed_values, unit) "
+        "VALUES (?, ?, ?, ?, ?)",
+        EXTRA_ATTRIBUTES,
+    )
+    types = conn.execute("SELECT id, name, is_transitive FROM relation_types").fetchall()
+    attrs = conn.execute("SELECT id, data_type, allowed_values FROM attributes").fetchall()
+    attrs = [a for a in attrs if a[1] in VALUES]
+
+    titles = []
+    seen = set()
+    node_rows = []
+    for node_id in range(1, nodes + 1):
+        title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 3))).capitalize()
+        qualifier = None
+        if title.lower() in seen:
+            qualifier = f"sense {node_id}"  # (title, qualifier) is unique
+        seen.add(title.lower())
+        titles.append(title)
+        parent = titles[rng.randrange(node_id - 1)] if node_id > 1 else "thing"
+        node_rows.append((node_id, title, qualifier, _summary(rng, words, title, parent), int(rng.random() < 0.2)))
+    conn.executemany("INSERT INTO nodes (id, title, qualifier, summary, is_instance) VALUES (?, ?, ?, ?, ?)",
+                     node_rows)
+
+    edges = set()
+    endpoints = []
+    is_a = next(t[0] for t in types if t[1] == "is_a")
+    for node_id in range(2, nodes + 1):
+        parent = rng.randrange(1, node_id)
+        edges.add((node_id, parent, is_a))
+        endpoints += (node_id, parent)
+    # Extra edges of transitive types would inflate the closure tables
+    others = [t[0] for t in types if str(t[2]).lower() not in ("1", "yes", "true")]
+    for _ in range(max(0, degree - 1) * nodes if nodes > 1 else 0):
+        source = rng.randint(1, nodes)
+        target = rng.choice(endpoints) if endpoints and rng.random() < 0.8 else rng.randint(1, nodes)
+        if source != target:
+            edges.add((source, target, rng.choice(others)))
+            endpoints += (source, target)
+    conn.executemany("INSERT INTO relations (source_node_id, target_node_id, relation_type_id) VALUES (?, ?, ?)",
+                     sorted(edges))
+
+    value_rows = []
+    for node_id in range(1, nodes + 1):
+        for attr_id, data_type, allowed in rng.sample(attrs, min(attributes, len(attrs))):
+            value_rows.append((node_id, attr_id, VALUES[data_type](rng, allowed)))
+    conn.executemany("INSERT INTO node_attributes (node_id, attribute_id, value) VALUES (?, ?, ?)", value_rows)
+    conn.commit()
+    conn.close()
+    return {
+        "nodes": nodes,
+        "relations": len(edges),
+        "node_attributes": len(value_rows),
+        "build_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic knowledge graph database.")
+    parser.add_argument("path")
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--degree", type=int, default=3, help="average outgoing relations per node")
+    parser.add_argument("--attributes", type=int, default=2, help="attribute values per node")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        print(build(args.path, args.nodes, args.degree, args.attributes, args.seed))
+    except FileExistsError:
+        sys.exit(f"{args.path} already exists")
@@ -0,0 +1,398 @@
+# bulk_import.py
+# Streaming bulk loader for nodes, relations, relation types, attributes and
+# node attributes from CSV or NDJSON.
+#
+# Each import runs in one transaction: rows are read incrementally, resolved
+# against in-memory lookup maps (node title -> id, type name -> id, existing
+# edges), deduplicated, and written with executemany in batches. For large
+# relation loads the secondary indexes on relations are dropped first and
+# rebuilt once at the end, which is much cheaper than maintaining them row
+# by row.
+#
+# Usage:
+#   python bulk_import.py relation_types db/relations.csv
+#   python bulk_import.py relations edges.ndjson --format ndjson --create-missing
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+
+import closure
+import config
+import database
+import graph_index
+from validation import typed_value, validate_attribute_value
+
+KINDS = ("nodes", "relations", "relation_types", "attributes", "node_attributes")
+FORMATS = ("csv", "ndjson")
+MAX_REPORTED_ERRORS = 100
+
+
+class RowError(Exception):
+    pass
+
+
+def read_records(stream, fmt):
+    """Yield (line_number, dict) from a text stream without loading it whole."""
+    if fmt == "ndjson":
+        for line_no, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, RowError(f"invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield line_no, RowError("expected a JSON object")
+                continue
+            yield line_no, record
+    elif fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            if None in record:
+                yield reader.line_num, RowError("too many columns")
+                continue
+            yield reader.line_num, record
+    else:
+        raise ValueError(f"Unknown format '{fmt}'")
+
+
+def _text(record, *names):
+    for name in names:
+        value = record.get(name)
+        if value is not None and str(value).strip() != "":
+            return str(value).strip()
+    return None
+
+
+def _bool(value):
+    return int(str(value).strip().lower() in ("1", "yes", "true")) if value is not None else 0
+
+
+class Importer:
+    def __init__(self, conn, batch_size=None, create_missing=False, defer_indexes=None):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.batch_size = batch_size or config.IMPORT_BATCH_SIZE
+        self.create_missing = create_missing
+        self.defer_indexes = defer_indexes
+        self.report = {"read": 0, "inserted": 0, "duplicates": 0, "rejected": 0,
+                       "created_nodes": 0, "errors": []}
+        self._node_ids = None
+        self._known_ids = None  # every node id, existing or created by this import
+        self._next_node_id = None
+
+    # -- lookup maps -------------------------------------------------------
+
+    def _load_nodes(self):
+        if self._node_ids is None:
+            self._node_ids = {}
+            self._known_ids = set()
+            self.cur.execute("SELECT id, title FROM nodes")
+            for node_id, title in self.cur.fetchall():
+                self._node_ids.setdefault(title.lower(), node_id)
+                self._known_ids.add(node_id)
+            self.cur.execute("SELECT COALESCE(MAX(id), 0) FROM nodes")
+            self._next_node_id = self.cur.fetchone()[0] + 1
+        return self._node_ids
+
+    def _name_map(self, table, column):
+        self.cur.execute(f"SELECT id, {column} FROM {table}")
+        return {name.lower(): row_id for row_id, name in self.cur.fetchall() if name}
+
+    def _resolve_node(self, record, id_field, title_field, pending):
+        node_id = _text(record, id_field)
+        if node_id is not None:
+            if not node_id.isdigit():
+                raise RowError(f"{id_field} must be an integer")
+            self._load_nodes()
+            if int(node_id) not in self._known_ids:
+                raise RowError(f"unknown node id {node_id}")
+            return int(node_id)
+        title = _text(record, title_field)
+        if title is None:
+            raise RowError(f"{title_field} or {id_field} is required")
+        nodes = self._load_nodes()
+        found = nodes.get(title.lower())
+        if found is not None:
+            return found
+        if not self.create_missing:
+            raise RowError(f"unknown node '{title}'")
+        node_id = self._next_node_id
+        self._next_node_id += 1
+        nodes[title.lower()] = node_id
+        self._known_ids.add(node_id)
+        pending.append((node_id, title))
+        return node_id
+
+    # -- helpers -----------------------------------------------------------
+
+    def _reject(self, line_no, reason):
+        self.report["rejected"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"line": line_no, "error": str(reason)})
+
+    def _flush(self, sql, batch, counter="inserted"):
+        if batch:
+            self.cur.executemany(sql, batch)
+            self.report[counter] += len(batch)
+            batch.clear()
+
+    def _drop_indexes(self, table):
+        # Remember each index's DDL so it can be recreated verbatim afterwards.
+        self.cur.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+            (table,),
+        )
+        indexes = self.cur.fetchall()
+        for name, _ in indexes:
+            self.cur.execute(f'DROP INDEX "{name}"')
+        return indexes
+
+    def _restore_indexes(self, indexes):
+        for _, sql in indexes:
+            self.cur.execute(sql)
+
+    # -- importers ---------------------------------------------------------
+
+    def import_nodes(self, records):
+        nodes = self._load_nodes()
+        batch = []
+        sql = "INSERT INTO nodes (id, title, qualifier, summary, is_instance) VALUES (?, ?, ?, ?, ?)"
+        for line_no, record in records:
+            self.report["read"] += 1
+            if isinstance(record, RowError):
+                self._reject(line_no, record)
+                continue
+            title = _text(record, "title", "label")
+            if title is None:
+                self._reject(line_no, "title is required")
+                continue
+            if title.lower() in nodes:
+                self.report["duplicates"] += 1
+                continue
+            node_id = self._next_node_id
+            self._next_node_id += 1
+            nodes[title.lower()] = node_id
+            self._known_ids.add(node_id)
+            batch.append((node_id, title, _text(record, "qualifier"), _text(record, "summary"),
+                          _bool(record.get("is_instance"))))
+            if len(batch) >= self.batch_size:
+                self._flush(sql, batch)
+        self._flush(sql, batch)
+
+    def import_relations(self, records):
+        self._load_nodes()
+        type_ids = self._name_map("relation_types", "name")
+        self.cur.execute("SELECT id FROM relation_types")
+        known_types = {r[0] for r in self.cur.fetchall()}
+        self.cur.execute("SELECT source_node_id, target_node_id, relation_type_id FROM relations")
+        existing = set(self.cur.fetchall())
+
+        defer = config.IMPORT_DEFER_INDEXES if self.defer_indexes is None else self.defer_indexes
+        dropped = self._drop_indexes("relations") if defer else []
+
+        touched_types = set()
+        batch, new_nodes = [], []
+        node_sql = "INSERT INTO nodes (id, title) VALUES (?, ?)"
+        sql = ("INSERT INTO relations (source_node_id, target_node_id, relation_type_id, modality, "
+               "subject_quantifier, object_quantifier) VALUES (?, ?, ?, ?, ?, ?)")
+        for line_no, record in records:
+            self.report["read"] += 1
+            if isinstance(record, RowError):
+                self._reject(line_no, record)
+                continue
+            try:
+                type_id = _text(record, "relation_type_id")
+                if type_id is not None:
+                    if not type_id.isdigit():
+                        raise RowError("relation_type_id must be an integer")
+                    if int(type_id) not in known_types:
+                        raise RowError(f"unknown relation_type_id {type_id}")
+                    type_id = int(type_id)
+                else:
+                    name = _text(record, "relation", "label", "relation_type")
+                    if name is None:
+                        raise RowError("relation or relation_type_id is required")
+                    type_id = type_ids.get(name.lower())
+                    if type_id is None:
+                        raise RowError(f"unknown relation type '{name}'")
+                source = self._resolve_node(record, "source_id", "source", new_nodes)
+                target = self._resolve_node(record, "target_id", "target", new_nodes)
+            except RowError as e:
+                self._reject(line_no, e)
+                continue
+            key = (source, target, type_id)
+            if key in existing:
+                self.report["duplicates"] += 1
+                continue
+            existing.add(key)
+            touched_types.add(type_id)
+            batch.append(key + (_text(record, "modality"), _text(record, "subject_quantifier"),
+                                _text(record, "object_quantifier")))
+            if len(batch) >= self.batch_size:
+                self._flush(node_sql, new_nodes, "created_nodes")
+                self._flush(sql, batch)
+        self._flush(node_sql, new_nodes, "created_nodes")
+        self._flush(sql, batch)
+
+        self._restore_indexes(dropped)
+        if touched_types:
+            closure.rebuild_types(self.conn, touched_types)
+            # Not announced to graph_index, so it sees a foreign write and rebuilds.
+            database.bump_version(self.conn, graph_index.VERSION_KEY)
+
+    def import_relation_types(self, records):
+        names = self._name_map("relation_types", "name")
+        batch, created = [], []
+        sql = ("INSERT INTO relation_types (name, inverse_name, is_symmetric, is_transitive, description) "
+               "VALUES (?, ?, ?, ?, ?)")
+        for line_no, record in records:
+            self.report["read"] += 1
+            if isinstance(record, RowError):
+                self._reject(line_no, record)
+                continue
+            name = _text(record, "name")
+            if name is None:
+                self._reject(line_no, "name is required")
+                continue
+            if name.lower() in names:
+                self.report["duplicates"] += 1
+                continue
+            names[name.lower()] = None
+            created.append(name)
+            batch.append((name, _text(record, "inverse_name") or "",
+                          _bool(record.get("symmetric", record.get("is_symmetric"))),
+                          _bool(record.get("transitive", record.get("is_transitive"))),
+                          _text(record, "description")))
+            if len(batch) >= self.batch_size:
+                self._flush(sql, batch)
+        self._flush(sql, batch)
+        if created:
+            ids = self._name_map("relation_types", "name")
+            closure.rebuild_types(self.conn, {ids[n.lower()] for n in created})
+
+    def import_attributes(self, records):
+        names = self._name_map("attributes", "name")
+        batch = []
+        sql = ("INSERT INTO attributes (name, description, data_type, allowed_values, unit) "
+               "VALUES (?, ?, ?, ?, ?)")
+        for line_no, record in records:
+            self.report["read"] += 1
+            if isinstance(record, RowError):
+                self._reject(line_no, record)
+                continue
+            name = _text(record, "name")
+            data_type = _text(record, "data_type", "datatype")
+            if name is None or data_type is None:
+                self._reject(line_no, "name and data_type are required")
+                continue
+            if name.lower() in names:
+                self.report["duplicates"] += 1
+                continue
+            names[name.lower()] = None
+            batch.append((name, _text(record, "description") or "", data_type,
+                          _text(record, "allowed_values") or "", _text(record, "unit") or ""))
+            if len(batch) >= self.batch_size:
+                self._flush(sql, batch)
+        self._flush(sql, batch)
+
+    def import_node_attributes(self, records):
+        self._load_nodes()
+        self.cur.execute("SELECT id, name, data_type, allowed_values FROM attributes")
+        attributes = {}
+        for attr_id, name, data_type, allowed in self.cur.fetchall():
+            attributes[str(attr_id)] = attributes[name.lower()] = (attr_id, data_type, allowed)
+        self.cur.execute("SELECT node_id, attribute_id, value FROM node_attributes")
+        existing = set(self.cur.fetchall())
+        batch, new_nodes = [], []
+        node_sql = "INSERT INTO nodes (id, title) VALUES (?, ?)"
+        sql = ("INSERT INTO node_attributes (node_id, attribute_id, value, quantifier, value_num) "
+               "VALUES (?, ?, ?, ?, ?)")
+        for line_no, record in records:
+            self.report["read"] += 1
+            if isinstance(record, RowError):
+                self._reject(line_no, record)
+                continue
+            try:
+                node_id = self._resolve_node(record, "node_id", "node", new_nodes)
+                key = _text(record, "attribute_id", "attribute")
+                if key is None:
+                    raise RowError("attribute or attribute_id is required")
+                attr = attributes.get(key.lower())
+                if attr is None:
+                    raise RowError(f"unknown attribute '{key}'")
+                value = _text(record, "value") or ""
+                if not validate_attribute_value(attr[1], value, attr[2]):
+                    raise RowError(f"invalid value for data_type '{attr[1]}'")
+            except RowError as e:
+                self._reject(line_no, e)
+                continue
+            if (node_id, attr[0], value) in existing:
+                self.report["duplicates"] += 1
+                continue
+            existing.add((node_id, attr[0], value))
+            batch.append((node_id, attr[0], value, _text(record, "quantifier"), typed_value(attr[1], value)))
+            if len(batch) >= self.batch_size:
+                self._flush(node_sql, new_nodes, "created_nodes")
+                self._flush(sql, batch)
+        self._flush(node_sql, new_nodes, "created_nodes")
+        self._flush(sql, batch)
+
+
+def run_import(conn, kind, stream, fmt="csv", **options):
+    """Import one stream in a single transaction and return the report."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind '{kind}'. Use one of: {', '.join(KINDS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    started = time.perf_counter()
+    importer = Importer(conn, **options)
+    if not conn.in_transaction:
+        # Take the write lock up front so the lookup maps can't go stale mid-import
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        getattr(importer, f"import_{kind}")(read_records(stream, fmt))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    elapsed = time.perf_counter() - started
+    report = importer.report
+    report.update({
+        "kind": kind,
+        "format": fmt,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(report["read"] / elapsed, 1) if elapsed > 0 else None,
+    })
+    return report
+
+
+def text_stream(binary):
+    return io.TextIOWrapper(binary, encoding="utf-8", newline="")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import CSV/NDJSON into the knowledge graph.")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--create-missing", action="store_true",
+                        help="create nodes for unknown titles instead of rejecting the row")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--keep-indexes", action="store_true",
+                        help="maintain relation indexes row by row instead of rebuilding them at the end")
+    parser.add_argument("--db", default=config.DB_PATH)
+    args = parser.parse_args()
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8", newline="")
+    with source, database.connection(args.db) as conn:
+        result = run_import(conn, args.kind, source, fmt,
+                            create_missing=args.create_missing, batch_size=args.batch_size,
+                            defer_indexes=False if args.keep_indexes else None)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,308 @@
+# changes.py
+# Change log behind /api/changes and its Server-Sent Events stream.
+#
+# Triggers on nodes, relations, relation_types, attributes and
+# node_attributes (migration 12) bump the graph revision from http_cache and
+# append (rev, table, op, row_id) to change_log in the same statement, so
+# change_log.rev is exactly the revision a client sees in ETags and can pass
+# back as ?since=.
+#
+# A delta is built by collapsing the log entries after `since` to the last
+# operation per row and reading the current state of the rows that still
+# exist. Compaction
+#   - drops entries superseded by a later entry for the same row, which
+#     changes no delta, and
+#   - truncates entries older than CHANGELOG_MAX_ROWS revisions or
+#     CHANGELOG_MAX_AGE seconds, recording the cut in graph_versions; a
+#     client asking for changes from before the cut must resync.
+import json
+import threading
+import time
+
+import config
+import database
+import http_cache
+
+TRUNCATED_KEY = "changes.truncated"  # highest revision removed by truncation
+
+TABLES = ("nodes", "relations", "relation_types", "attributes", "node_attributes")
+
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+# table -> (SELECT over rows with the given ids, row -> dict); shapes match the list routes
+_ROWS = {
+    "nodes": (
+        "SELECT id, title, summary, is_instance, qualifier FROM nodes WHERE id IN ({})",
+        lambda r: {"id": r[0], "label": r[1], "summary": r[2], "is_instance": bool(r[3]), "qualifier": r[4]},
+    ),
+    "relations": (
+        """SELECT r.id, s.title, rt.name, t.title, r.modality, r.subject_quantifier, r.object_quantifier,
+                  r.source_node_id, r.target_node_id, r.relation_type_id
+           FROM relations r
+           JOIN nodes s ON r.source_node_id = s.id
+           JOIN nodes t ON r.target_node_id = t.id
+           JOIN relation_types rt ON r.relation_type_id = rt.id
+           WHERE r.id IN ({})""",
+        lambda r: {"id": r[0], "source_label": r[1], "label": r[2], "target_label": r[3], "modality": r[4],
+                   "subject_quantifier": r[5], "object_quantifier": r[6], "source": r[7], "target": r[8],
+                   "relation_type_id": r[9]},
+    ),
+    "relation_types": (
+        "SELECT id, name, inverse_name, is_symmetric, is_transitive FROM relation_types WHERE id IN ({})",
+        lambda r: {"id": r[0], "name": r[1], "inverse_name": r[2], "symmetric": bool(r[3]),
+                   "transitive": bool(r[4])},
+    ),
+    "attributes": (
+        "SELECT id, name, description, data_type, allowed_values, unit, applicable_nodes "
+        "FROM attributes WHERE id IN ({})",
+        lambda r: {"id": r[0], "name": r[1], "description": r[2], "data_type": r[3], "allowed_values": r[4],
+                   "unit": r[5], "applicable_nodes": json.loads(r[6]) if r[6] else []},
+    ),
+    "node_attributes": (
+        "SELECT id, node_id, attribute_id, value, modality, quantifier FROM node_attributes WHERE id IN ({})",
+        lambda r: {"id": r[0], "node_id": r[1], "attribute_id": r[2], "value": r[3], "modality": r[4],
+                   "quantifier": r[5]},
+    ),
+}
+
+
+def install(conn):
+    """Create change_log and fold the revision bump into one trigger per table and event."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS change_log ("
+        " rev INTEGER PRIMARY KEY,"
+        " tbl TEXT NOT NULL,"
+        " op TEXT NOT NULL,"
+        " row_id INTEGER NOT NULL,"
+        " changed_at REAL NOT NULL"
+        ")"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(tbl, row_id, rev)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_time ON change_log(changed_at)")
+    for table in TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            ref = "old" if event == "DELETE" else "new"
+            # The order of two triggers on one event is unspecified; a single
+            # trigger guarantees the log row carries the bumped revision.
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_revision_{event.lower()}")
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE graph_versions SET version = version + 1, updated_at = {_NOW}
+                    WHERE name = '{http_cache.REVISION_KEY}';
+                    INSERT INTO change_log (rev, tbl, op, row_id, changed_at)
+                    SELECT version, '{table}', '{event.lower()}', {ref}.id, updated_at
+                    FROM graph_versions WHERE name = '{http_cache.REVISION_KEY}';
+                END
+            """)
+
+
+class ResyncRequired(Exception):
+    def __init__(self, revision):
+        super().__init__(f"Changes before revision {revision} are no longer available")
+        self.revision = revision
+
+
+def _rows(cur, table, ids):
+    sql, convert = _ROWS[table]
+    found = []
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cur.execute(sql.format(",".join("?" * len(chunk))), chunk)
+        found.extend(convert(r) for r in cur.fetchall())
+    return found
+
+
+def changes_since(conn, since, limit=None):
+    """Delta from revision `since` to at most `limit` log entries later.
+
+    Returns {"since", "revision", "more", "changes": {table: {"upserted": [...],
+    "deleted": [ids]}}}; "revision" is the value to pass as the next since.
+    Raises ResyncRequired when the log no longer reaches back to since.
+    With since=None only the current revision is returned.
+    """
+    limit = limit or config.CHANGELOG_PAGE_SIZE
+    current, _ = http_cache.current(conn)
+    if since is None:
+        # Bootstrap: nothing to send, just the revision to start from
+        return {"since": None, "revision": current, "more": False, "changes": {}}
+    if since > current or since < database.get_version(conn, TRUNCATED_KEY):
+        raise ResyncRequired(current)
+    cur = conn.cursor()
+    cur.execute("SELECT rev, tbl, op, row_id FROM change_log WHERE rev > ? ORDER BY rev LIMIT ?",
+                (since, limit + 1))
+    entries = cur.fetchall()
+    more = len(entries) > limit
+    entries = entries[:limit]
+    last = {}
+    for rev, table, op, row_id in entries:
+        last[(table, row_id)] = op
+    changes = {}
+    for (table, row_id), op in last.items():
+        delta = changes.setdefault(table, {"upserted": [], "deleted": []})
+        delta["deleted" if op == "delete" else "upserted"].append(row_id)
+    for table, delta in changes.items():
+        # A row updated here may have been deleted by a later, unread entry;
+        # it then simply drops out and the delete arrives on the next page.
+        delta["upserted"] = _rows(cur, table, delta["upserted"])
+    return {
+        "since": since,
+        "revision": entries[-1][0] if more else current,
+        "more": more,
+        "changes": changes,
+    }
+
+
+def compact(conn, max_rows=None, max_age=None):
+    """Drop superseded and expired entries; commits. Returns the number removed."""
+    max_rows = config.CHANGELOG_MAX_ROWS if max_rows is None else max_rows
+    max_age = config.CHANGELOG_MAX_AGE if max_age is None else max_age
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM change_log WHERE rev < (
+            SELECT MAX(later.rev) FROM change_log later
+            WHERE later.tbl = change_log.tbl AND later.row_id = change_log.row_id
+        )
+    """)
+    removed = cur.rowcount
+    current, _ = http_cache.current(conn)
+    cutoff = current - max_rows
+    cur.execute("SELECT MAX(rev) FROM change_log WHERE changed_at < ?", (time.time() - max_age,))
+    expired = cur.fetchone()[0]
+    if expired is not None:
+        cutoff = max(cutoff, expired)
+    if cutoff > database.get_version(conn, TRUNCATED_KEY):
+        cur.execute("DELETE FROM change_log WHERE rev <= ?", (cutoff,))
+        removed += cur.rowcount
+        cur.execute(
+            "INSERT INTO graph_versions (name, version) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET version = excluded.version",
+            (TRUNCATED_KEY, cutoff),
+        )
+    conn.commit()
+    return removed
+
+
+_last_compaction = 0.0
+_compaction_lock = threading.Lock()
+
+
+def maybe_compact():
+    """Compact at most once per CHANGELOG_COMPACT_EVERY seconds in this process."""
+    global _last_compaction
+    if not _compaction_lock.acquire(blocking=False):
+        return
+    try:
+        if time.time() - _last_compaction < config.CHANGELOG_COMPACT_EVERY:
+            return
+        _last_compaction = time.time()
+        with database.connection() as conn:
+            compact(conn)
+    finally:
+        _compaction_lock.release()
+
+
+# -- push -------------------------------------------------------------------
+
+class Broadcaster:
+    """One polling thread per process, shared by every SSE client.
+
+    The thread checks the revision every CHANGES_POLL_INTERVAL seconds.
+    When it moves, the delta from the previous revision is built once and
+    handed to every subscriber that was up to date; a subscriber that fell
+    behind builds its own.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._thread = None
+        self._subscribers = 0
+        self._revision = None
+        self._latest = None  # (from_rev, delta)
+
+    def _ensure_thread(self):
+        # caller holds self._cond
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._poll, name="changes-broadcaster", daemon=True)
+            self._thread.start()
+
+    def _poll(self):
+        while True:
+            with self._cond:
+                if not self._subscribers:
+                    self._thread = None
+                    self._revision = self._latest = None
+                    return
+            try:
+                with database.connection() as conn:
+                    revision, _ = http_cache.current(conn)
+                    if self._revision is not None and revision != self._revision:
+                        try:
+                            delta = changes_since(conn, self._revision)
+                        except ResyncRequired:
+                            delta = None
+                        with self._cond:
+                            self._latest = (self._revision, delta)
+                            self._revision = delta["revision"] if delta else revision
+                            self._cond.notify_all()
+                    elif self._revision is None:
+                        with self._cond:
+                            self._revision = revision
+            except Exception:
+                pass  # transient (e.g. database busy); try again next tick
+            time.sleep(self.interval)
+
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            self._ensure_thread()
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def wait(self, since, timeout):
+        """Delta after since, or None when nothing changed within timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._revision is not None and self._revision != since, timeout)
+            latest = self._latest
+            if self._revision is None or self._revision == since:
+                return None
+        if latest is not None and latest[0] == since and latest[1] is not None:
+            return latest[1]
+        with database.connection() as conn:
+            return changes_since(conn, since)
+
+
+broadcaster = Broadcaster(config.CHANGES_POLL_INTERVAL)
+
+
+def _event(name, data, event_id=None):
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data))
+    return "\n".join(lines) + "\n\n"
+
+
+def stream(since):
+    """Generator of SSE messages; ends after sending a resync event."""
+    broadcaster.subscribe()
+    try:
+        if since is None:
+            with database.connection() as conn:
+                since, _ = http_cache.current(conn)
+        yield f"retry: {int(config.CHANGES_POLL_INTERVAL * 2000)}\n\n"
+        while True:
+            try:
+                delta = broadcaster.wait(since, config.CHANGES_HEARTBEAT)
+            except ResyncRequired as e:
+                yield _event("resync", {"resync_required": True, "revision": e.revision})
+                return
+            if delta is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield _event("changes", delta, delta["revision"])
+            since = delta["revision"]
+    finally:
+        broadcaster.unsubscribe()
@@ -0,0 +1,251 @@
+# closure.py
+# Materialized transitive closure for relation types flagged is_transitive.
+#
+# Relation types are grouped into families: a type and the type named by its
+# inverse_name (when the two name each other). Each family is stored once,
+# under its canonical type (the lower id), so "A is_a B" and
+# "B is_a_type_of A" both become the canonical edge A -> B. Symmetric
+# families store every edge in both directions.
+#
+# relation_closure holds one row per reachable (source, target) pair with the
+# shortest path length. It is maintained in the caller's transaction:
+#   - edge_added():   ancestors(a)+{a}  x  descendants(b)+{b}  are upserted
+#   - edge_removed(): only sources that could reach the edge are re-derived
+# so neither path touches pairs the edit cannot affect.
+from collections import deque
+
+TRUTHY = {"1", "yes", "true"}
+
+
+def _flag(value):
+    # relation_types flags hold 0/1 from the API but 'yes'/'no' from db/schema.sql
+    return str(value).strip().lower() in TRUTHY
+
+
+class Family:
+    __slots__ = ("canonical", "partner", "symmetric", "transitive")
+
+    def __init__(self, canonical, partner, symmetric, transitive):
+        self.canonical = canonical
+        self.partner = partner
+        self.symmetric = symmetric
+        self.transitive = transitive
+
+    @property
+    def type_ids(self):
+        return {self.canonical} | ({self.partner} if self.partner is not None else set())
+
+
+def _load_types(cur):
+    cur.execute("SELECT id, name, inverse_name, is_symmetric, is_transitive FROM relation_types")
+    return {r[0]: r for r in cur.fetchall()}
+
+
+def _family_from(types, type_id):
+    row = types.get(type_id)
+    if row is None:
+        return None
+    _, name, inverse_name, symmetric, transitive = row
+    partner = None
+    if inverse_name and inverse_name.strip().lower() != (name or "").lower():
+        for other in types.values():
+            if (other[0] != type_id and (other[1] or "").lower() == inverse_name.strip().lower()
+                    and (other[2] or "").strip().lower() == (name or "").lower()):
+                partner = other
+                break
+    if partner is None:
+        return Family(type_id, None, _flag(symmetric), _flag(transitive))
+    canonical, other = (type_id, partner[0]) if type_id < partner[0] else (partner[0], type_id)
+    return Family(
+        canonical, other,
+        _flag(symmetric) or _flag(partner[3]),
+        _flag(transitive) or _flag(partner[4]),
+    )
+
+
+def family(cur, type_id):
+    return _family_from(_load_types(cur), type_id)
+
+
+def find_type(cur, names):
+    """Id of the first relation type matching any of names (case-insensitive)."""
+    for name in names:
+        cur.execute("SELECT id FROM relation_types WHERE LOWER(name)=?", (name.lower(),))
+        row = cur.fetchone()
+        if row:
+            return row[0]
+    return None
+
+
+def _orient(fam, source, target, type_id):
+    """Canonical edges implied by one stored relation."""
+    edge = (source, target) if type_id == fam.canonical else (target, source)
+    return [edge, edge[::-1]] if fam.symmetric else [edge]
+
+
+def _step(cur, type_id, node_id, backwards):
+    if backwards:
+        cur.execute("SELECT source_node_id FROM relations WHERE target_node_id=? AND relation_type_id=?",
+                    (node_id, type_id))
+    else:
+        cur.execute("SELECT target_node_id FROM relations WHERE source_node_id=? AND relation_type_id=?",
+                    (node_id, type_id))
+    return {r[0] for r in cur.fetchall()}
+
+
+def _successors(cur, fam, node_id, reverse=False):
+    # Canonical neighbours of node_id, straight from the relations table.
+    result = set()
+    for backwards in ((False, True) if fam.symmetric else (reverse,)):
+        result |= _step(cur, fam.canonical, node_id, backwards)
+        if fam.partner is not None:
+            result |= _step(cur, fam.partner, node_id, not backwards)
+    return result
+
+
+def _bfs(successors, start):
+    depths = {}
+    queue = deque([(start, 0)])
+    seen = {start}
+    while queue:
+        node, depth = queue.popleft()
+        for nxt in successors(node):
+            if nxt not in seen:
+                seen.add(nxt)
+                depths[nxt] = depth + 1
+                queue.append((nxt, depth + 1))
+    return depths
+
+
+_INSERT = (
+    "INSERT INTO relation_closure (relation_type_id, source_node_id, target_node_id, depth) "
+    "VALUES (?, ?, ?, ?)"
+)
+
+
+def _rebuild_family(cur, fam):
+    cur.execute("DELETE FROM relation_closure WHERE relation_type_id=?", (fam.canonical,))
+    if not fam.transitive:
+        return
+    adjacency = {}
+    cur.execute("SELECT source_node_id, target_node_id, relation_type_id FROM relations "
+                "WHERE relation_type_id IN (?, ?)", (fam.canonical, fam.partner if fam.partner is not None else -1))
+    for source, target, type_id in cur.fetchall():
+        for a, b in _orient(fam, source, target, type_id):
+            adjacency.setdefault(a, set()).add(b)
+    for start in list(adjacency):
+        depths = _bfs(lambda n: adjacency.get(n, ()), start)
+        cur.executemany(_INSERT, [(fam.canonical, start, t, d) for t, d in depths.items() if t != start])
+
+
+def rebuild_types(conn, type_ids):
+    """Re-derive closure rows for every family touching type_ids.
+
+    Used when relation types are created, edited or deleted, since that can
+    change inverse pairings or the transitive/symmetric flags.
+    """
+    cur = conn.cursor()
+    types = _load_types(cur)
+    for type_id in type_ids:
+        cur.execute("DELETE FROM relation_closure WHERE relation_type_id=?", (type_id,))
+    done = set()
+    for type_id in type_ids:
+        fam = _family_from(types, type_id)
+        if fam is not None and fam.canonical not in done:
+            done.add(fam.canonical)
+            _rebuild_family(cur, fam)
+
+
+def rebuild_all(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM relation_closure")
+    types = _load_types(cur)
+    done = set()
+    for type_id in types:
+        fam = _family_from(types, type_id)
+        if fam.canonical not in done:
+            done.add(fam.canonical)
+            _rebuild_family(cur, fam)
+
+
+def edge_added(conn, source, target, type_id):
+    cur = conn.cursor()
+    fam = family(cur, type_id)
+    if fam is None or not fam.transitive:
+        return
+    for a, b in _orient(fam, source, target, type_id):
+        cur.execute("""
+            INSERT INTO relation_closure (relation_type_id, source_node_id, target_node_id, depth)
+            SELECT ?1, x.node, y.node, x.depth + y.depth + 1
+            FROM (SELECT ?2 AS node, 0 AS depth
+                  UNION ALL
+                  SELECT source_node_id, depth FROM relation_closure
+                  WHERE relation_type_id = ?1 AND target_node_id = ?2) x,
+                 (SELECT ?3 AS node, 0 AS depth
+                  UNION ALL
+                  SELECT target_node_id, depth FROM relation_closure
+                  WHERE relation_type_id = ?1 AND source_node_id = ?3) y
+            WHERE x.node <> y.node
+            ON CONFLICT(relation_type_id, source_node_id, target_node_id)
+            DO UPDATE SET depth = MIN(depth, excluded.depth)
+        """, (fam.canonical, a, b))
+
+
+def edge_removed(conn, source, target, type_id):
+    """Call after the relation row has been deleted, inside the same transaction."""
+    cur = conn.cursor()
+    fam = family(cur, type_id)
+    if fam is None or not fam.transitive:
+        return
+    affected = set()
+    for a, _ in _orient(fam, source, target, type_id):
+        affected.add(a)
+        cur.execute("SELECT source_node_id FROM relation_closure WHERE relation_type_id=? AND target_node_id=?",
+                    (fam.canonical, a))
+        affected.update(r[0] for r in cur.fetchall())
+    for start in affected:
+        cur.execute("DELETE FROM relation_closure WHERE relation_type_id=? AND source_node_id=?",
+                    (fam.canonical, start))
+        depths = _bfs(lambda n: _successors(cur, fam, n), start)
+        cur.executemany(_INSERT, [(fam.canonical, start, t, d) for t, d in depths.items() if t != start])
+
+
+def reachable_from(cur, node_id, type_id, reverse=False):
+    """[(node_id, depth)] reachable from node_id along type_id.
+
+    With reverse=True the edges are walked backwards (ancestors become
+    descendants). Non-transitive types return their direct neighbours,
+    still expanded through inverse and symmetric types.
+    """
+    fam = family(cur, type_id)
+    if fam is None:
+        return []
+    forward = (type_id == fam.canonical) != reverse
+    if fam.transitive:
+        if forward:
+            cur.execute("SELECT target_node_id, depth FROM relation_closure "
+                        "WHERE relation_type_id=? AND source_node_id=? ORDER BY depth",
+                        (fam.canonical, node_id))
+        else:
+            cur.execute("SELECT source_node_id, depth FROM relation_closure "
+                        "WHERE relation_type_id=? AND target_node_id=? ORDER BY depth",
+                        (fam.canonical, node_id))
+        return cur.fetchall()
+    neighbours = _successors(cur, fam, node_id, reverse=not forward)
+    return [(n, 1) for n in sorted(neighbours) if n != node_id]
+
+
+def path_depth(cur, source, target, type_id):
+    """Shortest path length from source to target along type_id, or None."""
+    fam = family(cur, type_id)
+    if fam is None:
+        return None
+    if not fam.transitive:
+        return 1 if target in _successors(cur, fam, source, reverse=type_id != fam.canonical) else None
+    if type_id != fam.canonical:
+        source, target = target, source
+    cur.execute("SELECT depth FROM relation_closure "
+                "WHERE relation_type_id=? AND source_node_id=? AND target_node_id=?",
+                (fam.canonical, source, target))
+    row = cur.fetchone()
+    return row[0] if row else None
@@ -4,4 +4,155 @@ import os
 DB_PATH = os.getenv("KNOWLEDGE_DB_PATH", "db/graph.db")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# SQLite connection pool and pragmas
+DB_POOL_SIZE = int(os.getenv("KNOWLEDGE_DB_POOL_SIZE", "16"))
+DB_JOURNAL_MODE = os.getenv("KNOWLEDGE_DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("KNOWLEDGE_DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE = int(os.getenv("KNOWLEDGE_DB_CACHE_SIZE", "-65536"))  # negative = KiB
+DB_MMAP_SIZE = int(os.getenv("KNOWLEDGE_DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("KNOWLEDGE_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE = int(os.getenv("KNOWLEDGE_DB_STATEMENT_CACHE", "256"))
+DB_BUSY_RETRIES = int(os.getenv("KNOWLEDGE_DB_BUSY_RETRIES", "5"))
+DB_BUSY_BACKOFF = float(os.getenv("KNOWLEDGE_DB_BUSY_BACKOFF", "0.05"))
+DB_AUTO_MIGRATE = os.getenv("KNOWLEDGE_DB_AUTO_MIGRATE", "1") == "1"
 
+# List endpoints
+MAX_PAGE_SIZE = int(os.getenv("KNOWLEDGE_MAX_PAGE_SIZE", "5000"))
+
+# In-memory graph index
+GRAPH_INDEX_MAX_DEPTH = int(os.getenv("KNOWLEDGE_GRAPH_INDEX_MAX_DEPTH", "4"))
+GRAPH_INDEX_MAX_EDGES = int(os.getenv("KNOWLEDGE_GRAPH_INDEX_MAX_EDGES", "5000"))
+GRAPH_INDEX_COMPACT_MIN = int(os.getenv("KNOWLEDGE_GRAPH_INDEX_COMPACT_MIN", "10000"))
+GRAPH_INDEX_COMPACT_RATIO = float(os.getenv("KNOWLEDGE_GRAPH_INDEX_COMPACT_RATIO", "0.1"))
+
+# Bulk import
+IMPORT_BATCH_SIZE = int(os.getenv("KNOWLEDGE_IMPORT_BATCH_SIZE", "10000"))
+IMPORT_DEFER_INDEXES = os.getenv("KNOWLEDGE_IMPORT_DEFER_INDEXES", "1") == "1"
+
+# NLP parsing
+NLP_MODEL = os.getenv("KNOWLEDGE_NLP_MODEL", "en_core_web_sm")
+NLP_EXCLUDE = [c for c in os.getenv("KNOWLEDGE_NLP_EXCLUDE", "").split(",") if c]  # never loaded
+NLP_PRELOAD = os.getenv("KNOWLEDGE_NLP_PRELOAD", "0") == "1"  # load at import, e.g. in a preforking master
+NLP_WORKERS = int(os.getenv("KNOWLEDGE_NLP_WORKERS", "2"))  # 0 = parse in the web process
+NLP_START_METHOD = os.getenv("KNOWLEDGE_NLP_START_METHOD", "spawn")
+NLP_BATCH_SIZE = int(os.getenv("KNOWLEDGE_NLP_BATCH_SIZE", "64"))
+NLP_N_PROCESS = int(os.getenv("KNOWLEDGE_NLP_N_PROCESS", "1"))  # used only when NLP_WORKERS=0
+NLP_CHUNK_SIZE = int(os.getenv("KNOWLEDGE_NLP_CHUNK_SIZE", "256"))
+NLP_MAX_BATCH = int(os.getenv("KNOWLEDGE_NLP_MAX_BATCH", "1000"))
+NLP_TIMEOUT = float(os.getenv("KNOWLEDGE_NLP_TIMEOUT", "60"))
+
+# NLP parse cache
+PARSE_CACHE_SIZE = int(os.getenv("KNOWLEDGE_PARSE_CACHE_SIZE", "4096"))
+PARSE_CACHE_DISK = os.getenv("KNOWLEDGE_PARSE_CACHE_DISK", "1") == "1"
+PARSE_CACHE_DISK_MAX_ROWS = int(os.getenv("KNOWLEDGE_PARSE_CACHE_DISK_MAX_ROWS", "200000"))
+PARSE_CACHE_PRUNE_EVERY = int(os.getenv("KNOWLEDGE_PARSE_CACHE_PRUNE_EVERY", "1000"))
+
+# LLM summary generation
+SUMMARY_CLIENT = os.getenv("KNOWLEDGE_SUMMARY_CLIENT", "openai")  # "stub" answers locally, for tests
+SUMMARY_MODEL = os.getenv("KNOWLEDGE_SUMMARY_MODEL", "gpt-3.5-turbo")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+SUMMARY_CONCURRENCY = int(os.getenv("KNOWLEDGE_SUMMARY_CONCURRENCY", "4"))
+SUMMARY_TIMEOUT = float(os.getenv("KNOWLEDGE_SUMMARY_TIMEOUT", "30"))
+SUMMARY_RETRIES = int(os.getenv("KNOWLEDGE_SUMMARY_RETRIES", "2"))
+SUMMARY_BACKOFF = float(os.getenv("KNOWLEDGE_SUMMARY_BACKOFF", "1.0"))
+SUMMARY_WRITE_BATCH = int(os.getenv("KNOWLEDGE_SUMMARY_WRITE_BATCH", "50"))
+SUMMARY_MAX_JOB = int(os.getenv("KNOWLEDGE_SUMMARY_MAX_JOB", "5000"))
+SUMMARY_STALE_AFTER = float(os.getenv("KNOWLEDGE_SUMMARY_STALE_AFTER", "600"))  # s without progress before a job is resumed
+
+# Server-side graph layout
+LAYOUT_EDGE_LENGTH = float(os.getenv("KNOWLEDGE_LAYOUT_EDGE_LENGTH", "120"))
+LAYOUT_ITERATIONS = int(os.getenv("KNOWLEDGE_LAYOUT_ITERATIONS", "200"))
+LAYOUT_WARM_ITERATIONS = int(os.getenv("KNOWLEDGE_LAYOUT_WARM_ITERATIONS", "40"))
+LAYOUT_WARM_MOBILITY = float(os.getenv("KNOWLEDGE_LAYOUT_WARM_MOBILITY", "0.2"))
+LAYOUT_FULL_RATIO = float(os.getenv("KNOWLEDGE_LAYOUT_FULL_RATIO", "0.5"))  # new-node share forcing a full run
+LAYOUT_CELL_NODES = int(os.getenv("KNOWLEDGE_LAYOUT_CELL_NODES", "16"))
+LAYOUT_GRAVITY = float(os.getenv("KNOWLEDGE_LAYOUT_GRAVITY", "0.05"))
+LAYOUT_LEASE = float(os.getenv("KNOWLEDGE_LAYOUT_LEASE", "600"))  # s before a dead process's claim expires
+
+# Node search
+SEARCH_DEFAULT_LIMIT = int(os.getenv("KNOWLEDGE_SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.getenv("KNOWLEDGE_SEARCH_MAX_LIMIT", "200"))
+SEARCH_MIN_PREFIX = int(os.getenv("KNOWLEDGE_SEARCH_MIN_PREFIX", "2"))  # shorter last terms match whole words only
+
+# HTTP caching of read endpoints
+HTTP_CACHE = os.getenv("KNOWLEDGE_HTTP_CACHE", "1") == "1"
+HTTP_CACHE_SIZE = int(os.getenv("KNOWLEDGE_HTTP_CACHE_SIZE", "512"))  # entries
+HTTP_CACHE_MAX_BYTES = int(os.getenv("KNOWLEDGE_HTTP_CACHE_MAX_BYTES", str(128 * 2**20)))
+
+# Change log and delta sync
+CHANGELOG_PAGE_SIZE = int(os.getenv("KNOWLEDGE_CHANGELOG_PAGE_SIZE", "5000"))  # log entries per delta
+CHANGELOG_MAX_ROWS = int(os.getenv("KNOWLEDGE_CHANGELOG_MAX_ROWS", "100000"))  # revisions kept
+CHANGELOG_MAX_AGE = float(os.getenv("KNOWLEDGE_CHANGELOG_MAX_AGE", str(7 * 86400)))  # seconds kept
+CHANGELOG_COMPACT_EVERY = float(os.getenv("KNOWLEDGE_CHANGELOG_COMPACT_EVERY", "300"))
+CHANGES_POLL_INTERVAL = float(os.getenv("KNOWLEDGE_CHANGES_POLL_INTERVAL", "0.5"))
+CHANGES_HEARTBEAT = float(os.getenv("KNOWLEDGE_CHANGES_HEARTBEAT", "15"))
+
+# Attribute value queries
+ATTRIBUTE_QUERY_MAX_FILTERS = int(os.getenv("KNOWLEDGE_ATTRIBUTE_QUERY_MAX_FILTERS", "32"))
+
+# Batch edits
+BATCH_MAX_OPS = int(os.getenv("KNOWLEDGE_BATCH_MAX_OPS", "1000"))
+
+# Instrumentation and /metrics
+METRICS = os.getenv("KNOWLEDGE_METRICS", "1") == "1"
+SERVER_TIMING = os.getenv("KNOWLEDGE_SERVER_TIMING", "0") == "1"  # per-stage Server-Timing header on responses
+METRICS_SLOW_QUERY_MS = float(os.getenv("KNOWLEDGE_METRICS_SLOW_QUERY_MS", "100"))  # 0 = no slow-query log
+METRICS_SLOW_QUERY_LOG = int(os.getenv("KNOWLEDGE_METRICS_SLOW_QUERY_LOG", "100"))  # entries kept
+METRICS_MAX_STATEMENTS = int(os.getenv("KNOWLEDGE_METRICS_MAX_STATEMENTS", "500"))  # distinct statement labels
+METRICS_DIR = os.getenv("KNOWLEDGE_METRICS_DIR") or None  # shared by gunicorn workers; a temp dir by default
+METRICS_FLUSH_INTERVAL = float(os.getenv("KNOWLEDGE_METRICS_FLUSH_INTERVAL", "5"))  # s between writes there
+
+# Graph snapshots
+SNAPSHOT_PATH = os.getenv("KNOWLEDGE_SNAPSHOT_PATH") or None  # build the graph index from this snapshot when current
+
+# Production server (gunicorn -c gunicorn.conf.py wsgi:application)
+SERVER_BIND = os.getenv("KNOWLEDGE_SERVER_BIND", "127.0.0.1:5000")
+SERVER_WORKERS = int(os.getenv("KNOWLEDGE_SERVER_WORKERS", "0"))  # 0 = 2 x CPUs + 1
+SERVER_THREADS = int(os.getenv("KNOWLEDGE_SERVER_THREADS", "4"))  # per worker, gthread
+SERVER_WORKER_CLASS = os.getenv("KNOWLEDGE_SERVER_WORKER_CLASS", "gthread")  # or "gevent", for I/O-bound routes
+SERVER_WORKER_CONNECTIONS = int(os.getenv("KNOWLEDGE_SERVER_WORKER_CONNECTIONS", "1000"))  # per worker, gevent
+SERVER_TIMEOUT = int(os.getenv("KNOWLEDGE_SERVER_TIMEOUT", "120"))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("KNOWLEDGE_SERVER_GRACEFUL_TIMEOUT", "30"))
+SERVER_KEEPALIVE = int(os.getenv("KNOWLEDGE_SERVER_KEEPALIVE", "5"))
+SERVER_MAX_REQUESTS = int(os.getenv("KNOWLEDGE_SERVER_MAX_REQUESTS", "0"))  # recycle workers; 0 = never
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("KNOWLEDGE_SERVER_MAX_REQUESTS_JITTER", "0"))
+SERVER_PRELOAD = os.getenv("KNOWLEDGE_SERVER_PRELOAD", "1") == "1"  # spaCy model and graph index, before fork
+
+# Graph analytics (/api/analytics/*)
+ANALYTICS_CACHE_SIZE = int(os.getenv("KNOWLEDGE_ANALYTICS_CACHE_SIZE", "32"))  # results kept per revision
+ANALYTICS_DEFAULT_LIMIT = int(os.getenv("KNOWLEDGE_ANALYTICS_DEFAULT_LIMIT", "20"))
+ANALYTICS_PAGERANK_DAMPING = float(os.getenv("KNOWLEDGE_ANALYTICS_PAGERANK_DAMPING", "0.85"))
+ANALYTICS_PAGERANK_TOL = float(os.getenv("KNOWLEDGE_ANALYTICS_PAGERANK_TOL", "1e-6"))
+ANALYTICS_PAGERANK_MAX_ITER = int(os.getenv("KNOWLEDGE_ANALYTICS_PAGERANK_MAX_ITER", "100"))
+ANALYTICS_BETWEENNESS_SAMPLES = int(os.getenv("KNOWLEDGE_ANALYTICS_BETWEENNESS_SAMPLES", "32"))  # BFS pivots
+ANALYTICS_BETWEENNESS_MAX_SAMPLES = int(os.getenv("KNOWLEDGE_ANALYTICS_BETWEENNESS_MAX_SAMPLES", "1024"))
+ANALYTICS_BETWEENNESS_BATCH = int(os.getenv("KNOWLEDGE_ANALYTICS_BETWEENNESS_BATCH", "8"))  # pivots per matrix BFS
+ANALYTICS_COMPONENT_NODES = int(os.getenv("KNOWLEDGE_ANALYTICS_COMPONENT_NODES", "100"))  # node ids listed per component
+
+# Path finding (/api/path)
+PATH_MAX_DEPTH = int(os.getenv("KNOWLEDGE_PATH_MAX_DEPTH", "6"))  # default and cap for ?max_depth=
+PATH_MAX_K = int(os.getenv("KNOWLEDGE_PATH_MAX_K", "10"))  # paths per request
+PATH_MAX_VISITS = int(os.getenv("KNOWLEDGE_PATH_MAX_VISITS", "200000"))  # node visits per request
+
+# Similarity index (/api/node/<id>/similar, duplicate warnings on create)
+SIMILARITY_DIM = int(os.getenv("KNOWLEDGE_SIMILARITY_DIM", str(2 ** 20)))  # hashed feature columns
+SIMILARITY_DEFAULT_K = int(os.getenv("KNOWLEDGE_SIMILARITY_DEFAULT_K", "10"))
+SIMILARITY_MAX_K = int(os.getenv("KNOWLEDGE_SIMILARITY_MAX_K", "100"))
+SIMILARITY_DUPLICATE_THRESHOLD = float(os.getenv("KNOWLEDGE_SIMILARITY_DUPLICATE_THRESHOLD", "0.85"))  # title cosine
+SIMILARITY_DUPLICATE_MAX = int(os.getenv("KNOWLEDGE_SIMILARITY_DUPLICATE_MAX", "5"))
+SIMILARITY_COMPACT_MIN = int(os.getenv("KNOWLEDGE_SIMILARITY_COMPACT_MIN", "1000"))
+SIMILARITY_COMPACT_RATIO = float(os.getenv("KNOWLEDGE_SIMILARITY_COMPACT_RATIO", "0.05"))
+SIMILARITY_REBUILD_RATIO = float(os.getenv("KNOWLEDGE_SIMILARITY_REBUILD_RATIO", "0.25"))  # changed share
+SIMILARITY_DRIFT_RATIO = float(os.getenv("KNOWLEDGE_SIMILARITY_DRIFT_RATIO", "0.1"))  # edits or new terms, share of the build
+
+# Relation extraction from summaries (extraction.py, /api/extraction/*)
+EXTRACTION_BATCH_SIZE = int(os.getenv("KNOWLEDGE_EXTRACTION_BATCH_SIZE", "256"))  # summaries per parse and commit
+EXTRACTION_STALE_AFTER = float(os.getenv("KNOWLEDGE_EXTRACTION_STALE_AFTER", "3600"))  # seconds without progress
+EXTRACTION_PAGE_SIZE = int(os.getenv("KNOWLEDGE_EXTRACTION_PAGE_SIZE", "100"))  # proposals per listing
+
+# Response serialization and compression (serialization.py)
+SERIALIZE_ORJSON = os.getenv("KNOWLEDGE_SERIALIZE_ORJSON", "1") == "1"  # when orjson is installed
+SERIALIZE_COMPRESS = os.getenv("KNOWLEDGE_SERIALIZE_COMPRESS", "1") == "1"
+SERIALIZE_COMPRESS_MIN_BYTES = int(os.getenv("KNOWLEDGE_SERIALIZE_COMPRESS_MIN_BYTES", "2048"))
+SERIALIZE_GZIP_LEVEL = int(os.getenv("KNOWLEDGE_SERIALIZE_GZIP_LEVEL", "5"))
+SERIALIZE_BROTLI_QUALITY = int(os.getenv("KNOWLEDGE_SERIALIZE_BROTLI_QUALITY", "4"))
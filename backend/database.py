@@ -0,0 +1,279 @@
+# database.py
+# Shared SQLite connection pool used by every route in app.py.
+#
+# Connections are opened once, tuned with WAL journaling and the pragmas from
+# config.py, and then handed out to request handlers and returned when the
+# request finishes, so no request pays for connect + schema parsing again.
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+import metrics
+
+
+def _is_busy_error(exc):
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def _with_busy_retry(pool, fn, *args):
+    # busy_timeout already makes SQLite wait inside a single call; this adds
+    # jittered exponential backoff on top for writers that still collide.
+    attempt = 0
+    while True:
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as exc:
+            if not _is_busy_error(exc) or attempt >= pool.busy_retries:
+                if _is_busy_error(exc):
+                    pool._bump("busy_failures")
+                raise
+            pool._bump("busy_retries")
+            delay = pool.busy_backoff * (2 ** attempt)
+            time.sleep(delay + random.uniform(0, delay))
+            attempt += 1
+
+
+class PooledCursor(sqlite3.Cursor):
+    # Statement and time accounted so far, for metrics; iterating the cursor
+    # directly (for row in cur) is not timed, the fetch methods are.
+    _metrics_statement = None
+    _metrics_seconds = 0.0
+
+    def execute(self, sql, parameters=()):
+        if not config.METRICS:
+            return _with_busy_retry(self.connection.pool, super().execute, sql, parameters)
+        t0 = time.perf_counter()
+        result = _with_busy_retry(self.connection.pool, super().execute, sql, parameters)
+        metrics.sql_executed(self, sql, parameters, time.perf_counter() - t0)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        if not config.METRICS:
+            return _with_busy_retry(self.connection.pool, super().executemany, sql, seq_of_parameters)
+        t0 = time.perf_counter()
+        result = _with_busy_retry(self.connection.pool, super().executemany, sql, seq_of_parameters)
+        metrics.sql_executed(self, sql, None, time.perf_counter() - t0)
+        return result
+
+    def fetchone(self):
+        if self._metrics_statement is None:
+            return super().fetchone()
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        metrics.sql_fetched(self, time.perf_counter() - t0, drained=row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        if self._metrics_statement is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        metrics.sql_fetched(self, time.perf_counter() - t0, drained=not rows)
+        return rows
+
+    def fetchall(self):
+        if self._metrics_statement is None:
+            return super().fetchall()
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        metrics.sql_fetched(self, time.perf_counter() - t0, drained=True)
+        return rows
+
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    # Set by single_transaction(): handlers' own commits become no-ops
+    defer_commit = False
+
+    def cursor(self, factory=PooledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if self.defer_commit:
+            return None
+        return _with_busy_retry(self.pool, super().commit)
+
+
+class ConnectionPool:
+    def __init__(self, path, size=None, journal_mode=None, synchronous=None,
+                 cache_size=None, mmap_size=None, busy_timeout_ms=None,
+                 statement_cache=None, busy_retries=None, busy_backoff=None):
+        self.path = path
+        self.size = size if size is not None else config.DB_POOL_SIZE
+        self.journal_mode = journal_mode or config.DB_JOURNAL_MODE
+        self.synchronous = synchronous or config.DB_SYNCHRONOUS
+        self.cache_size = cache_size if cache_size is not None else config.DB_CACHE_SIZE
+        self.mmap_size = mmap_size if mmap_size is not None else config.DB_MMAP_SIZE
+        self.busy_timeout_ms = busy_timeout_ms if busy_timeout_ms is not None else config.DB_BUSY_TIMEOUT_MS
+        self.statement_cache = statement_cache if statement_cache is not None else config.DB_STATEMENT_CACHE
+        self.busy_retries = busy_retries if busy_retries is not None else config.DB_BUSY_RETRIES
+        self.busy_backoff = busy_backoff if busy_backoff is not None else config.DB_BUSY_BACKOFF
+
+        self._lock = threading.Lock()
+        self._idle = []
+        self._pid = os.getpid()
+        self._stats = {
+            "opened": 0,
+            "acquired": 0,
+            "reused": 0,
+            "released": 0,
+            "discarded": 0,
+            "in_use": 0,
+            "busy_retries": 0,
+            "busy_failures": 0,
+        }
+
+    def _bump(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            factory=PooledConnection,
+            timeout=self.busy_timeout_ms / 1000.0,
+            cached_statements=self.statement_cache,
+            check_same_thread=False,
+            isolation_level="IMMEDIATE",
+        )
+        conn.pool = self
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._bump("opened")
+        return conn
+
+    def _check_fork(self):
+        # A connection must never cross a fork(); children start with an empty pool.
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._idle = []
+                self._pid = os.getpid()
+                self._stats["in_use"] = 0
+
+    def acquire(self):
+        self._check_fork()
+        conn = None
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+                self._stats["reused"] += 1
+            self._stats["acquired"] += 1
+            self._stats["in_use"] += 1
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                self._bump("in_use", -1)
+                raise
+        return conn
+
+    def release(self, conn):
+        if conn.pool is not self or os.getpid() != self._pid:
+            return
+        if conn.in_transaction:
+            # The request ended without committing (error path); never leak
+            # an open write transaction to the next borrower.
+            conn.rollback()
+        with self._lock:
+            self._stats["in_use"] -= 1
+            self._stats["released"] += 1
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self._stats["discarded"] += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        stats.update({
+            "path": self.path,
+            "size": self.size,
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "cache_size": self.cache_size,
+            "mmap_size": self.mmap_size,
+            "statement_cache": self.statement_cache,
+        })
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    path = path or config.DB_PATH
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+def connection(path=None):
+    # For code running outside a request (CLI tools, background jobs).
+    return get_pool(path).connection()
+
+
+@contextmanager
+def single_transaction(conn):
+    """Run a block of handlers as one transaction with a single commit.
+
+    conn.commit() calls inside the block are ignored; the block commits once
+    at the end, or rolls back everything if it raises.
+    """
+    conn.defer_commit = True
+    try:
+        yield conn
+    except BaseException:
+        conn.defer_commit = False
+        conn.rollback()
+        raise
+    conn.defer_commit = False
+    conn.commit()
+
+
+def get_version(conn, name):
+    row = conn.execute("SELECT version FROM graph_versions WHERE name=?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_version(conn, name):
+    """Increment a change counter inside the caller's transaction and return it."""
+    conn.execute(
+        "INSERT INTO graph_versions (name, version) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+        (name,),
+    )
+    return get_version(conn, name)
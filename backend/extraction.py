@@ -0,0 +1,393 @@
+# extraction.py
+# Corpus-wide relation extraction: turns the stored node summaries into
+# proposed relations, written to relation_proposals for review.
+#
+# A run walks summaries EXTRACTION_BATCH_SIZE at a time:
+#   - each summary is hashed; one whose hash matches extraction_state was
+#     already extracted and is skipped without parsing
+#   - the rest are parsed in the NLP pool (nlp_utils.extract_relations)
+#   - subjects and objects are matched to nodes by title (case-insensitive,
+#     the noun phrase first, then its head word, each also with a plural
+#     "s" stripped); a pronoun subject ("It produces ...") is the node whose
+#     summary it is
+#   - predicates are matched to relation_types by normalize_relation_name,
+#     with underscores as spaces and word endings stemmed, so "contain"
+#     finds contains and the copula ("X is a Y") finds is_a; predicates
+#     without a type are proposed with relation_type_id NULL, for the
+#     reviewer to pick one
+#   - the node's pending proposals are replaced by the new ones in the same
+#     transaction as its extraction_state row, so a run that dies midway
+#     resumes where it stopped; accepted and rejected proposals are kept,
+#     and a rejected triple is not proposed again
+#   - deleting a node drops the pending proposals that mention it
+#     (node_deleted, from the DELETE route)
+#
+# Runs are incremental: each finished run records the graph revision it
+# started at, and the next one only looks at the nodes change_log shows as
+# changed since. When the log no longer reaches back that far (or for the
+# first run, or with full=True) every node is walked, and the hashes still
+# skip the summaries that did not change. full=True also re-extracts those,
+# e.g. after adding relation types.
+#
+# Runs go through ExtractionService (one at a time, on a background thread)
+# from /api/extraction/runs, or synchronously from the command line for a
+# nightly job:
+#   python extraction.py [--full]
+import argparse
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import database
+import http_cache
+import nlp_pool
+from changes import TRUNCATED_KEY
+from nlp_utils import extract_relations, normalize_relation_name
+from similarity import stem
+
+STATUSES = ("queued", "running", "done", "failed")
+PROPOSAL_STATUSES = ("pending", "accepted", "rejected")
+
+PRONOUNS = frozenset(("it", "this", "they", "he", "she", "these", "which", "that", "who"))
+
+
+def install(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS relation_proposals ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " node_id INTEGER NOT NULL,"  # whose summary it came from
+        " source_node_id INTEGER NOT NULL,"
+        " target_node_id INTEGER NOT NULL,"
+        " relation_type_id INTEGER,"
+        " predicate TEXT NOT NULL,"
+        " subject TEXT NOT NULL,"
+        " object TEXT NOT NULL,"
+        " status TEXT NOT NULL DEFAULT 'pending',"
+        " relation_id INTEGER,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " UNIQUE (node_id, source_node_id, target_node_id, predicate)"
+        ")"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_relation_proposals_status ON relation_proposals(status, id)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS extraction_state ("
+        " node_id INTEGER PRIMARY KEY,"
+        " summary_hash TEXT NOT NULL,"
+        " extracted_at REAL NOT NULL"
+        ")"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS extraction_runs ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " status TEXT NOT NULL,"
+        " full INTEGER NOT NULL DEFAULT 0,"
+        " from_rev INTEGER,"
+        " to_rev INTEGER,"
+        " total INTEGER NOT NULL DEFAULT 0,"
+        " processed INTEGER NOT NULL DEFAULT 0,"
+        " parsed INTEGER NOT NULL DEFAULT 0,"
+        " proposed INTEGER NOT NULL DEFAULT 0,"
+        " unmatched INTEGER NOT NULL DEFAULT 0,"
+        " error TEXT,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " finished_at REAL"
+        ")"
+    )
+
+
+def summary_hash(summary):
+    return hashlib.blake2b((summary or "").strip().encode(), digest_size=8).hexdigest()
+
+
+def relation_key(name):
+    """Comparable form of a predicate or relation type name: "contains" and "contain" agree."""
+    words = normalize_relation_name((name or "").replace("_", " ")).split()
+    # "be" is the copula's lemma: "X is a Y" compares equal to is_a
+    return " ".join(stem(w) for w in words if w != "be")
+
+
+def _singular(phrase):
+    words = phrase.split()
+    return " ".join(words[:-1] + [stem(words[-1])]) if words else phrase
+
+
+def _candidates(phrase, head):
+    # Title spellings to try, best first
+    forms = []
+    for text in (phrase, head):
+        text = " ".join((text or "").lower().split())
+        forms += [text, _singular(text)]
+    return [f for f in dict.fromkeys(forms) if f]
+
+
+class _Matcher:
+    """Resolves phrases to node ids and predicates to relation types for one batch."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.types = {}
+        for type_id, name in conn.execute("SELECT id, name FROM relation_types ORDER BY id"):
+            self.types.setdefault(relation_key(name), type_id)
+        self._titles = {}
+
+    def load_titles(self, forms):
+        todo = [f for f in set(forms) if f not in self._titles]
+        for i in range(0, len(todo), 500):
+            chunk = todo[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT LOWER(title), MIN(id) FROM nodes WHERE LOWER(title) IN ({','.join('?' * len(chunk))}) "
+                "GROUP BY LOWER(title)",
+                chunk,
+            ).fetchall()
+            self._titles.update(dict.fromkeys(chunk))
+            self._titles.update(rows)
+
+    def node(self, forms):
+        return next((self._titles[f] for f in forms if self._titles.get(f)), None)
+
+    def relation_type(self, predicate):
+        return self.types.get(relation_key(predicate))
+
+
+def _proposals(matcher, node_id, relations):
+    """Rows for relation_proposals from one summary's triples, and how many did not match."""
+    rows, unmatched = {}, 0
+    for r in relations:
+        if r["subject_pronoun"] or r["subject"].lower() in PRONOUNS:
+            source = node_id
+        else:
+            source = matcher.node(_candidates(r["subject_phrase"], r["subject"]))
+        target = matcher.node(_candidates(r["object_phrase"], r["object"]))
+        if source is None or target is None or source == target:
+            unmatched += 1
+            continue
+        key = (source, target, r["predicate"])
+        rows.setdefault(key, (node_id, source, target, matcher.relation_type(r["predicate"]), r["predicate"],
+                              r["subject_phrase"], r["object_phrase"]))
+    return list(rows.values()), unmatched
+
+
+def _changed_nodes(conn, since, until):
+    cur = conn.execute(
+        "SELECT DISTINCT row_id FROM change_log WHERE rev > ? AND rev <= ? AND +tbl = 'nodes'", (since, until))
+    return sorted(r[0] for r in cur.fetchall())
+
+
+def _all_nodes(conn, page=10000):
+    last = 0
+    while True:
+        ids = [r[0] for r in conn.execute("SELECT id FROM nodes WHERE id > ? ORDER BY id LIMIT ?", (last, page))]
+        if not ids:
+            return
+        yield from ids
+        last = ids[-1]
+
+
+def checkpoint(conn):
+    """Revision the last finished run started at, or None when nothing has run."""
+    row = conn.execute("SELECT MAX(to_rev) FROM extraction_runs WHERE status = 'done'").fetchone()
+    return row[0]
+
+
+def process(conn, node_ids, force=False):
+    """Extract from the summaries of node_ids and commit; returns the run counters for this batch."""
+    counts = dict.fromkeys(("processed", "parsed", "proposed", "unmatched"), 0)
+    placeholders = ",".join("?" * len(node_ids))
+    rows = conn.execute(
+        f"SELECT n.id, n.summary, s.summary_hash FROM nodes n "
+        f"LEFT JOIN extraction_state s ON s.node_id = n.id WHERE n.id IN ({placeholders})",
+        node_ids,
+    ).fetchall()
+    found = {r[0] for r in rows}
+    gone = [n for n in node_ids if n not in found]
+    todo = []
+    for node_id, summary, stored in rows:
+        digest = summary_hash(summary)
+        if force or digest != stored:
+            todo.append((node_id, (summary or "").strip(), digest))
+    texts = [t for _, t, _ in todo if t]
+    parsed = iter(nlp_pool.run_batch(extract_relations, texts))
+    extracted = [(node_id, digest, next(parsed) if text else []) for node_id, text, digest in todo]
+
+    matcher = _Matcher(conn)
+    matcher.load_titles(form for _, _, relations in extracted for r in relations
+                        for form in _candidates(r["subject_phrase"], r["subject"])
+                        + _candidates(r["object_phrase"], r["object"]))
+    proposals = []
+    for node_id, _, relations in extracted:
+        rows, unmatched = _proposals(matcher, node_id, relations)
+        proposals += rows
+        counts["unmatched"] += unmatched
+
+    now = time.time()
+    stale = [(n,) for n in gone] + [(n,) for n, _, _ in extracted]
+    conn.executemany("DELETE FROM relation_proposals WHERE node_id = ? AND status = 'pending'", stale)
+    conn.executemany("DELETE FROM extraction_state WHERE node_id = ?", [(n,) for n in gone])
+    # Edges the graph already has are not worth a review
+    proposals = [p for p in proposals if p[3] is None or conn.execute(
+        "SELECT 1 FROM relations WHERE source_node_id = ? AND target_node_id = ? AND relation_type_id = ?",
+        (p[1], p[2], p[3])).fetchone() is None]
+    cur = conn.executemany(
+        "INSERT OR IGNORE INTO relation_proposals (node_id, source_node_id, target_node_id, relation_type_id, "
+        "predicate, subject, object, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?)",
+        [p + (now, now) for p in proposals],
+    )
+    counts["proposed"] = max(cur.rowcount, 0)
+    conn.executemany(
+        "INSERT OR REPLACE INTO extraction_state (node_id, summary_hash, extracted_at) VALUES (?, ?, ?)",
+        [(node_id, digest, now) for node_id, digest, _ in extracted],
+    )
+    conn.commit()
+    counts["processed"] = len(node_ids)
+    counts["parsed"] = len(texts)
+    return counts
+
+
+def run(conn, run_id):
+    """Carry out a queued run, committing after every batch."""
+    full = bool(conn.execute("SELECT full FROM extraction_runs WHERE id=?", (run_id,)).fetchone()[0])
+    to_rev, _ = http_cache.current(conn)
+    since = None if full else checkpoint(conn)
+    if since is not None and since < database.get_version(conn, TRUNCATED_KEY):
+        since = None  # the log was compacted past the checkpoint
+    if since is None:
+        total = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+        node_ids = _all_nodes(conn)
+    else:
+        node_ids = _changed_nodes(conn, since, to_rev)
+        total = len(node_ids)
+    conn.execute(
+        "UPDATE extraction_runs SET status='running', from_rev=?, to_rev=?, total=?, updated_at=? WHERE id=?",
+        (since, to_rev, total, time.time(), run_id),
+    )
+    conn.commit()
+
+    batch = []
+    for node_id in node_ids:
+        batch.append(node_id)
+        if len(batch) >= config.EXTRACTION_BATCH_SIZE:
+            _progress(conn, run_id, process(conn, batch, force=full))
+            batch = []
+    if batch:
+        _progress(conn, run_id, process(conn, batch, force=full))
+    _finish(conn, run_id, "done")
+    conn.commit()
+
+
+def _progress(conn, run_id, counts):
+    conn.execute(
+        "UPDATE extraction_runs SET processed=processed+?, parsed=parsed+?, proposed=proposed+?, "
+        "unmatched=unmatched+?, updated_at=? WHERE id=?",
+        (counts["processed"], counts["parsed"], counts["proposed"], counts["unmatched"], time.time(), run_id),
+    )
+    conn.commit()
+
+
+def node_deleted(conn, node_id):
+    """Drop the pending proposals that mention a deleted node; the caller commits."""
+    conn.execute(
+        "DELETE FROM relation_proposals WHERE status = 'pending' "
+        "AND (node_id = ? OR source_node_id = ? OR target_node_id = ?)",
+        (node_id, node_id, node_id),
+    )
+    conn.execute("DELETE FROM extraction_state WHERE node_id = ?", (node_id,))
+
+
+def _finish(conn, run_id, status, error=None):
+    now = time.time()
+    conn.execute(
+        "UPDATE extraction_runs SET status=?, error=?, updated_at=?, finished_at=? WHERE id=?",
+        (status, error, now, now, run_id),
+    )
+
+
+def create_run(conn, full=False):
+    now = time.time()
+    cur = conn.execute(
+        "INSERT INTO extraction_runs (status, full, created_at, updated_at) VALUES ('queued', ?, ?, ?)",
+        (int(bool(full)), now, now),
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def active_run(conn):
+    """Id of a queued or running run that is still making progress, if any."""
+    row = conn.execute(
+        "SELECT id FROM extraction_runs WHERE status IN ('queued', 'running') AND updated_at > ? "
+        "ORDER BY id DESC LIMIT 1",
+        (time.time() - config.EXTRACTION_STALE_AFTER,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def get_run(conn, run_id):
+    row = conn.execute(
+        "SELECT id, status, full, from_rev, to_rev, total, processed, parsed, proposed, unmatched, error, "
+        "created_at, updated_at, finished_at FROM extraction_runs WHERE id=?",
+        (run_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    keys = ("id", "status", "full", "from_rev", "to_rev", "total", "processed", "parsed", "proposed",
+            "unmatched", "error", "created_at", "updated_at", "finished_at")
+    result = dict(zip(keys, row))
+    result["full"] = bool(result["full"])
+    return result
+
+
+class ExtractionService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, conn, full=False):
+        """Queue a run and return its id, or (None, id of the run in progress)."""
+        with self._lock:
+            running = active_run(conn)
+            if running is not None:
+                return None, running
+            run_id = create_run(conn, full)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="extraction-run")
+            self._executor.submit(self.run, run_id)
+            return run_id, None
+
+    def run(self, run_id):
+        with database.connection() as conn:
+            try:
+                run(conn, run_id)
+            except Exception as e:
+                conn.rollback()
+                _finish(conn, run_id, "failed", str(e))
+                conn.commit()
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+service = ExtractionService()
+
+
+if __name__ == "__main__":
+    import migrations
+
+    parser = argparse.ArgumentParser(description="Propose relations from the summaries changed since the last run.")
+    parser.add_argument("--full", action="store_true", help="re-extract every summary, changed or not")
+    args = parser.parse_args()
+    migrations.migrate()
+    with database.connection() as conn:
+        running = active_run(conn)
+        if running is not None:
+            raise SystemExit(f"Run {running} is still in progress.")
+        run_id = create_run(conn, args.full)
+        service.run(run_id)
+        print(json.dumps(get_run(conn, run_id), indent=2))
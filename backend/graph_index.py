@@ -0,0 +1,428 @@
+# graph_index.py
+# In-process adjacency index over the relations table.
+#
+# Edges are stored CSR-style in flat array('q') buffers: for the node at
+# position p, its outgoing edges live in targets[offsets[p]:offsets[p+1]]
+# (same for the reverse direction). Walking a node's edges is then a slice
+# over contiguous memory instead of a three-way SQL join.
+#
+# Edits made through the relation routes are applied as small overlays
+# (added edges per node + a set of deleted edge ids) and folded back into
+# the CSR arrays once they grow past a fraction of the base graph.
+#
+# Every change to relations bumps the 'relations' counter in graph_versions
+# (see database.bump_version). If the counter in the database moves without
+# this process having seen the edit (another worker wrote it), the index is
+# rebuilt on next use. When KNOWLEDGE_SNAPSHOT_PATH names a snapshot of this
+# database taken at the current version (snapshot.matches), the rebuild
+# reads its memory-mapped relation columns instead of the relations table.
+import threading
+from array import array
+
+import numpy as np
+
+import config
+import database
+import snapshot
+
+VERSION_KEY = "relations"
+DIRECTIONS = ("out", "in", "both")
+
+
+class _CSR:
+    __slots__ = ("offsets", "others", "types", "edge_ids")
+
+    def __init__(self, offsets, others, types, edge_ids):
+        self.offsets = offsets
+        self.others = others
+        self.types = types
+        self.edge_ids = edge_ids
+
+
+def _build_csr(n, keys, others, types, edge_ids):
+    # Counting sort of the edge list by key position: O(V + E), no comparisons.
+    offsets = array("q", [0]) * (n + 1)
+    for k in keys:
+        offsets[k + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+    fill = array("q", offsets[:n])
+    m = len(keys)
+    out_others = array("q", [0]) * m
+    out_types = array("q", [0]) * m
+    out_edges = array("q", [0]) * m
+    for i in range(m):
+        k = keys[i]
+        p = fill[k]
+        fill[k] = p + 1
+        out_others[p] = others[i]
+        out_types[p] = types[i]
+        out_edges[p] = edge_ids[i]
+    return _CSR(offsets, out_others, out_types, out_edges)
+
+
+def _numpy_csr(n, keys, others, types, edge_ids):
+    # Same layout as _build_csr; a stable sort keeps each node's edges in input order.
+    def q(values):
+        return array("q", np.ascontiguousarray(values, dtype=np.int64).tobytes())
+
+    order = np.argsort(keys, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return _CSR(q(offsets), q(np.asarray(others)[order]), q(np.asarray(types)[order]),
+                q(np.asarray(edge_ids)[order]))
+
+
+class GraphIndex:
+    def __init__(self, edges, version):
+        """Build from an iterable of (edge_id, source, target, type_id) tuples."""
+        self.version = version
+        self._lock = threading.RLock()
+        self._load(edges)
+
+    def _load(self, edges):
+        pos = {}
+        ids = array("q")
+        eids, srcs, tgts, typs = array("q"), array("q"), array("q"), array("q")
+        for eid, src, tgt, typ in edges:
+            for node in (src, tgt):
+                if node not in pos:
+                    pos[node] = len(ids)
+                    ids.append(node)
+            eids.append(eid)
+            srcs.append(pos[src])
+            tgts.append(pos[tgt])
+            typs.append(typ)
+        n = len(ids)
+        # CSR columns hold node ids, not positions, so results need no mapping back.
+        tgt_ids = array("q", (ids[p] for p in tgts))
+        src_ids = array("q", (ids[p] for p in srcs))
+        self._set_base(pos, _build_csr(n, srcs, tgt_ids, typs, eids), _build_csr(n, tgts, src_ids, typs, eids),
+                       len(eids))
+
+    @classmethod
+    def from_arrays(cls, edge_ids, sources, targets, types, version):
+        """Build from parallel integer columns, e.g. a memory-mapped snapshot, in NumPy."""
+        index = cls.__new__(cls)
+        index.version = version
+        index._lock = threading.RLock()
+        ids, positions = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+        m = len(edge_ids)
+        n = len(ids)
+        pos = dict(zip(ids.tolist(), range(n)))
+        index._set_base(pos, _numpy_csr(n, positions[:m], targets, types, edge_ids),
+                        _numpy_csr(n, positions[m:], sources, types, edge_ids), m)
+        return index
+
+    def _set_base(self, pos, fwd, rev, edge_count):
+        self._pos = pos
+        self._fwd = fwd
+        self._rev = rev
+        self._base_edges = edge_count
+        self._added_out = {}
+        self._added_in = {}
+        self._added_count = 0
+        self._deleted = set()
+
+    @property
+    def edge_count(self):
+        return self._base_edges + self._added_count - len(self._deleted)
+
+    def _edges(self, node_id, reverse):
+        csr = self._rev if reverse else self._fwd
+        p = self._pos.get(node_id)
+        if p is not None:
+            deleted = self._deleted
+            others, types, edge_ids = csr.others, csr.types, csr.edge_ids
+            for i in range(csr.offsets[p], csr.offsets[p + 1]):
+                eid = edge_ids[i]
+                if eid not in deleted:
+                    yield eid, others[i], types[i]
+        added = self._added_in if reverse else self._added_out
+        yield from added.get(node_id, ())
+
+    def iter_edges(self):
+        """Yield every live (edge_id, source, target, type_id)."""
+        for node_id in self._pos:
+            for eid, other, typ in self._edges(node_id, False):
+                yield eid, node_id, other, typ
+        for node_id, added in self._added_out.items():
+            if node_id not in self._pos:
+                for eid, other, typ in added:
+                    yield eid, node_id, other, typ
+
+    # -- maintenance -------------------------------------------------------
+
+    def add_edge(self, edge_id, source, target, type_id, version):
+        with self._lock:
+            if self.version is None or version <= self.version:
+                return  # already part of a rebuild that saw this write
+            if version != self.version + 1:
+                self.version = None  # missed someone else's write; rebuild on next use
+                return
+            self._added_out.setdefault(source, []).append((edge_id, target, type_id))
+            self._added_in.setdefault(target, []).append((edge_id, source, type_id))
+            self._added_count += 1
+            self.version = version
+            self._maybe_compact()
+
+    def remove_edge(self, edge_id, source, target, type_id, version):
+        with self._lock:
+            if self.version is None or version <= self.version:
+                return
+            if version != self.version + 1:
+                self.version = None
+                return
+            out = self._added_out.get(source, [])
+            entry = (edge_id, target, type_id)
+            if entry in out:
+                out.remove(entry)
+                self._added_in[target].remove((edge_id, source, type_id))
+                self._added_count -= 1
+            else:
+                self._deleted.add(edge_id)
+            self.version = version
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        overlay = self._added_count + len(self._deleted)
+        if overlay > max(config.GRAPH_INDEX_COMPACT_MIN, self._base_edges * config.GRAPH_INDEX_COMPACT_RATIO):
+            self._load(list(self.iter_edges()))
+
+    # -- queries -----------------------------------------------------------
+
+    def neighborhood(self, root, depth=1, direction="both", types=None, max_edges=None):
+        """Breadth-first expansion from root.
+
+        Returns (node_ids, edges, truncated): node ids in BFS order starting
+        with root, and {edge_id: (source, target, type_id)} in stored
+        orientation regardless of the direction they were reached from.
+        """
+        reverse_flags = {"out": (False,), "in": (True,), "both": (False, True)}[direction]
+        seen = {root}
+        order = [root]
+        edges = {}
+        frontier = [root]
+        with self._lock:
+            for _ in range(depth):
+                next_frontier = []
+                for u in frontier:
+                    for reverse in reverse_flags:
+                        for eid, v, typ in self._edges(u, reverse):
+                            if types is not None and typ not in types:
+                                continue
+                            if eid in edges:
+                                continue
+                            if max_edges is not None and len(edges) >= max_edges:
+                                return order, edges, True
+                            edges[eid] = (v, u, typ) if reverse else (u, v, typ)
+                            if v not in seen:
+                                seen.add(v)
+                                order.append(v)
+                                next_frontier.append(v)
+                if not next_frontier:
+                    break
+                frontier = next_frontier
+        return order, edges, False
+
+    def _steps(self, node_id, reverse_flags, types, banned_edges):
+        for reverse in reverse_flags:
+            for eid, v, typ in self._edges(node_id, reverse):
+                if (types is None or typ in types) and eid not in banned_edges:
+                    yield v, (eid, reverse, typ)
+
+    def _bidirectional(self, source, target, max_depth, direction, types, banned_nodes, banned_edges, budget):
+        """One shortest path source -> target as (nodes, steps), or None.
+
+        Expands whole levels from whichever side has the smaller frontier,
+        so the first level on which the searches meet holds a shortest
+        path. A step is (edge_id, reversed, type_id), reversed meaning the
+        edge was walked against its stored direction. budget is a
+        one-element list of node visits left, shared across calls.
+        """
+        if source == target:
+            return [source], []
+        forward_flags = {"out": (False,), "in": (True,), "both": (False, True)}[direction]
+        backward_flags = tuple(not r for r in forward_flags)
+        # node -> (previous node, step) on each side
+        parents = ({source: None}, {target: None})
+        frontiers = ([source], [target])
+        depths = [0, 0]
+        while frontiers[0] and frontiers[1] and depths[0] + depths[1] < max_depth:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            flags = forward_flags if side == 0 else backward_flags
+            mine, theirs = parents[side], parents[1 - side]
+            next_frontier = []
+            meet = None
+            for u in frontiers[side]:
+                for v, step in self._steps(u, flags, types, banned_edges):
+                    if v in mine or v in banned_nodes:
+                        continue
+                    mine[v] = (u, step)
+                    budget[0] -= 1
+                    if v in theirs:
+                        meet = v
+                        break
+                    next_frontier.append(v)
+                if meet is not None or budget[0] <= 0:
+                    break
+            depths[side] += 1
+            if meet is not None:
+                return self._join(meet, parents)
+            if budget[0] <= 0:
+                return None
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+        return None
+
+    @staticmethod
+    def _join(meet, parents):
+        forward, backward = parents
+        nodes, steps = [meet], []
+        node = meet
+        while forward[node] is not None:
+            node, step = forward[node]
+            nodes.append(node)
+            steps.append(step)
+        nodes.reverse()
+        steps.reverse()
+        node = meet
+        while backward[node] is not None:
+            # Found walking back from the target: flip to the walk's direction
+            node, (eid, reverse, typ) = backward[node]
+            nodes.append(node)
+            steps.append((eid, not reverse, typ))
+        return nodes, steps
+
+    def shortest_paths(self, source, target, k=1, max_depth=6, direction="both", types=None, max_visits=None):
+        """Up to k shortest loopless paths, shortest first (Yen's algorithm).
+
+        Returns (paths, truncated): each path is (node_ids, steps) as in
+        _bidirectional; truncated when max_visits ran out before the
+        search was complete.
+        """
+        budget = [max_visits or float("inf")]
+        with self._lock:
+            first = self._bidirectional(source, target, max_depth, direction, types, set(), set(), budget)
+            if first is None:
+                return [], budget[0] <= 0
+            found = [first]
+            seen = {tuple(first[1])}
+            candidates = []
+            while len(found) < k:
+                nodes, steps = found[-1]
+                for j in range(len(steps)):
+                    root_nodes, root_steps = nodes[:j + 1], steps[:j]
+                    # Leave the shared root by an edge no accepted path took there
+                    banned_edges = {p_steps[j][0] for p_nodes, p_steps in found
+                                    if len(p_steps) > j and p_nodes[:j + 1] == root_nodes}
+                    spur = self._bidirectional(nodes[j], target, max_depth - j, direction, types,
+                                               set(root_nodes[:-1]), banned_edges, budget)
+                    if spur is not None:
+                        path = (root_nodes[:-1] + spur[0], root_steps + spur[1])
+                        key = tuple(path[1])
+                        if key not in seen:
+                            seen.add(key)
+                            candidates.append(path)
+                    if budget[0] <= 0:
+                        break
+                if not candidates or budget[0] <= 0:
+                    break
+                candidates.sort(key=lambda p: len(p[1]))
+                found.append(candidates.pop(0))
+        return found, budget[0] <= 0
+
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def build(conn):
+    version = database.get_version(conn, VERSION_KEY)
+    snap = snapshot.current()
+    if snap is not None and "relations" in snap.tables() and snapshot.matches(snap, conn, VERSION_KEY):
+        return GraphIndex.from_arrays(
+            *(snap.array("relations", c) for c in ("id", "source_node_id", "target_node_id", "relation_type_id")),
+            version,
+        )
+    cur = conn.cursor()
+    cur.execute("SELECT id, source_node_id, target_node_id, relation_type_id FROM relations")
+    edges = []
+    while True:
+        batch = cur.fetchmany(10000)
+        if not batch:
+            break
+        edges.extend(batch)
+    return GraphIndex(edges, version)
+
+
+def get_index(conn):
+    """Return the process-wide index, (re)building it if missing or stale."""
+    global _index
+    index = _index
+    if index is not None and index.version == database.get_version(conn, VERSION_KEY):
+        return index
+    with _build_lock:
+        if _index is None or _index.version != database.get_version(conn, VERSION_KEY):
+            _index = build(conn)
+        return _index
+
+
+def edge_added(edge_id, source, target, type_id, version):
+    # Called by the routes after committing; a no-op until the index is first used.
+    if _index is not None:
+        _index.add_edge(edge_id, source, target, type_id, version)
+
+
+def edge_removed(edge_id, source, target, type_id, version):
+    if _index is not None:
+        _index.remove_edge(edge_id, source, target, type_id, version)
+
+
+def invalidate():
+    """Force a rebuild on next use, e.g. after rolling back edits already announced here."""
+    index = _index
+    if index is not None:
+        with index._lock:
+            index.version = None
+
+
+def fetch_nodes(cur, node_ids):
+    """Load node rows for the ids, in the given order."""
+    rows = {}
+    ids = list(node_ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cur.execute(
+            f"SELECT id, title, summary, is_instance FROM nodes WHERE id IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for r in cur.fetchall():
+            rows[r[0]] = {"id": r[0], "label": r[1], "summary": r[2], "is_instance": bool(r[3])}
+    return [rows[i] for i in ids if i in rows]
+
+
+def resolve_types(cur, value):
+    """Turn a 'types=' argument of ids and/or names into a set of type ids."""
+    if not value:
+        return None
+    type_ids = set()
+    for token in (t.strip() for t in value.split(",")):
+        if not token:
+            continue
+        if token.isdigit():
+            type_ids.add(int(token))
+            continue
+        cur.execute("SELECT id FROM relation_types WHERE LOWER(name)=?", (token.lower(),))
+        row = cur.fetchone()
+        if row is None:
+            raise ValueError(f"Unknown relation type '{token}'")
+        type_ids.add(row[0])
+    return type_ids
+
+
+def relation_type_names(cur, type_ids):
+    ids = list(type_ids)
+    if not ids:
+        return {}
+    cur.execute(f"SELECT id, name FROM relation_types WHERE id IN ({','.join('?' * len(ids))})", ids)
+    return dict(cur.fetchall())
@@ -0,0 +1,110 @@
+# gunicorn.conf.py
+# Production serving: gunicorn -c gunicorn.conf.py wsgi:application
+# (from backend/; every setting comes from config.py SERVER_*).
+#
+# Worker classes:
+#   gthread  (default) SERVER_WORKERS processes x SERVER_THREADS threads.
+#            Parsing, layout and index builds hold the GIL of one worker
+#            only, so the other workers keep answering.
+#   gevent   the async variant, for the I/O-bound routes: the
+#            /api/changes/stream SSE connections, which each pin a gthread
+#            thread for as long as the client listens, and the summary
+#            jobs, whose LLM calls then wait as greenlets rather than
+#            threads. Run it as a second instance and route those paths
+#            to it (pip install gevent).
+#
+# Preloading (SERVER_PRELOAD): the master imports the app and runs
+# wsgi.warm() before forking, so the spaCy model and the graph index are
+# loaded once and shared copy-on-write. The NLP process pool is off by
+# default here (KNOWLEDGE_NLP_WORKERS=0), since each worker would otherwise
+# spawn its own pool of fresh, unshared models; the workers parse with the
+# model they inherited.
+#
+# Reloading:
+#   kill -HUP <master>    new workers (re-warmed from the master's current
+#                         state), old ones finish their requests within
+#                         SERVER_GRACEFUL_TIMEOUT; the code is not reloaded
+#                         when preloaded
+#   kill -USR2 <master>   new master running the new code alongside the old
+#                         one; then kill -WINCH and -QUIT the old master
+#   kill -TERM <master>   graceful shutdown
+#
+# Metrics: each worker writes its samples to METRICS_DIR (a fresh temp
+# directory unless set) and /metrics sums them, so a scrape sees the whole
+# server whichever worker answers it; see metrics.py.
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault("KNOWLEDGE_NLP_WORKERS", "0")
+
+# Not "config": gunicorn reads every module-level name here as a setting.
+import config as settings  # noqa: E402
+
+if settings.SERVER_WORKER_CLASS == "gevent":
+    # Before the app (and threading) is imported by preload_app; the
+    # worker's own patching would come too late for the preloaded modules.
+    from gevent import monkey
+
+    monkey.patch_all()
+
+bind = settings.SERVER_BIND
+workers = settings.SERVER_WORKERS or multiprocessing.cpu_count() * 2 + 1
+worker_class = settings.SERVER_WORKER_CLASS
+threads = settings.SERVER_THREADS
+worker_connections = settings.SERVER_WORKER_CONNECTIONS
+timeout = settings.SERVER_TIMEOUT
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+keepalive = settings.SERVER_KEEPALIVE
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+preload_app = settings.SERVER_PRELOAD
+proc_name = "knowledge-graph"
+
+_own_metrics_dir = []
+
+
+def on_starting(server):
+    if settings.METRICS_DIR is None:
+        settings.METRICS_DIR = tempfile.mkdtemp(prefix="knowledge-metrics-")
+        _own_metrics_dir.append(settings.METRICS_DIR)
+    else:
+        import metrics
+
+        metrics.clear_shared(settings.METRICS_DIR)
+    if preload_app:
+        import wsgi
+
+        server.log.info("Preloaded %s", wsgi.warm())
+
+
+def on_reload(server):
+    # HUP: bring the master's copy up to date so new workers inherit it
+    if preload_app:
+        import wsgi
+
+        server.log.info("Re-warmed %s", wsgi.warm())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import wsgi
+
+        wsgi.after_fork()
+    if settings.METRICS:
+        import metrics
+
+        metrics.share(settings.METRICS_DIR)
+
+
+def child_exit(server, worker):
+    if settings.METRICS:
+        import metrics
+
+        metrics.process_dead(settings.METRICS_DIR, worker.pid)
+
+
+def on_exit(server):
+    for path in _own_metrics_dir:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,206 @@
+# http_cache.py
+# Revision-based HTTP caching for the read endpoints.
+#
+# graph_versions['graph'] is a single revision counter over the tables the
+# read routes serve. It is bumped by triggers (migration 11; since
+# migration 12 the change_log triggers in changes.py), in the same
+# transaction as the write, so every writer is covered: the
+# routes, bulk_import, summary_jobs, or someone with the sqlite3 shell.
+#
+# A route wrapped in @cached then:
+#   - answers 304 when If-None-Match (or If-Modified-Since) matches the
+#     current revision, without running the view at all
+#   - serves the stored body when this process already rendered the same
+#     URL at the current revision
+#   - otherwise runs the view and keeps its body, keyed by (revision, URL)
+# Bodies are stored as sent: in the negotiated format and, above
+# SERIALIZE_COMPRESS_MIN_BYTES, compressed (serialization.compress).
+# Responses carry a weak ETag, Last-Modified and "Cache-Control: no-cache"
+# so browsers revalidate on every use, which costs one point query here.
+# HTTP dates have whole seconds, so Last-Modified is the modification time
+# rounded up, and it is left out while that second is still running: a
+# write later in the same second would otherwise carry the same date and
+# If-Modified-Since would answer 304 for it. The ETag has no such gap.
+# X-Graph-Revision is the revision a client passes to /api/changes?since=.
+import functools
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from flask import Response, request
+
+import config
+import database
+import serialization
+
+REVISION_KEY = "graph"
+TRACKED_TABLES = ("nodes", "relations", "relation_types", "attributes", "node_attributes")
+# Request headers that change the body for the same URL.
+VARY = ("Accept", "Accept-Encoding")
+
+_BUMP = (
+    "UPDATE graph_versions SET version = version + 1,"
+    " updated_at = (julianday('now') - 2440587.5) * 86400.0"
+    f" WHERE name = '{REVISION_KEY}';"
+)
+
+
+def install(conn):
+    """Add the revision row and the triggers that bump it."""
+    columns = [r[1] for r in conn.execute("PRAGMA table_info(graph_versions)")]
+    if "updated_at" not in columns:
+        conn.execute("ALTER TABLE graph_versions ADD COLUMN updated_at REAL")
+    conn.execute(
+        "INSERT OR IGNORE INTO graph_versions (name, version, updated_at) "
+        "VALUES (?, 0, (julianday('now') - 2440587.5) * 86400.0)",
+        (REVISION_KEY,),
+    )
+    for table in TRACKED_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_revision_{event.lower()} "
+                f"AFTER {event} ON {table} BEGIN {_BUMP} END"
+            )
+
+
+def current(conn):
+    """(revision, modified_at) of the graph."""
+    row = conn.execute(
+        "SELECT version, updated_at FROM graph_versions WHERE name=?", (REVISION_KEY,)
+    ).fetchone()
+    return (row[0], row[1] or 0.0) if row else (0, 0.0)
+
+
+class ResponseCache:
+    """LRU of rendered bodies; entries from older revisions are dropped on sight."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._revision = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "stores": 0, "evictions": 0}
+
+    def _reset(self, revision):
+        # caller holds self._lock
+        if revision != self._revision:
+            self._stats["evictions"] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self._revision = revision
+
+    def get(self, revision, key):
+        with self._lock:
+            if revision == self._revision:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, revision, key, body, mimetype, status, encoding=None):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if self._revision is not None and revision < self._revision:
+                return  # rendered before a newer write; not worth keeping
+            self._reset(revision)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (body, mimetype, status, encoding)
+            self._bytes += len(body)
+            self._stats["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (evicted, *_) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"entries": len(self._entries), "bytes": self._bytes,
+                          "revision": self._revision, "max_entries": self.max_entries,
+                          "max_bytes": self.max_bytes})
+        return stats
+
+
+cache = ResponseCache(config.HTTP_CACHE_SIZE, config.HTTP_CACHE_MAX_BYTES)
+
+
+def _variant():
+    parts = [request.full_path] + [request.headers.get(h, "") for h in VARY]
+    return "\0".join(parts)
+
+
+def _etag(revision, variant):
+    digest = hashlib.blake2b(variant.encode("utf-8"), digest_size=6).hexdigest()
+    return f'W/"{revision}-{digest}"'
+
+
+def _not_modified(etag, modified_at):
+    inm = request.headers.get("If-None-Match")
+    if inm is not None:
+        return inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]
+    ims = request.headers.get("If-Modified-Since")
+    if ims:
+        try:
+            return math.ceil(modified_at) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _decorate(response, revision, etag, modified_at):
+    response.headers["ETag"] = etag
+    response.headers["X-Graph-Revision"] = str(revision)
+    last_modified = math.ceil(modified_at)
+    if time.time() >= last_modified:
+        response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.update(VARY)
+    return response
+
+
+def cached(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not config.HTTP_CACHE:
+            return view(*args, **kwargs)
+        with database.connection() as conn:
+            revision, modified_at = current(conn)
+        variant = _variant()
+        etag = _etag(revision, variant)
+        if _not_modified(etag, modified_at):
+            cache.count("not_modified")
+            return _decorate(Response(status=304), revision, etag, modified_at)
+
+        entry = cache.get(revision, variant)
+        if entry is not None:
+            body, mimetype, status, encoding = entry
+            response = Response(body, status=status, mimetype=mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            return _decorate(response, revision, etag, modified_at)
+
+        response = view(*args, **kwargs)
+        if isinstance(response, tuple):
+            # Error tuples such as (jsonify(...), 404) pass through uncached
+            return response
+        if response.status_code == 200 and not response.is_streamed:
+            serialization.compress(response)
+            cache.put(revision, variant, response.get_data(), response.mimetype, response.status_code,
+                      response.headers.get("Content-Encoding"))
+        return _decorate(response, revision, etag, modified_at)
+    return wrapper
@@ -0,0 +1,315 @@
+# layout.py
+# Server-side force-directed layout for the default network view.
+#
+# Positions live in node_positions and are served by /api/layout, so the
+# browser only draws. GET /api/layout only reads them: when the graph has
+# changed since they were computed it answers with the stored positions and
+# "stale": true, and queues a refresh on LayoutService's background thread
+# (POST /api/layout queues one explicitly, {"full": true} from scratch). A
+# lease row in graph_versions lets one process at a time compute, so the
+# gunicorn workers do not all repeat the same layout. The layout is a Fruchterman-Reingold simulation in
+# NumPy with a one-level Barnes-Hut approximation for repulsion: nodes are
+# binned into a grid of cells holding about LAYOUT_CELL_NODES nodes each;
+# nodes in the 3x3 block around a node's cell repel it exactly, every other
+# cell acts as a single body at its centroid. One iteration is then
+# O(n * cells) instead of O(n^2).
+#
+# refresh() keeps the stored layout current:
+#   - nothing changed (no unplaced nodes, relations version as last seen):
+#     positions are returned as stored
+#   - a few nodes or edges changed: new nodes start next to their placed
+#     neighbours and a short, cool simulation runs in which placed nodes
+#     move at LAYOUT_WARM_MOBILITY of full speed, so the picture the user
+#     already knows stays put
+#   - no positions yet, or more than LAYOUT_FULL_RATIO of the nodes are new:
+#     full layout from scratch
+# Pinned nodes (dragged by the user, see pin()) never move.
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import config
+import database
+import graph_index
+
+SEEN_KEY = "layout.relations"  # relations version the stored layout reflects
+LEASE_KEY = "layout.lease"  # updated_at = when a process started computing, 0 when none is
+
+_lock = threading.Lock()
+
+
+def _repulsion(pos, k):
+    n = len(pos)
+    force = np.zeros_like(pos)
+    if n < 2:
+        return force
+    lo = pos.min(axis=0)
+    span = max(float(np.ptp(pos, axis=0).max()), 1e-9)
+    g = max(1, int(math.sqrt(n / config.LAYOUT_CELL_NODES)))
+    grid = np.minimum(((pos - lo) / span * g).astype(np.int64), g - 1)
+    cell = grid[:, 0] * g + grid[:, 1]
+
+    order = np.argsort(cell, kind="stable")
+    counts = np.bincount(cell, minlength=g * g)
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    occupied = np.flatnonzero(counts)
+    cxy = np.stack((occupied // g, occupied % g), axis=1)
+    centroids = np.stack((
+        np.bincount(cell, weights=pos[:, 0], minlength=g * g)[occupied],
+        np.bincount(cell, weights=pos[:, 1], minlength=g * g)[occupied],
+    ), axis=1) / counts[occupied, None]
+
+    # Far field: every cell outside a node's 3x3 block, as one body. Rows go
+    # in chunks so the (rows x cells x 2) temporaries stay small.
+    step = max(1, 2 ** 22 // len(occupied))
+    for i in range(0, n, step):
+        delta = pos[i:i + step, None, :] - centroids[None, :, :]
+        dist2 = np.einsum("ijk,ijk->ij", delta, delta)
+        near = (np.abs(grid[i:i + step, None, :] - cxy[None, :, :]) <= 1).all(axis=2)
+        weight = np.where(near, 0.0, counts[occupied] / np.maximum(dist2, 1e-9))
+        force[i:i + step] += np.einsum("ij,ijk->ik", weight, delta)
+
+    # Near field: exact pairwise forces within each 3x3 block.
+    for c, (cx, cy) in zip(occupied, cxy):
+        members = order[starts[c]:starts[c + 1]]
+        block = [
+            order[starts[b]:starts[b + 1]]
+            for x in range(max(cx - 1, 0), min(cx + 2, g))
+            for y in range(max(cy - 1, 0), min(cy + 2, g))
+            for b in (x * g + y,)
+            if counts[b]
+        ]
+        others = np.concatenate(block)
+        d = pos[members, None, :] - pos[None, others, :]
+        d2 = np.einsum("ijk,ijk->ij", d, d)
+        d2[members[:, None] == others[None, :]] = np.inf
+        force[members] += np.einsum("ij,ijk->ik", 1.0 / np.maximum(d2, 1e-9), d)
+    return force * (k * k)
+
+
+def simulate(pos, edges, iterations, temperature, mobility=None, k=None):
+    """Run the simulation in place on pos (n x 2) and return it.
+
+    edges is an (m x 2) array of row indices. mobility scales each node's
+    step (0 = fixed).
+    """
+    n = len(pos)
+    if n == 0:
+        return pos
+    k = k or config.LAYOUT_EDGE_LENGTH
+    src, dst = (edges[:, 0], edges[:, 1]) if len(edges) else (np.empty(0, np.int64),) * 2
+    cooling = (0.01 ** (1.0 / iterations)) if iterations else 1.0
+    t = temperature
+    rng = np.random.default_rng(0)
+    for _ in range(iterations):
+        force = _repulsion(pos, k)
+        if len(src):
+            delta = pos[src] - pos[dst]
+            dist = np.sqrt(np.einsum("ij,ij->i", delta, delta))[:, None]
+            pull = delta * dist / k
+            for axis in (0, 1):
+                force[:, axis] -= np.bincount(src, weights=pull[:, axis], minlength=n)
+                force[:, axis] += np.bincount(dst, weights=pull[:, axis], minlength=n)
+        # Gravity keeps disconnected components from drifting apart.
+        force -= pos * config.LAYOUT_GRAVITY
+        length = np.sqrt(np.einsum("ij,ij->i", force, force))[:, None]
+        step = force / np.maximum(length, 1e-9) * np.minimum(length, t)
+        if mobility is not None:
+            step *= mobility[:, None]
+        pos += step
+        # Separate nodes that landed on the same spot.
+        dup = length[:, 0] == 0
+        if dup.any():
+            pos[dup] += rng.normal(scale=k * 0.01, size=(int(dup.sum()), 2))
+        t *= cooling
+    return pos
+
+
+def _load(cur):
+    cur.execute("SELECT id FROM nodes ORDER BY id")
+    ids = np.fromiter((r[0] for r in cur.fetchall()), dtype=np.int64)
+    cur.execute("SELECT node_id, x, y, pinned FROM node_positions")
+    stored = {r[0]: (r[1], r[2], bool(r[3])) for r in cur.fetchall()}
+    cur.execute("SELECT DISTINCT source_node_id, target_node_id FROM relations "
+                "WHERE source_node_id <> target_node_id")
+    pairs = cur.fetchall()
+    return ids, stored, pairs
+
+
+def _changed_nodes(cur):
+    # Both directions are primary-key probes, no relations are read.
+    cur.execute("SELECT EXISTS (SELECT 1 FROM nodes WHERE id NOT IN (SELECT node_id FROM node_positions)) "
+                "OR EXISTS (SELECT 1 FROM node_positions WHERE node_id NOT IN (SELECT id FROM nodes))")
+    return bool(cur.fetchone()[0])
+
+
+def _edge_rows(ids, pairs):
+    row = {int(n): i for i, n in enumerate(ids)}
+    edges = [(row[s], row[t]) for s, t in pairs if s in row and t in row]
+    return np.array(edges, dtype=np.int64).reshape(-1, 2)
+
+
+def _initial(ids, stored, edges, k):
+    """Stored positions, with new nodes placed beside their placed neighbours."""
+    n = len(ids)
+    pos = np.zeros((n, 2))
+    placed = np.zeros(n, dtype=bool)
+    for i, node_id in enumerate(ids):
+        if int(node_id) in stored:
+            pos[i] = stored[int(node_id)][:2]
+            placed[i] = True
+    rng = np.random.default_rng(int(n))
+    radius = k * math.sqrt(max(n, 1))
+    new = np.flatnonzero(~placed)
+    if len(new):
+        sums = np.zeros((n, 2))
+        hits = np.zeros(n)
+        for a, b in ((edges[:, 0], edges[:, 1]), (edges[:, 1], edges[:, 0])):
+            ok = placed[b]
+            np.add.at(sums, a[ok], pos[b[ok]])
+            np.add.at(hits, a[ok], 1)
+        anchored = new[hits[new] > 0]
+        pos[anchored] = sums[anchored] / hits[anchored, None]
+        pos[anchored] += rng.normal(scale=k * 0.5, size=(len(anchored), 2))
+        loose = new[hits[new] == 0]
+        pos[loose] = rng.uniform(-radius, radius, size=(len(loose), 2))
+        if placed.any():
+            pos[loose] *= 0.5
+            pos[loose] += pos[placed].mean(axis=0)
+    return pos, placed
+
+
+def is_stale(conn):
+    """True if relations or nodes changed since the stored layout was computed."""
+    version = database.get_version(conn, graph_index.VERSION_KEY)
+    return version != database.get_version(conn, SEEN_KEY) or _changed_nodes(conn.cursor())
+
+
+def compute(conn, full=False):
+    """Bring node_positions up to date and return {"mode", "nodes", ...}; commits."""
+    cur = conn.cursor()
+    k = config.LAYOUT_EDGE_LENGTH
+    version = database.get_version(conn, graph_index.VERSION_KEY)
+    if not full and not is_stale(conn):
+        return {"mode": "cached", "moved": 0}
+
+    ids, stored, pairs = _load(cur)
+    live = set(int(n) for n in ids)
+    gone = [n for n in stored if n not in live]
+    new = len(live) - (len(stored) - len(gone))
+    edges = _edge_rows(ids, pairs)
+    pos, placed = _initial(ids, stored, edges, k)
+    pinned = np.array([stored.get(int(n), (0, 0, False))[2] for n in ids], dtype=bool)
+    if full or not placed.any() or new > len(ids) * config.LAYOUT_FULL_RATIO:
+        mode = "full"
+        if full or not placed.any():
+            free = ~pinned
+            pos[free] = np.random.default_rng(len(ids)).uniform(
+                -k * math.sqrt(len(ids)), k * math.sqrt(len(ids)), size=(int(free.sum()), 2))
+        mobility = np.where(pinned, 0.0, 1.0)
+        simulate(pos, edges, config.LAYOUT_ITERATIONS, k * math.sqrt(max(len(ids), 1)) / 4, mobility, k)
+    else:
+        mode = "incremental"
+        mobility = np.where(placed, config.LAYOUT_WARM_MOBILITY, 1.0)
+        mobility[pinned] = 0.0
+        simulate(pos, edges, config.LAYOUT_WARM_ITERATIONS, k / 4, mobility, k)
+
+    if gone:
+        cur.executemany("DELETE FROM node_positions WHERE node_id=?", [(n,) for n in gone])
+    cur.executemany(
+        "INSERT INTO node_positions (node_id, x, y) VALUES (?, ?, ?) "
+        "ON CONFLICT(node_id) DO UPDATE SET x=excluded.x, y=excluded.y",
+        [(int(n), float(x), float(y)) for n, (x, y) in zip(ids, pos)],
+    )
+    _set_seen(cur, version)
+    conn.commit()
+    return {"mode": mode, "moved": len(ids) - int(pinned.sum())}
+
+
+def _set_seen(cur, version):
+    cur.execute(
+        "INSERT INTO graph_versions (name, version) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET version=excluded.version",
+        (SEEN_KEY, version),
+    )
+
+
+def refresh(conn, full=False):
+    # One layout at a time per process; readers of the old rows are unaffected.
+    with _lock:
+        return compute(conn, full=full)
+
+
+def _claim(conn):
+    now = time.time()
+    conn.execute("INSERT OR IGNORE INTO graph_versions (name, version, updated_at) VALUES (?, 0, 0)", (LEASE_KEY,))
+    # A lease older than LAYOUT_LEASE belonged to a process that died computing
+    claimed = conn.execute(
+        "UPDATE graph_versions SET version = version + 1, updated_at = ? "
+        "WHERE name = ? AND COALESCE(updated_at, 0) < ?",
+        (now, LEASE_KEY, now - config.LAYOUT_LEASE),
+    ).rowcount
+    conn.commit()
+    return bool(claimed)
+
+
+def _release(conn):
+    conn.execute("UPDATE graph_versions SET updated_at = 0 WHERE name = ?", (LEASE_KEY,))
+    conn.commit()
+
+
+class LayoutService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = None
+
+    def schedule(self, full=False):
+        """Queue a refresh; False if one is already queued or running here (full ones always queue)."""
+        with self._lock:
+            if not full and self._pending is not None and not self._pending.done():
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="layout")
+            self._pending = self._executor.submit(self.run, full)
+            return True
+
+    def run(self, full=False):
+        """refresh() under the cross-process lease; None if another process holds it."""
+        with database.connection() as conn:
+            if not _claim(conn):
+                return None
+            try:
+                return refresh(conn, full=full)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                _release(conn)
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+service = LayoutService()
+
+
+def positions(cur):
+    cur.execute("SELECT node_id, x, y, pinned FROM node_positions ORDER BY node_id")
+    return [{"id": r[0], "x": round(r[1], 2), "y": round(r[2], 2), "pinned": bool(r[3])}
+            for r in cur.fetchall()]
+
+
+def pin(conn, node_id, x, y, pinned=True):
+    conn.execute(
+        "INSERT INTO node_positions (node_id, x, y, pinned) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(node_id) DO UPDATE SET x=excluded.x, y=excluded.y, pinned=excluded.pinned",
+        (node_id, float(x), float(y), int(bool(pinned))),
+    )
+    conn.commit()
@@ -0,0 +1,504 @@
+# metrics.py
+# In-process instrumentation, served in Prometheus text format at /metrics.
+#
+# What is measured:
+#   - every request, as a histogram per route, method and status
+#     (init_app installs the hooks)
+#   - every SQL statement run through a pooled cursor: count and time per
+#     normalized statement, plus a latency histogram (database.PooledCursor
+#     calls sql_executed/sql_fetched); statements slower than
+#     METRICS_SLOW_QUERY_MS are logged with their EXPLAIN QUERY PLAN
+#   - named stages: "nlp" (spaCy pipeline), "highlight" (highlight_text),
+#     "llm" (summary generation, e.g. OpenAI), "json" (serialization) and
+#     "compress" (gzip/brotli of large responses)
+#
+# Stage timings taken in the NLP pool workers are sent back with the parse
+# results (nlp_pool) and replayed here, so they show up in the web process.
+# With SERVER_TIMING on, each response also carries a Server-Timing header
+# with the time its request spent per stage.
+#
+# Recording is a perf_counter pair, a bisect and a short lock per sample.
+#
+# Each process records into its own registry. Under gunicorn every worker
+# also calls share(METRICS_DIR) after the fork: it rewrites
+# <METRICS_DIR>/<pid>-<start>.json every METRICS_FLUSH_INTERVAL seconds and
+# at exit, and render() in whichever worker answers the scrape sums the
+# counters and histograms of all the files. When a worker exits the master
+# folds its file into archive.json (process_dead), so totals never go
+# backwards across worker recycles. Gauges (the add_collector values) are
+# per process: they are exported with a pid label, for live workers only.
+# The slow-query log stays per process.
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import config
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._series)
+
+    def render(self, series=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        series = sorted((self.snapshot() if series is None else series).items())
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in series]
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def render(self, series=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        series = sorted((self.snapshot() if series is None else series).items())
+        for labels, counts in series:
+            total = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                total += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {counts[-1]!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {total}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUESTS = Histogram("knowledge_http_request_duration_seconds", "Request handling time.",
+                     ("route", "method", "status"))
+STAGES = Histogram("knowledge_stage_duration_seconds", "Time spent per stage (sql, nlp, highlight, llm, json).",
+                   ("stage",))
+SQL = Histogram("knowledge_sql_query_duration_seconds", "Time per SQL statement, execute and fetch.")
+SQL_CALLS = Counter("knowledge_sql_statement_calls_total", "Executions per normalized SQL statement.",
+                    ("statement",))
+SQL_SECONDS = Counter("knowledge_sql_statement_seconds_total", "Time per normalized SQL statement.",
+                      ("statement",))
+SLOW_QUERIES = Counter("knowledge_sql_slow_queries_total", "Statements slower than METRICS_SLOW_QUERY_MS.")
+
+METRICS = [REQUESTS, STAGES, SQL, SQL_CALLS, SQL_SECONDS, SLOW_QUERIES]
+
+# name -> callable returning a dict; numeric values are exported as gauges
+_collectors = {}
+
+_local = threading.local()
+
+
+# -- stages -----------------------------------------------------------------
+
+def record(stage, seconds):
+    STAGES.observe(seconds, (stage,))
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        entry = timings.get(stage)
+        if entry is None:
+            timings[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+    captured = getattr(_local, "captured", None)
+    if captured is not None:
+        captured.append((stage, seconds))
+
+
+@contextmanager
+def stage(name):
+    if not config.METRICS:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0)
+
+
+def timed_iter(name, iterable):
+    """Yield from iterable, recording the time spent producing each item."""
+    it = iter(iterable)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        if config.METRICS:
+            record(name, time.perf_counter() - t0)
+        yield item
+
+
+@contextmanager
+def capture():
+    """Collect the (stage, seconds) samples recorded by this thread, e.g. in a pool worker."""
+    previous = getattr(_local, "captured", None)
+    _local.captured = samples = []
+    try:
+        yield samples
+    finally:
+        _local.captured = previous
+
+
+def replay(samples):
+    # Samples captured in another process, recorded as if taken here
+    for name, seconds in samples:
+        record(name, seconds)
+
+
+# -- SQL --------------------------------------------------------------------
+
+_WS_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+_statement_keys = {}
+_known_statements = set()
+_slow = deque(maxlen=config.METRICS_SLOW_QUERY_LOG)
+_slow_lock = threading.Lock()
+
+
+def statement_key(sql):
+    """SQL with whitespace collapsed and IN (?, ?, ...) lists folded, for grouping."""
+    key = _statement_keys.get(sql)
+    if key is None:
+        key = _IN_LIST_RE.sub("?, ...", _WS_RE.sub(" ", sql).strip())[:200]
+        if key not in _known_statements:
+            if len(_known_statements) >= config.METRICS_MAX_STATEMENTS:
+                key = "other"
+            else:
+                _known_statements.add(key)
+        if len(_statement_keys) > 4 * config.METRICS_MAX_STATEMENTS:
+            _statement_keys.clear()
+        _statement_keys[sql] = key
+    return key
+
+
+def sql_executed(cursor, sql, parameters, seconds):
+    """Account one execute (or executemany) of sql on cursor."""
+    key = statement_key(sql)
+    cursor._metrics_statement = (key, sql, parameters)
+    cursor._metrics_seconds = seconds
+    SQL_CALLS.inc((key,))
+    _sql_time(key, seconds)
+    if cursor.description is None:
+        # Nothing to fetch: the statement is complete
+        _check_slow(cursor, seconds)
+
+
+def sql_fetched(cursor, seconds, drained):
+    statement = getattr(cursor, "_metrics_statement", None)
+    if statement is None:
+        return
+    _sql_time(statement[0], seconds)
+    cursor._metrics_seconds += seconds
+    if drained:
+        _check_slow(cursor, cursor._metrics_seconds)
+
+
+def _sql_time(key, seconds):
+    SQL.observe(seconds)
+    SQL_SECONDS.inc((key,), seconds)
+    record("sql", seconds)
+
+
+def _check_slow(cursor, seconds):
+    threshold = config.METRICS_SLOW_QUERY_MS
+    if not threshold or seconds * 1000 < threshold:
+        return
+    key, sql, parameters = cursor._metrics_statement
+    plan = None
+    if sql.lstrip()[:6].upper() in ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT"):
+        try:
+            # A plain sqlite3.Cursor, so the EXPLAIN is not itself instrumented
+            rows = sqlite3.Cursor(cursor.connection).execute(
+                "EXPLAIN QUERY PLAN " + sql, parameters if isinstance(parameters, (tuple, list, dict)) else ()
+            ).fetchall()
+            plan = [r[-1] for r in rows]
+        except Exception:
+            pass
+    entry = {"statement": key, "ms": round(seconds * 1000, 3), "plan": plan, "at": time.time()}
+    with _slow_lock:
+        _slow.append(entry)
+    SLOW_QUERIES.inc()
+    log.warning("slow query (%.1f ms): %s plan=%s", seconds * 1000, key, plan)
+
+
+def slow_queries():
+    with _slow_lock:
+        return list(reversed(_slow))
+
+
+# -- requests ---------------------------------------------------------------
+
+def begin_request():
+    _local.timings = {}
+    _local.started = time.perf_counter()
+
+
+def end_request(route, method, status):
+    """Record the request; returns its per-stage timings and total seconds."""
+    timings = getattr(_local, "timings", None)
+    started = getattr(_local, "started", None)
+    _local.timings = _local.started = None
+    if started is None:
+        return None, None
+    total = time.perf_counter() - started
+    REQUESTS.observe(total, (route, method, str(status)))
+    return timings, total
+
+
+def server_timing(timings, total):
+    parts = [f'{name};dur={seconds * 1000:.3f};desc="{count}x"' for name, (seconds, count) in timings.items()]
+    parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts)
+
+
+def init_app(app):
+    """Install the request hooks on a Flask app (serialization.JSONProvider times "json")."""
+    from flask import request
+
+    @app.before_request
+    def _begin():
+        if config.METRICS:
+            begin_request()
+
+    @app.after_request
+    def _end(response):
+        if not config.METRICS:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        timings, total = end_request(route, request.method, response.status_code)
+        if config.SERVER_TIMING and timings is not None:
+            response.headers["Server-Timing"] = server_timing(timings, total)
+        return response
+
+
+def reset():
+    """Forget every sample, e.g. in a worker forked from a master that recorded some."""
+    for metric in METRICS:
+        metric.reset()
+    with _slow_lock:
+        _slow.clear()
+
+
+def add_collector(prefix, fn):
+    """Export the numeric values of fn() as gauges named prefix_<key> at each scrape."""
+    _collectors[prefix] = fn
+
+
+def _gauges():
+    gauges = {}
+    for prefix, fn in _collectors.items():
+        try:
+            values = fn()
+        except Exception:
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges[f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)}"] = value
+    return gauges
+
+
+def render():
+    lines = []
+    if _shared["path"] is not None:
+        flush()
+        series, gauges = _gather(_shared["dir"])
+    else:
+        series, gauges = {}, {None: _gauges()}
+    for metric in METRICS:
+        lines += metric.render(series.get(metric.name, {}) if _shared["path"] is not None else None)
+    names = sorted({name for values in gauges.values() for name in values})
+    for name in names:
+        lines.append(f"# TYPE {name} gauge")
+        for pid, values in sorted(gauges.items(), key=lambda item: item[0] or ""):
+            if name in values:
+                labels = _labels(("pid",), (pid,)) if pid is not None else ""
+                lines.append(f"{name}{labels} {_number(values[name])}")
+    return "\n".join(lines) + "\n"
+
+
+# -- sharing between worker processes ----------------------------------------
+
+ARCHIVE = "archive.json"
+_FOLDED_KEEP = 60  # s a folded file stays on disk, for scrapes that listed it just before
+
+_shared = {"dir": None, "path": None, "pid": None}
+
+
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(total, series):
+    for labels, value in series:
+        labels = tuple(labels)
+        old = total.get(labels)
+        if old is None:
+            total[labels] = value
+        elif isinstance(value, list):
+            total[labels] = [a + b for a, b in zip(old, value)]
+        else:
+            total[labels] = old + value
+
+
+def flush():
+    """Rewrite this process's file in the shared directory, if share() was called here."""
+    if _shared["pid"] != os.getpid():
+        return  # not sharing, or a child forked from a process that is
+    _write(_shared["path"], {
+        "pid": os.getpid(),
+        "metrics": {m.name: [[list(k), v] for k, v in m.snapshot().items()] for m in METRICS},
+        "gauges": _gauges(),
+    })
+
+
+def share(directory):
+    """Publish this process's samples in directory for render() in any process to sum; call after the fork."""
+    os.makedirs(directory, exist_ok=True)
+    _shared.update(dir=directory, pid=os.getpid(),
+                   path=os.path.join(directory, f"{os.getpid()}-{int(time.time() * 1000)}.json"))
+    flush()
+
+    def loop():
+        while True:
+            time.sleep(config.METRICS_FLUSH_INTERVAL)
+            try:
+                flush()
+            except OSError as e:
+                log.warning("metrics not written to %s: %s", directory, e)
+
+    threading.Thread(target=loop, name="metrics-flush", daemon=True).start()
+    atexit.register(flush)
+
+
+def _gather(directory):
+    """(metric name -> summed series, pid -> gauges) over the archive and the live processes' files."""
+    names = os.listdir(directory)
+    archive = _read(os.path.join(directory, ARCHIVE)) or {"metrics": {}, "folded": {}}
+    totals = {}
+    for name, series in archive["metrics"].items():
+        _merge(totals.setdefault(name, {}), series)
+    gauges = {}
+    for filename in names:
+        if not filename.endswith(".json") or filename == ARCHIVE or filename in archive["folded"]:
+            continue
+        data = _read(os.path.join(directory, filename))
+        if data is None:
+            continue
+        for name, series in data["metrics"].items():
+            _merge(totals.setdefault(name, {}), series)
+        gauges[str(data["pid"])] = data["gauges"]
+    return totals, gauges
+
+
+def process_dead(directory, pid):
+    """Fold an exited worker's counters and histograms into the archive; its gauges are dropped.
+
+    Called by the master only (gunicorn child_exit), so the archive has a single writer.
+    """
+    path = os.path.join(directory, ARCHIVE)
+    archive = _read(path) or {"metrics": {}, "folded": {}}
+    now = time.time()
+    for filename, folded_at in list(archive["folded"].items()):
+        if now - folded_at > _FOLDED_KEEP:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+            del archive["folded"][filename]
+    for file_path in glob.glob(os.path.join(directory, f"{pid}-*.json")):
+        filename = os.path.basename(file_path)
+        data = _read(file_path)
+        if filename in archive["folded"] or data is None:
+            continue
+        for name, series in data["metrics"].items():
+            total = {}
+            _merge(total, archive["metrics"].get(name, []))
+            _merge(total, series)
+            archive["metrics"][name] = [[list(k), v] for k, v in total.items()]
+        # Scrapes skip it from now on; it is deleted on a later call
+        archive["folded"][filename] = now
+    _write(path, archive)
+
+
+def clear_shared(directory):
+    """Remove the files of a previous server run."""
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
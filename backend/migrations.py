@@ -0,0 +1,437 @@
+# migrations.py
+# Versioned schema migrations, applied by app.py at startup.
+#
+# The applied version is stored in SQLite's PRAGMA user_version, so a
+# migration runs exactly once per database. Add new entries to MIGRATIONS
+# with the next version number; never edit one that has shipped.
+#
+# A step's DDL, triggers and data fills are spelled out here, not taken
+# from the modules: their install() helpers are for new code and keep
+# changing, and a database migrating from an old version must still get
+# what each step did when it shipped.
+#
+# Usage:
+#   python migrations.py            # apply pending migrations
+#   python migrations.py check      # fail if a hot query falls back to a scan
+import re
+import sqlite3
+import sys
+from collections import deque
+from datetime import date
+
+import config
+
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+_EVENTS = ("INSERT", "UPDATE", "DELETE")
+# The tables whose edits bump the graph revision (migrations 11 and 12)
+_GRAPH_TABLES = ("nodes", "relations", "relation_types", "attributes", "node_attributes")
+
+
+def _fill_closure(conn):
+    # Migration 6: relation_closure for the relations already stored. Types
+    # pair up with the type their inverse_name names, when it names them
+    # back, under the lower id; symmetric families get both directions.
+    types = {r[0]: r for r in conn.execute(
+        "SELECT id, name, inverse_name, is_symmetric, is_transitive FROM relation_types")}
+
+    def flag(value):
+        return str(value).strip().lower() in ("1", "yes", "true")
+
+    done = set()
+    for type_id, name, inverse_name, symmetric, transitive in types.values():
+        name, inverse_name = (name or "").lower(), (inverse_name or "").strip().lower()
+        partner = None
+        if inverse_name and inverse_name != name:
+            partner = next((t for t in types.values() if t[0] != type_id and (t[1] or "").lower() == inverse_name
+                            and (t[2] or "").strip().lower() == name), None)
+        canonical = type_id if partner is None else min(type_id, partner[0])
+        other = None if partner is None else max(type_id, partner[0])
+        if canonical in done:
+            continue
+        done.add(canonical)
+        symmetric = flag(symmetric) or (partner is not None and flag(partner[3]))
+        if not (flag(transitive) or (partner is not None and flag(partner[4]))):
+            continue
+        adjacency = {}
+        for source, target, rel_type in conn.execute(
+                "SELECT source_node_id, target_node_id, relation_type_id FROM relations "
+                "WHERE relation_type_id IN (?, ?)", (canonical, other if other is not None else -1)).fetchall():
+            edge = (source, target) if rel_type == canonical else (target, source)
+            for a, b in [edge, edge[::-1]] if symmetric else [edge]:
+                adjacency.setdefault(a, set()).add(b)
+        for start in list(adjacency):
+            depths, queue = {start: 0}, deque([start])
+            while queue:
+                node = queue.popleft()
+                for nxt in adjacency.get(node, ()):
+                    if nxt not in depths:
+                        depths[nxt] = depths[node] + 1
+                        queue.append(nxt)
+            conn.executemany(
+                "INSERT INTO relation_closure (relation_type_id, source_node_id, target_node_id, depth) "
+                "VALUES (?, ?, ?, ?)", [(canonical, start, t, d) for t, d in depths.items() if t != start])
+
+
+def _fill_value_num(conn):
+    # Migration 13: value_num of the stored values of the ordered data types;
+    # integers and floats as-is, booleans 0/1, dates as days since 1970-01-01.
+    def typed(data_type, value):
+        try:
+            if data_type == "integer":
+                return int(value)
+            if data_type == "float":
+                return float(value)
+            if data_type == "boolean":
+                return 1 if str(value).strip().lower() in ("true", "1") else 0
+            return (date.fromisoformat(str(value).strip()) - date(1970, 1, 1)).days
+        except (TypeError, ValueError):
+            return None
+
+    rows = conn.execute(
+        "SELECT na.id, a.data_type, na.value FROM node_attributes na JOIN attributes a ON a.id = na.attribute_id "
+        "WHERE a.data_type IN ('integer', 'float', 'boolean', 'date')").fetchall()
+    conn.executemany("UPDATE node_attributes SET value_num=? WHERE id=?",
+                     [(typed(data_type, value), na_id) for na_id, data_type, value in rows])
+
+
+def _change_triggers():
+    # Migration 12: one trigger per table and event bumps the revision and
+    # logs the row, replacing the revision-only triggers of migration 11
+    # (the order of two triggers on one event is unspecified).
+    statements = []
+    for table in _GRAPH_TABLES:
+        for event in _EVENTS:
+            ref = "old" if event == "DELETE" else "new"
+            statements += [
+                f"DROP TRIGGER IF EXISTS {table}_revision_{event.lower()}",
+                f"CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()} AFTER {event} ON {table} BEGIN"
+                f" UPDATE graph_versions SET version = version + 1, updated_at = {_NOW} WHERE name = 'graph';"
+                " INSERT INTO change_log (rev, tbl, op, row_id, changed_at)"
+                f" SELECT version, '{table}', '{event.lower()}', {ref}.id, updated_at"
+                " FROM graph_versions WHERE name = 'graph';"
+                " END",
+            ]
+    return statements
+
+
+MIGRATIONS = [
+    (1, "indexes for relation lookups by source, target and type", [
+        # Duplicate edges have always been rejected by create_relation(); drop
+        # any that slipped in before the constraint existed.
+        """
+        DELETE FROM relations WHERE id NOT IN (
+            SELECT MIN(id) FROM relations
+            GROUP BY source_node_id, target_node_id, relation_type_id
+        )
+        """,
+        # Doubles as the outgoing-edge index: (source, target, type) covers
+        # neighbors() and the source half of delete_node()'s count.
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_relations_unique "
+        "ON relations(source_node_id, target_node_id, relation_type_id)",
+        "CREATE INDEX IF NOT EXISTS idx_relations_target "
+        "ON relations(target_node_id, source_node_id, relation_type_id)",
+        "CREATE INDEX IF NOT EXISTS idx_relations_type "
+        "ON relations(relation_type_id, source_node_id, target_node_id)",
+    ]),
+    (2, "index node_attributes by node", [
+        "CREATE INDEX IF NOT EXISTS idx_node_attributes_node "
+        "ON node_attributes(node_id, attribute_id)",
+    ]),
+    (3, "case-insensitive lookups for node titles and relation type names", [
+        "CREATE INDEX IF NOT EXISTS idx_nodes_title_lower ON nodes(LOWER(title))",
+        "CREATE INDEX IF NOT EXISTS idx_relation_types_name_lower ON relation_types(LOWER(name))",
+    ]),
+    (4, "refresh planner statistics", [
+        "ANALYZE",
+    ]),
+    (5, "change counters for in-process caches", [
+        "CREATE TABLE IF NOT EXISTS graph_versions ("
+        " name TEXT PRIMARY KEY,"
+        " version INTEGER NOT NULL DEFAULT 0"
+        ") WITHOUT ROWID",
+    ]),
+    (6, "materialized closure for transitive relation types", [
+        "CREATE TABLE IF NOT EXISTS relation_closure ("
+        " relation_type_id INTEGER NOT NULL,"
+        " source_node_id INTEGER NOT NULL,"
+        " target_node_id INTEGER NOT NULL,"
+        " depth INTEGER NOT NULL,"
+        " PRIMARY KEY (relation_type_id, source_node_id, target_node_id)"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS idx_relation_closure_target "
+        "ON relation_closure(relation_type_id, target_node_id, source_node_id, depth)",
+        _fill_closure,
+    ]),
+    (7, "on-disk tier of the NLP parse cache", [
+        "CREATE TABLE IF NOT EXISTS parse_cache ("
+        " key TEXT PRIMARY KEY,"
+        " kind TEXT NOT NULL,"
+        " value TEXT NOT NULL,"
+        " created_at REAL NOT NULL"
+        ") WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS idx_parse_cache_created ON parse_cache(created_at)",
+    ]),
+    (8, "summary generation jobs and their cache", [
+        "CREATE TABLE IF NOT EXISTS summary_cache ("
+        " title_key TEXT PRIMARY KEY,"
+        " title TEXT NOT NULL,"
+        " summary TEXT NOT NULL,"
+        " model TEXT,"
+        " created_at REAL NOT NULL"
+        ") WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS summary_jobs ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " status TEXT NOT NULL,"
+        " overwrite INTEGER NOT NULL DEFAULT 0,"
+        " total INTEGER NOT NULL DEFAULT 0,"
+        " completed INTEGER NOT NULL DEFAULT 0,"
+        " cached INTEGER NOT NULL DEFAULT 0,"
+        " skipped INTEGER NOT NULL DEFAULT 0,"
+        " failed INTEGER NOT NULL DEFAULT 0,"
+        " error TEXT,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " finished_at REAL"
+        ")",
+        "CREATE TABLE IF NOT EXISTS summary_job_items ("
+        " job_id INTEGER NOT NULL,"
+        " node_id INTEGER NOT NULL,"
+        " status TEXT NOT NULL,"
+        " error TEXT,"
+        " PRIMARY KEY (job_id, node_id)"
+        ") WITHOUT ROWID",
+    ]),
+    (9, "stored node positions for the server-side layout", [
+        "CREATE TABLE IF NOT EXISTS node_positions ("
+        " node_id INTEGER PRIMARY KEY,"
+        " x REAL NOT NULL,"
+        " y REAL NOT NULL,"
+        " pinned INTEGER NOT NULL DEFAULT 0"
+        ")",
+    ]),
+    (10, "full-text index over node titles, qualifiers and summaries", [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5("
+        " title, qualifier, summary,"
+        " content='nodes', content_rowid='id',"
+        " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        """
+        CREATE TRIGGER IF NOT EXISTS nodes_fts_insert AFTER INSERT ON nodes BEGIN
+            INSERT INTO nodes_fts (rowid, title, qualifier, summary)
+            VALUES (new.id, new.title, new.qualifier, new.summary);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS nodes_fts_delete AFTER DELETE ON nodes BEGIN
+            INSERT INTO nodes_fts (nodes_fts, rowid, title, qualifier, summary)
+            VALUES ('delete', old.id, old.title, old.qualifier, old.summary);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS nodes_fts_update AFTER UPDATE OF title, qualifier, summary ON nodes BEGIN
+            INSERT INTO nodes_fts (nodes_fts, rowid, title, qualifier, summary)
+            VALUES ('delete', old.id, old.title, old.qualifier, old.summary);
+            INSERT INTO nodes_fts (rowid, title, qualifier, summary)
+            VALUES (new.id, new.title, new.qualifier, new.summary);
+        END
+        """,
+        "INSERT INTO nodes_fts (nodes_fts) VALUES ('rebuild')",
+    ]),
+    (11, "graph revision counter for HTTP caching", [
+        "ALTER TABLE graph_versions ADD COLUMN updated_at REAL",
+        f"INSERT OR IGNORE INTO graph_versions (name, version, updated_at) VALUES ('graph', 0, {_NOW})",
+        *[f"CREATE TRIGGER IF NOT EXISTS {table}_revision_{event.lower()} AFTER {event} ON {table} BEGIN "
+          f"UPDATE graph_versions SET version = version + 1, updated_at = {_NOW} WHERE name = 'graph'; END"
+          for table in _GRAPH_TABLES for event in _EVENTS],
+    ]),
+    (12, "change log for delta sync", [
+        "CREATE TABLE IF NOT EXISTS change_log ("
+        " rev INTEGER PRIMARY KEY,"
+        " tbl TEXT NOT NULL,"
+        " op TEXT NOT NULL,"
+        " row_id INTEGER NOT NULL,"
+        " changed_at REAL NOT NULL"
+        ")",
+        "CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(tbl, row_id, rev)",
+        "CREATE INDEX IF NOT EXISTS idx_change_log_time ON change_log(changed_at)",
+        *_change_triggers(),
+    ]),
+    (13, "typed attribute values for range queries", [
+        # NUMERIC affinity keeps integers exact and still compares with floats
+        "ALTER TABLE node_attributes ADD COLUMN value_num NUMERIC",
+        _fill_value_num,
+        "CREATE INDEX IF NOT EXISTS idx_node_attributes_num "
+        "ON node_attributes(attribute_id, value_num, node_id) WHERE value_num IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_node_attributes_value "
+        "ON node_attributes(attribute_id, value, node_id)",
+        "ANALYZE node_attributes",
+    ]),
+    (14, "relation proposals extracted from node summaries", [
+        "CREATE TABLE IF NOT EXISTS relation_proposals ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " node_id INTEGER NOT NULL,"
+        " source_node_id INTEGER NOT NULL,"
+        " target_node_id INTEGER NOT NULL,"
+        " relation_type_id INTEGER,"
+        " predicate TEXT NOT NULL,"
+        " subject TEXT NOT NULL,"
+        " object TEXT NOT NULL,"
+        " status TEXT NOT NULL DEFAULT 'pending',"
+        " relation_id INTEGER,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " UNIQUE (node_id, source_node_id, target_node_id, predicate)"
+        ")",
+        "CREATE INDEX IF NOT EXISTS idx_relation_proposals_status ON relation_proposals(status, id)",
+        "CREATE TABLE IF NOT EXISTS extraction_state ("
+        " node_id INTEGER PRIMARY KEY,"
+        " summary_hash TEXT NOT NULL,"
+        " extracted_at REAL NOT NULL"
+        ")",
+        "CREATE TABLE IF NOT EXISTS extraction_runs ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " status TEXT NOT NULL,"
+        " full INTEGER NOT NULL DEFAULT 0,"
+        " from_rev INTEGER,"
+        " to_rev INTEGER,"
+        " total INTEGER NOT NULL DEFAULT 0,"
+        " processed INTEGER NOT NULL DEFAULT 0,"
+        " parsed INTEGER NOT NULL DEFAULT 0,"
+        " proposed INTEGER NOT NULL DEFAULT 0,"
+        " unmatched INTEGER NOT NULL DEFAULT 0,"
+        " error TEXT,"
+        " created_at REAL NOT NULL,"
+        " updated_at REAL NOT NULL,"
+        " finished_at REAL"
+        ")",
+    ]),
+    (15, "random database id, to tell snapshots of other databases apart", [
+        # 1 .. 2**62, as secrets.randbits(62) + 1; SQLite's random() is seeded from the OS
+        "INSERT OR IGNORE INTO graph_versions (name, version) "
+        "VALUES ('database.id', (random() & 4611686018427387903) + 1)",
+    ]),
+]
+
+# Queries issued on every click or edit; none of them may scan a whole table.
+# Parameters only need the right shape, EXPLAIN never reads them.
+HOT_QUERIES = {
+    "get_node": (
+        "SELECT id, title, summary, is_instance FROM nodes WHERE id=?", (1,)),
+    "neighbors": ("""
+        SELECT n.id, n.title, n.summary, n.is_instance, r.source_node_id, r.target_node_id, rt.name
+        FROM relations r
+        JOIN nodes n ON n.id = r.target_node_id
+        JOIN relation_types rt ON rt.id = r.relation_type_id
+        WHERE r.source_node_id=?
+    """, (1,)),
+    "delete_node.relation_count": (
+        "SELECT COUNT(*) FROM relations WHERE source_node_id=? OR target_node_id=?", (1, 1)),
+    "delete_relation_type.usage_count": (
+        "SELECT COUNT(*) FROM relations WHERE relation_type_id=?", (1,)),
+    "create_relation.duplicate_check": ("""
+        SELECT id FROM relations
+        WHERE source_node_id = ? AND target_node_id = ? AND relation_type_id = ?
+    """, (1, 2, 1)),
+    "create_node.title_lookup": (
+        "SELECT id FROM nodes WHERE LOWER(title) = LOWER(?)", ("cell",)),
+    "create_relation_type.name_lookup": (
+        "SELECT id FROM relation_types WHERE LOWER(name)=?", ("is_a",)),
+    "get_node_attributes": ('''
+        SELECT na.id, na.attribute_id, a.name, a.description, a.data_type, a.allowed_values, a.unit, na.value, na.quantifier
+        FROM node_attributes na
+        JOIN attributes a ON na.attribute_id = a.id
+        WHERE na.node_id = ?
+    ''', (1,)),
+    "attribute_query.range": (
+        "SELECT node_id FROM node_attributes WHERE attribute_id = ? AND value_num BETWEEN ? AND ?", (1, 0, 1)),
+    "attribute_query.enum": (
+        "SELECT node_id FROM node_attributes WHERE attribute_id = ? AND value IN (?, ?)", (1, "a", "b")),
+    "closure.ancestors": (
+        "SELECT target_node_id, depth FROM relation_closure "
+        "WHERE relation_type_id=? AND source_node_id=? ORDER BY depth", (1, 1)),
+    "closure.descendants": (
+        "SELECT source_node_id, depth FROM relation_closure "
+        "WHERE relation_type_id=? AND target_node_id=? ORDER BY depth", (1, 1)),
+    "extraction.proposals": (
+        "SELECT id FROM relation_proposals WHERE status = ? AND id > ? ORDER BY id LIMIT ?", ("pending", 0, 100)),
+    "similarity.changed_nodes": (
+        "SELECT DISTINCT row_id FROM change_log WHERE rev > ? AND +tbl = 'nodes'", (1,)),
+}
+
+# "SCAN t" is a full table scan; "SCAN t USING [COVERING] INDEX" still walks
+# every index entry, which is just as bad for a point lookup.
+_SCAN_RE = re.compile(r"^SCAN (TABLE )?\w+")
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _has_base_schema(conn):
+    row = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ('nodes', 'relations')"
+    ).fetchone()
+    return row[0] == 2
+
+
+def migrate(db_path=None, verbose=False):
+    """Apply pending migrations and return the resulting schema version."""
+    conn = sqlite3.connect(db_path or config.DB_PATH, isolation_level=None)
+    try:
+        if not _has_base_schema(conn):
+            # Nothing to migrate until db/schema.sql has been loaded.
+            return current_version(conn)
+        version = current_version(conn)
+        for target, description, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for stmt in statements:
+                    # Data migrations are plain callables taking the connection
+                    if callable(stmt):
+                        stmt(conn)
+                    else:
+                        conn.execute(stmt)
+                conn.execute(f"PRAGMA user_version = {int(target)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            version = target
+            if verbose:
+                print(f"Applied migration {target}: {description}")
+        return version
+    finally:
+        conn.close()
+
+
+def query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def check_query_plans(conn, queries=None):
+    """Return {name: plan} for every registered query that scans a table."""
+    failures = {}
+    for name, (sql, params) in (queries or HOT_QUERIES).items():
+        plan = query_plan(conn, sql, params)
+        if any(_SCAN_RE.match(detail) for detail in plan):
+            failures[name] = plan
+    return failures
+
+
+if __name__ == "__main__":
+    db_path = config.DB_PATH
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        migrate(db_path)
+        conn = sqlite3.connect(db_path)
+        failures = check_query_plans(conn)
+        conn.close()
+        for name, plan in failures.items():
+            print(f"FAIL {name}:")
+            for detail in plan:
+                print(f"    {detail}")
+        if failures:
+            sys.exit(1)
+        print(f"All {len(HOT_QUERIES)} hot queries use indexes.")
+    else:
+        print(f"Schema version {migrate(db_path, verbose=True)}")
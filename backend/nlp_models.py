@@ -0,0 +1,52 @@
+# nlp_models.py
+# Process-wide registry of spaCy pipelines, loaded on first use.
+#
+# Nothing here imports spaCy until a caller actually needs a model, so
+# pure-CRUD processes never pay for it. Every caller in a process shares one
+# instance per model name; callers choose the components they need per call
+# (see enabled_only) rather than loading differently configured copies.
+#
+# Under a pre-forking server, calling preload() in the master before fork
+# lets the workers share the model's memory pages copy-on-write.
+import threading
+import time
+
+import config
+
+_models = {}
+_load_seconds = {}
+_lock = threading.Lock()
+
+
+def get_nlp(name=None):
+    name = name or config.NLP_MODEL
+    nlp = _models.get(name)
+    if nlp is not None:
+        return nlp
+    with _lock:
+        if name not in _models:
+            started = time.perf_counter()
+            import spacy
+            _models[name] = spacy.load(name, exclude=config.NLP_EXCLUDE)
+            _load_seconds[name] = time.perf_counter() - started
+        return _models[name]
+
+
+def enabled_only(nlp, components):
+    """Names to pass as disable= so that only components (and what exists of them) run."""
+    return [name for name in nlp.pipe_names if name not in components]
+
+
+def preload(name=None):
+    return get_nlp(name)
+
+
+def is_loaded(name=None):
+    return (name or config.NLP_MODEL) in _models
+
+
+def stats():
+    return {
+        name: {"pipeline": nlp.pipe_names, "load_seconds": round(_load_seconds[name], 3)}
+        for name, nlp in list(_models.items())
+    }
@@ -0,0 +1,90 @@
+# nlp_pool.py
+# Process pool that runs spaCy parsing off the Flask request threads.
+#
+# Parsing holds the GIL for the whole document, so running it in the web
+# process stalls every other route. Texts are split into chunks and sent to
+# NLP_WORKERS worker processes, each of which loads the model once and
+# streams its chunk through nlp.pipe. With NLP_WORKERS=0 everything runs
+# in-process and spaCy's own n_process (NLP_N_PROCESS) is used instead.
+import atexit
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import metrics
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _warm_worker():
+    # Load the model before the first task arrives (a no-op if it was
+    # inherited from a preloaded parent through fork).
+    import nlp_models
+    nlp_models.get_nlp()
+
+
+def get_executor():
+    global _executor
+    if config.NLP_WORKERS <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=config.NLP_WORKERS,
+                mp_context=multiprocessing.get_context(config.NLP_START_METHOD),
+                initializer=_warm_worker,
+            )
+        return _executor
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown)
+
+
+def _run_chunk(fn, texts, batch_size, n_process):
+    # Runs in a worker; the stage timings (nlp, highlight) travel back with
+    # the results, since this process's metrics are never scraped.
+    with metrics.capture() as samples:
+        results = fn(texts, batch_size, n_process)
+    return results, samples
+
+
+def run_batch(fn, texts):
+    """Apply a batch parser such as nlp_utils.parse_summaries to texts, in order.
+
+    fn is called as fn(chunk, batch_size, n_process) and must return one
+    result per input text.
+    """
+    if not texts:
+        return []
+    executor = get_executor()
+    if executor is None:
+        return fn(texts, config.NLP_BATCH_SIZE, config.NLP_N_PROCESS)
+
+    chunk = max(1, min(config.NLP_CHUNK_SIZE, math.ceil(len(texts) / config.NLP_WORKERS)))
+    try:
+        futures = [
+            executor.submit(_run_chunk, fn, texts[i:i + chunk], config.NLP_BATCH_SIZE, 1)
+            for i in range(0, len(texts), chunk)
+        ]
+        results = []
+        for future in futures:
+            chunk_results, samples = future.result(timeout=config.NLP_TIMEOUT)
+            results.extend(chunk_results)
+            metrics.replay(samples)
+        return results
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool for the next request.
+        shutdown()
+        raise
@@ -1,15 +1,31 @@
 # nlp_utils.py
-import spacy
-nlp = spacy.load("en_core_web_sm")
+from markupsafe import escape
+
+import metrics
+import nlp_models
+
+# parse_node_label only needs POS tags and the dependency parse (noun_chunks)
+LABEL_COMPONENTS = ["tok2vec", "tagger", "parser", "attribute_ruler"]
+
+
+def _label_is_literal(text):
+    # Do not parse if underscores or quotes are used
+    return '_' in text or '"' in text or "'" in text
+
 
 def parse_node_label(text):
     text = text.strip()
 
-    # Do not parse if underscores or quotes are used
-    if '_' in text or '"' in text or "'" in text:
+    if _label_is_literal(text):
         return { "title": text, "qualifier": None, "parsed": False }
 
-    doc = nlp(text)
+    nlp = nlp_models.get_nlp()
+    with metrics.stage("nlp"):
+        doc = next(nlp.pipe([text], disable=nlp_models.enabled_only(nlp, LABEL_COMPONENTS)))
+    return label_from_doc(text, doc)
+
+
+def label_from_doc(text, doc):
     for chunk in doc.noun_chunks:
         title = chunk.root.text
         modifier_tokens = [t for t in chunk if t.i < chunk.root.i and t.pos_ != "DET"]
@@ -18,3 +34,189 @@ def parse_node_label(text):
             return { "title": title, "qualifier": qualifier, "parsed": True }
 
     return { "title": text, "qualifier": None, "parsed": False }
+
+
+def parse_node_labels(texts, batch_size=64, n_process=1):
+    """Batch form of parse_node_label, streaming documents through nlp.pipe."""
+    texts = [t.strip() for t in texts]
+    results = [None] * len(texts)
+    pending = []
+    for i, text in enumerate(texts):
+        if _label_is_literal(text):
+            results[i] = { "title": text, "qualifier": None, "parsed": False }
+        else:
+            pending.append(i)
+    if not pending:
+        return results
+    nlp = nlp_models.get_nlp()
+    docs = nlp.pipe((texts[i] for i in pending), batch_size=batch_size,
+                    n_process=n_process, disable=nlp_models.enabled_only(nlp, LABEL_COMPONENTS))
+    for i, doc in zip(pending, metrics.timed_iter("nlp", docs)):
+        results[i] = label_from_doc(texts[i], doc)
+    return results
+
+
+def parse_summaries(texts, batch_size=64, n_process=1):
+    """Batch form of parse_summary_text, streaming documents through nlp.pipe."""
+    docs = nlp_models.get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+    return [summary_from_doc(doc) for doc in metrics.timed_iter("nlp", docs)]
+
+
+def parse_summary_text(text):
+    nlp = nlp_models.get_nlp()
+    with metrics.stage("nlp"):
+        doc = nlp(text)
+    return summary_from_doc(doc)
+
+
+def normalize_relation_name(name):
+    stopwords = {"is", "an", "a", "the"}
+    tokens = [w for w in name.lower().split() if w not in stopwords]
+    return " ".join(tokens)
+
+
+def relation_tokens(doc):
+    """(subject token, predicate lemma, object token) triples, in document order."""
+    triples = []
+    for token in doc:
+        # RELATIONS: subject-verb-object
+        if token.dep_ == "ROOT" and token.pos_ == "VERB":
+            subj = [w for w in token.lefts if w.dep_ in ("nsubj", "nsubjpass")]
+            obj = [w for w in token.rights if w.dep_ in ("dobj", "attr", "prep", "pobj", "xcomp", "acomp")]
+            for s in subj:
+                for o in obj:
+                    triples.append((s, token.lemma_, o))
+
+        # RELATIONS: copula ("X is a Y")
+        if token.dep_ == "attr" and token.head.pos_ == "AUX":
+            subj = [w for w in token.head.lefts if w.dep_ == "nsubj"]
+            if subj:
+                triples.append((subj[0], token.head.lemma_, token))
+
+        # RELATIONS: relative clauses ("who developed...")
+        if token.dep_ == "relcl" and token.head.pos_ in ("NOUN", "PROPN"):
+            obj = [w for w in token.rights if w.dep_ in ("dobj", "pobj", "xcomp")]
+            for o in obj:
+                triples.append((token.head, token.lemma_, o))
+    return triples
+
+
+def _phrase(token):
+    # The token with its compound and adjective modifiers: "cell" -> "plant cell"
+    start = min([c.i for c in token.lefts if c.dep_ in ("compound", "amod")] + [token.i])
+    return token.doc[start:token.i + 1].text
+
+
+def relations_from_doc(doc):
+    """Triples with the noun phrases around subject and object, for matching against node titles.
+
+    An object that is a preposition ("consists of water") is replaced by its
+    object, and the preposition joins the predicate ("consist of").
+    """
+    relations = []
+    for s, predicate, o in relation_tokens(doc):
+        if o.dep_ == "prep":
+            pobj = [w for w in o.rights if w.dep_ == "pobj"]
+            if not pobj:
+                continue
+            predicate, o = f"{predicate} {o.lower_}", pobj[0]
+        relations.append({
+            "subject": s.text, "subject_phrase": _phrase(s), "subject_pronoun": s.pos_ == "PRON",
+            "predicate": predicate,
+            "object": o.text, "object_phrase": _phrase(o),
+        })
+    return relations
+
+
+def extract_relations(texts, batch_size=64, n_process=1):
+    """relations_from_doc for each text, streaming documents through nlp.pipe."""
+    docs = nlp_models.get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process)
+    return [relations_from_doc(doc) for doc in metrics.timed_iter("nlp", docs)]
+
+
+def summary_from_doc(doc):
+    relations = [{"subject": s.text, "predicate": p, "object": o.text} for s, p, o in relation_tokens(doc)]
+    attributes = []
+    debug_tokens = []
+
+    for sent in doc.sents:
+        for token in sent:
+            # Save all tokens for inspection
+            debug_tokens.append({
+                "text": token.text,
+                "lemma": token.lemma_,
+                "pos": token.pos_,
+                "tag": token.tag_,
+                "dep": token.dep_,
+                "head": token.head.text
+            })
+
+            # ATTRIBUTES: adjective modifiers or compound descriptors
+            if token.pos_ == "NOUN":
+                for child in token.children:
+                    if child.dep_ in ("amod", "compound"):
+                        attributes.append({
+                            "entity": token.text,
+                            "attribute": child.text
+                        })
+
+    with metrics.stage("highlight"):
+        highlighted = highlight_text(doc, relations, attributes)
+
+    return {
+        "common_nouns": list({t.text for t in doc if t.pos_ == "NOUN" and t.ent_type_ == ""}),
+        "proper_nouns": list({t.text for t in doc if t.pos_ == "PROPN"}),
+        "relations": relations,
+        "attributes": attributes,
+        "prepositions": [t.text for t in doc if t.pos_ == "ADP"],
+        "logical_connectives": [t.text for t in doc if t.pos_ == "CCONJ"],
+        "debug_tokens": debug_tokens,  # for inspection
+        "highlighted_summary": highlighted
+    }
+
+
+def highlight_text(doc, relations, attributes):
+    relation_verbs = {r["predicate"] for r in relations}
+    attribute_words = {a["attribute"].lower() for a in attributes}
+
+    noun_chunks = list(doc.noun_chunks)
+    chunk_starts = {chunk.start for chunk in noun_chunks}
+    highlighted = []
+    i = 0
+
+    while i < len(doc):
+        token = doc[i]
+
+        # If token starts a noun chunk
+        if i in chunk_starts:
+            chunk = next(c for c in noun_chunks if c.start == i)
+            span_tokens = []
+            for tok in chunk:
+                if tok.pos_ == "DET":
+                    span_tokens.append(escape(tok.text) + tok.whitespace_)
+                else:
+                    span_tokens.append(f"<strong>{escape(tok.text)}</strong>" + tok.whitespace_)
+            highlighted.append("".join(span_tokens))
+            i = chunk.end
+            continue
+
+        # Otherwise apply additional styling
+        word = escape(token.text)
+        styles = []
+
+        if token.pos_ == "PROPN":
+            styles.append("font-weight:bold; color:blue")
+        if token.lemma_ in relation_verbs and token.pos_ == "VERB":
+            styles.append("font-style:italic")
+        if token.text.lower() in attribute_words:
+            styles.append("color:gray")
+        if token.pos_ == "ADP":
+            styles.append("color:blue")
+
+        if styles:
+            word = f"<span style=\"{' '.join(styles)}\">{word}</span>"
+
+        highlighted.append(word + token.whitespace_)
+        i += 1
+
+    return "".join(highlighted)
@@ -0,0 +1,174 @@
+# pagination.py
+# Keyset pagination, field projection and streaming for the list endpoints.
+#
+#   GET /api/nodes?limit=500                     -> {"items": [...], "next_cursor": 500}
+#   GET /api/nodes?limit=500&cursor=500          -> next page (rows with id > 500)
+#   GET /api/nodes?fields=id,label               -> plain list without summaries
+#   GET /api/relations?format=ndjson             -> one JSON object per line, streamed
+#   GET /api/relations?format=json-stream        -> JSON array, streamed
+#
+# The json format follows the Accept header: columnar JSON or MessagePack
+# instead of objects per row (serialization.rows_response).
+#
+# Pages are keyed on the integer primary key, so fetching page N costs the
+# same as page 1 (no OFFSET), and inserts between requests never shift rows.
+from flask import Response, jsonify, stream_with_context
+
+import config
+import serialization
+
+STREAM_BATCH_SIZE = 1000
+
+
+class Listing:
+    def __init__(self, from_sql, key, fields, default_fields):
+        self.from_sql = from_sql
+        self.key = key
+        # output name -> (SQL expression, converter or None)
+        self.fields = fields
+        self.default_fields = default_fields
+
+
+NODES = Listing(
+    from_sql="FROM nodes n",
+    key="n.id",
+    fields={
+        "id": ("n.id", None),
+        "label": ("n.title", None),
+        "summary": ("n.summary", None),
+        "is_instance": ("n.is_instance", bool),
+        "qualifier": ("n.qualifier", None),
+    },
+    default_fields=["id", "label", "summary", "is_instance"],
+)
+
+RELATIONS = Listing(
+    from_sql="""
+        FROM relations r
+        JOIN nodes s ON r.source_node_id = s.id
+        JOIN nodes t ON r.target_node_id = t.id
+        JOIN relation_types rt ON r.relation_type_id = rt.id
+    """,
+    key="r.id",
+    fields={
+        "id": ("r.id", None),
+        "source_label": ("s.title", None),
+        "label": ("rt.name", None),
+        "target_label": ("t.title", None),
+        "modality": ("r.modality", None),
+        "subject_quantifier": ("r.subject_quantifier", None),
+        "object_quantifier": ("r.object_quantifier", None),
+        "source": ("r.source_node_id", None),
+        "target": ("r.target_node_id", None),
+        "relation_type_id": ("r.relation_type_id", None),
+    },
+    default_fields=["id", "source_label", "label", "target_label", "modality",
+                    "subject_quantifier", "object_quantifier"],
+)
+
+FORMATS = ("json", "ndjson", "json-stream")
+_PAGING_ARGS = ("limit", "cursor", "fields", "format")
+
+
+def is_paged(args):
+    """True if the request asked for anything beyond the legacy full list."""
+    return any(name in args for name in _PAGING_ARGS)
+
+
+def parse_fields(listing, value):
+    if not value:
+        return list(listing.default_fields)
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in listing.fields]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def build_query(listing, fields, cursor=None, limit=None):
+    # The key is always selected first so next_cursor never depends on the projection.
+    columns = [listing.key] + [listing.fields[f][0] for f in fields]
+    sql = f"SELECT {', '.join(columns)} {listing.from_sql}"
+    params = []
+    if cursor is not None:
+        sql += f" WHERE {listing.key} > ?"
+        params.append(cursor)
+    sql += f" ORDER BY {listing.key}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def _row_converter(listing, fields):
+    specs = [(name, listing.fields[name][1]) for name in fields]
+
+    def convert(row):
+        return {
+            name: (conv(value) if conv is not None else value)
+            for (name, conv), value in zip(specs, row[1:])
+        }
+    return convert
+
+
+def iter_rows(cur, batch_size=STREAM_BATCH_SIZE):
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def _parse_int(args, name):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+
+
+def respond(conn, listing, args):
+    """Serve a list endpoint according to limit/cursor/fields/format."""
+    try:
+        fields = parse_fields(listing, args.get("fields"))
+        cursor = _parse_int(args, "cursor")
+        limit = _parse_int(args, "limit")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fmt = args.get("format", "json")
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}"}), 400
+    if limit is not None:
+        limit = max(1, min(limit, config.MAX_PAGE_SIZE))
+
+    sql, params = build_query(listing, fields, cursor, limit)
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    convert = _row_converter(listing, fields)
+
+    if fmt == "ndjson":
+        def generate():
+            for batch in iter_rows(cur):
+                yield b"".join(serialization.dumps(convert(row)) + b"\n" for row in batch)
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    if fmt == "json-stream":
+        def generate():
+            yield b"["
+            first = True
+            for batch in iter_rows(cur):
+                chunk = b",".join(serialization.dumps(convert(row)) for row in batch)
+                yield chunk if first else b"," + chunk
+                first = False
+            yield b"]"
+        return Response(stream_with_context(generate()), mimetype="application/json")
+
+    rows = cur.fetchall()
+    next_cursor = rows[-1][0] if limit is not None and len(rows) == limit else None
+    # The key column was only selected for next_cursor
+    rows = [row[1:] for row in rows]
+    converters = {name: listing.fields[name][1] for name in fields if listing.fields[name][1] is not None}
+    envelope = None if limit is None and cursor is None else {"next_cursor": next_cursor}
+    return serialization.rows_response(fields, rows, converters, envelope)
@@ -0,0 +1,164 @@
+# parse_cache.py
+# Content-addressed cache for NLP parse results.
+#
+# Entries are keyed by sha256(kind, model name, model version, cache format,
+# text), so a changed model or a changed text can never return a stale parse.
+# Two tiers:
+#   - an in-process LRU of PARSE_CACHE_SIZE entries
+#   - optionally the parse_cache table in the main database, which survives
+#     restarts and is shared by every worker process
+# update_node() drops the entries for a summary it replaces.
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from importlib import metadata
+
+import config
+import database
+import nlp_pool
+
+KINDS = ("summary", "label")
+# Bump when the shape of nlp_utils' results changes.
+CACHE_FORMAT = 1
+
+
+def _model_version():
+    try:
+        return metadata.version(config.NLP_MODEL)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class ParseCache:
+    def __init__(self, capacity, disk=True):
+        self.capacity = capacity
+        self.disk = disk
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._namespace = f"{config.NLP_MODEL}\0{_model_version()}\0{CACHE_FORMAT}"
+        self._puts_since_prune = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                       "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def key(self, kind, text):
+        return hashlib.sha256(f"{kind}\0{self._namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, value):
+        # caller holds self._lock
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get_many(self, kind, texts):
+        """Return {text: result} for the texts found in either tier."""
+        found, missing = {}, {}
+        with self._lock:
+            for text in set(texts):
+                key = self.key(kind, text)
+                value = self._lru.get(key)
+                if value is not None:
+                    self._lru.move_to_end(key)
+                    found[text] = value
+                    self._stats["memory_hits"] += 1
+                else:
+                    missing[key] = text
+        if missing and self.disk:
+            keys = list(missing)
+            with database.connection() as conn:
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    rows = conn.execute(
+                        f"SELECT key, value FROM parse_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    with self._lock:
+                        for key, value in rows:
+                            result = json.loads(value)
+                            found[missing.pop(key)] = result
+                            self._remember(key, result)
+                            self._stats["disk_hits"] += 1
+        with self._lock:
+            self._stats["misses"] += len(missing)
+        return found
+
+    def put_many(self, kind, texts, results):
+        rows = []
+        with self._lock:
+            for text, result in zip(texts, results):
+                key = self.key(kind, text)
+                self._remember(key, result)
+                rows.append((key, kind, json.dumps(result), time.time()))
+            self._stats["stores"] += len(rows)
+            self._puts_since_prune += len(rows)
+            prune = self._puts_since_prune >= config.PARSE_CACHE_PRUNE_EVERY
+            if prune:
+                self._puts_since_prune = 0
+        if rows and self.disk:
+            with database.connection() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO parse_cache (key, kind, value, created_at) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                if prune:
+                    self._prune(conn)
+                conn.commit()
+
+    def _prune(self, conn):
+        # Keep the newest PARSE_CACHE_DISK_MAX_ROWS entries.
+        conn.execute(
+            "DELETE FROM parse_cache WHERE created_at < ("
+            " SELECT created_at FROM parse_cache ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+            (config.PARSE_CACHE_DISK_MAX_ROWS,),
+        )
+
+    def invalidate(self, text, conn=None):
+        """Drop every cached parse of text (all kinds, both tiers)."""
+        text = (text or "").strip()
+        if not text:
+            return
+        keys = [self.key(kind, text) for kind in KINDS]
+        with self._lock:
+            for key in keys:
+                if self._lru.pop(key, None) is not None:
+                    self._stats["invalidations"] += 1
+        if self.disk:
+            # Reuse the caller's connection so the delete commits with its edit.
+            if conn is not None:
+                conn.executemany("DELETE FROM parse_cache WHERE key=?", [(k,) for k in keys])
+            else:
+                with database.connection() as own:
+                    own.executemany("DELETE FROM parse_cache WHERE key=?", [(k,) for k in keys])
+                    own.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._lru)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else None
+        stats.update({"capacity": self.capacity, "disk": self.disk, "model": config.NLP_MODEL,
+                      "model_version": _model_version()})
+        return stats
+
+
+cache = ParseCache(config.PARSE_CACHE_SIZE, disk=config.PARSE_CACHE_DISK)
+
+
+def parse(kind, fn, texts):
+    """Run batch parser fn over texts through the cache and the NLP pool.
+
+    Only texts missing from both tiers are parsed; duplicates within the
+    batch are parsed once. Results come back in input order.
+    """
+    texts = [t.strip() for t in texts]
+    found = cache.get_many(kind, texts)
+    todo = list(dict.fromkeys(t for t in texts if t not in found))
+    if todo:
+        parsed = nlp_pool.run_batch(fn, todo)
+        cache.put_many(kind, todo, parsed)
+        found.update(zip(todo, parsed))
+    return [found[t] for t in texts]
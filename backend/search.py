@@ -0,0 +1,92 @@
+# search.py
+# Full-text and typeahead search over nodes.
+#
+# nodes_fts is an external-content FTS5 table over nodes(title, qualifier,
+# summary): it stores only the inverted index and reads the text back from
+# nodes. Triggers on nodes keep it in sync, so every writer (the routes,
+# bulk_import, summary_jobs) is covered without calling in here.
+#
+# The prefix='2 3' option stores extra index entries for 2- and 3-character
+# prefixes, so the typeahead query "ce*" is a single index lookup instead
+# of a scan over every term starting with "ce".
+import re
+
+import config
+
+# Column weights for bm25(): a title hit outranks a summary hit.
+WEIGHTS = (10.0, 5.0, 1.0)
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5("
+    " title, qualifier, summary,"
+    " content='nodes', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    """
+    CREATE TRIGGER IF NOT EXISTS nodes_fts_insert AFTER INSERT ON nodes BEGIN
+        INSERT INTO nodes_fts (rowid, title, qualifier, summary)
+        VALUES (new.id, new.title, new.qualifier, new.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS nodes_fts_delete AFTER DELETE ON nodes BEGIN
+        INSERT INTO nodes_fts (nodes_fts, rowid, title, qualifier, summary)
+        VALUES ('delete', old.id, old.title, old.qualifier, old.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS nodes_fts_update AFTER UPDATE OF title, qualifier, summary ON nodes BEGIN
+        INSERT INTO nodes_fts (nodes_fts, rowid, title, qualifier, summary)
+        VALUES ('delete', old.id, old.title, old.qualifier, old.summary);
+        INSERT INTO nodes_fts (rowid, title, qualifier, summary)
+        VALUES (new.id, new.title, new.qualifier, new.summary);
+    END
+    """,
+]
+
+
+def install(conn):
+    """Create the index and its triggers and index the existing nodes."""
+    for stmt in INSTALL:
+        conn.execute(stmt)
+    rebuild(conn)
+
+
+def rebuild(conn):
+    conn.execute("INSERT INTO nodes_fts (nodes_fts) VALUES ('rebuild')")
+
+
+def match_expression(query, prefix=True):
+    """FTS5 MATCH string for free text: every term must match, the last as a prefix.
+
+    Terms are quoted, so user input can never inject FTS5 operators. Returns
+    None when the query has no searchable terms.
+    """
+    terms = _TERM_RE.findall(query or "")
+    if not terms:
+        return None
+    parts = ['"%s"' % t for t in terms]
+    if prefix and len(terms[-1]) >= config.SEARCH_MIN_PREFIX:
+        parts[-1] += "*"
+    return " ".join(parts)
+
+
+def search(cur, query, limit, prefix=True):
+    expr = match_expression(query, prefix=prefix)
+    if expr is None:
+        return []
+    cur.execute(f"""
+        SELECT n.id, n.title, n.qualifier, n.summary, n.is_instance,
+               bm25(nodes_fts, {', '.join(map(str, WEIGHTS))}) AS score
+        FROM nodes_fts
+        JOIN nodes n ON n.id = nodes_fts.rowid
+        WHERE nodes_fts MATCH ?
+        ORDER BY score
+        LIMIT ?
+    """, (expr, limit))
+    return [
+        {"id": r[0], "label": r[1], "qualifier": r[2], "summary": r[3],
+         "is_instance": bool(r[4]), "score": -r[5]}
+        for r in cur.fetchall()
+    ]
@@ -0,0 +1,214 @@
+# serialization.py
+# How responses are serialized: the app's JSON provider, Accept-negotiated
+# list formats and compression.
+#
+# JSON goes through orjson when it is installed (and SERIALIZE_ORJSON is
+# on), for jsonify() in every route as well as the lists below; otherwise
+# through the standard library, as before. Keys keep their insertion
+# order either way.
+#
+# The list endpoints (/api/nodes, /api/relations) encode straight from the
+# cursor's tuples with rows_response(), in the format the client's Accept
+# header prefers:
+#   application/json                                  [{"id": 1, "label": ...}, ...]
+#   application/vnd.knowledge-graph.columns+json      {"id": [1, ...], "label": [...]}
+#   application/msgpack                               the rows, as MessagePack
+#   application/vnd.knowledge-graph.columns+msgpack   the columns, as MessagePack
+# The columnar forms do not repeat the keys on every row. JSON rows are
+# not built as dicts either: each column is encoded with one dumps() call
+# and cut into its values, and every row is one bytes template filled with
+# them (_json_rows). MessagePack needs the msgpack package; without it
+# those types are simply not offered, and the client gets JSON.
+#
+# Bodies of at least SERIALIZE_COMPRESS_MIN_BYTES are compressed with
+# brotli (if installed) or gzip, whichever the client's Accept-Encoding
+# allows, brotli first. http_cache stores the compressed body, so a cache
+# hit does not compress again. Streamed responses (?format=ndjson) are
+# left alone.
+import gzip
+import json
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+import config
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = "application/json"
+COLUMNS_JSON = "application/vnd.knowledge-graph.columns+json"
+MSGPACK = "application/msgpack"
+COLUMNS_MSGPACK = "application/vnd.knowledge-graph.columns+msgpack"
+
+# media type -> (encoding, shape)
+FORMATS = {
+    JSON: ("json", "rows"),
+    COLUMNS_JSON: ("json", "columns"),
+    MSGPACK: ("msgpack", "rows"),
+    "application/x-msgpack": ("msgpack", "rows"),
+    COLUMNS_MSGPACK: ("msgpack", "columns"),
+}
+
+COMPRESSIBLE = {JSON, COLUMNS_JSON, MSGPACK, "application/x-msgpack", COLUMNS_MSGPACK, "application/x-ndjson"}
+
+
+def _fast():
+    return orjson is not None and config.SERIALIZE_ORJSON
+
+
+def _orjson_options(indent=False):
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    return option | orjson.OPT_INDENT_2 if indent else option
+
+
+def dumps(obj, default=None):
+    """obj as JSON bytes, compact."""
+    if _fast():
+        return orjson.dumps(obj, default=default, option=_orjson_options())
+    return json.dumps(obj, default=default, separators=(",", ":")).encode()
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's provider, with orjson when available and the "json" stage timed."""
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        with metrics.stage("json"):
+            if _fast():
+                return orjson.dumps(obj, default=self.default,
+                                    option=_orjson_options("indent" in kwargs)).decode()
+            return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not _fast():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with metrics.stage("json"):
+            body = orjson.dumps(obj, default=self.default, option=_orjson_options(indent))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def negotiate():
+    """The media type to answer a list request with, from its Accept header."""
+    offers = [JSON, COLUMNS_JSON]
+    if msgpack is not None:
+        offers += [MSGPACK, "application/x-msgpack", COLUMNS_MSGPACK]
+    return request.accept_mimetypes.best_match(offers, default=JSON)
+
+
+def _split_strings(strings):
+    # Each string's JSON without its quotes, or None. A '","' whose first quote
+    # has no backslash before it is a separator: an encoded string has no other
+    # unescaped quote. The rare column with a backslash there is left alone.
+    data = dumps(strings)
+    return None if b'\\","' in data else data[2:-2].split(b'","')
+
+
+def _fragments(values):
+    # The JSON of each value, from one dumps() of the whole column where it
+    # can be cut apart again, and whether the quotes around them were left out
+    # (for the row template to add). Numbers, booleans and null never contain
+    # a comma.
+    kinds = set(map(type, values))
+    if kinds <= {int, float, bool, type(None)}:
+        return dumps(values)[1:-1].split(b","), False
+    if kinds == {str} and (pieces := _split_strings(values)) is not None:
+        return pieces, True
+    if kinds == {str, type(None)} and (pieces := _split_strings([v for v in values if v is not None])) is not None:
+        pieces = iter(pieces)
+        return [b"null" if v is None else b'"' + next(pieces) + b'"' for v in values], False
+    return [dumps(v) for v in values], False
+
+
+def _json_rows(names, columns):
+    """A JSON array of one object per row, from the columns, without a dict per row."""
+    if not columns or not len(columns[0]):
+        return b"[]"
+    slots, values = [], []
+    for name, column in zip(names, columns):
+        fragments, quoted = _fragments(column)
+        slots.append(dumps(name).replace(b"%", b"%%") + (b':"%b"' if quoted else b":%b"))
+        values.append(fragments)
+    template = b"{" + b",".join(slots) + b"}"
+    return b"[" + b",".join([template % row for row in zip(*values)]) + b"]"
+
+
+def rows_response(names, rows, converters=None, envelope=None):
+    """Encode cursor rows as the negotiated format.
+
+    names are the output field names, one per column of rows; converters
+    maps a name to a function applied to each of its values (e.g. bool).
+    With envelope, the rows go under "items" next to its other keys.
+    """
+    mimetype = negotiate()
+    encoding, shape = FORMATS[mimetype]
+    converters = converters or {}
+    with metrics.stage("json"):
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        columns = [[conv(v) for v in column] if (conv := converters.get(name)) else list(column)
+                   for name, column in zip(names, columns)]
+        if shape == "rows" and encoding == "json":
+            data = _json_rows(names, columns)
+            if envelope is not None:
+                # Spliced in where the envelope's "items": null ends
+                data = dumps(dict(envelope, items=None))[:-len(b"null}")] + data + b"}"
+        else:
+            # MessagePack can't be cut into values again, so its rows stay dicts
+            if shape == "columns":
+                body = dict(zip(names, columns))
+            else:
+                body = [dict(zip(names, row)) for row in zip(*columns)]
+            if envelope is not None:
+                body = dict(envelope, items=body)
+            data = msgpack.packb(body) if encoding == "msgpack" else dumps(body)
+    response = current_app.response_class(data, mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
+
+
+def compress(response):
+    """Compress a finished response in place when it is large enough and the client accepts it."""
+    if (not config.SERIALIZE_COMPRESS or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or "Content-Encoding" in response.headers
+            or (response.mimetype not in COMPRESSIBLE and not response.mimetype.startswith("text/"))):
+        return response
+    body = response.get_data()
+    if len(body) < config.SERIALIZE_COMPRESS_MIN_BYTES:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        with metrics.stage("compress"):
+            data = brotli.compress(body, quality=config.SERIALIZE_BROTLI_QUALITY)
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        with metrics.stage("compress"):
+            data = gzip.compress(body, compresslevel=config.SERIALIZE_GZIP_LEVEL, mtime=0)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response.vary.add("Accept-Encoding")
+        return response
+    response.set_data(data)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_app(app):
+    """Install the JSON provider and the compression hook on a Flask app."""
+    app.json = JSONProvider(app)
+    app.after_request(compress)
@@ -0,0 +1,338 @@
+# similarity.py
+# In-process similarity index over node titles and summaries, for
+# "related concepts" (/api/node/<id>/similar) and the near-duplicate
+# warning of /api/node/create.
+#
+# Every node gets two hashed TF-IDF vectors, L2-normalized:
+#   title    word stems plus character trigrams of the title, so "Cell",
+#            "cells" and "the cell" coincide and small typos stay close
+#   content  title stems (counted twice) plus summary stems
+# Stems come from a light suffix stripper and stop-word list below: no
+# model and no network, and fast enough to index every node at startup.
+# Features are hashed into SIMILARITY_DIM columns. IDF is smoothed,
+# log((1 + n) / (1 + df)) + 1, so a term no node had yet still weighs.
+#
+# The vectors are rows of SciPy CSC matrices, so a query only touches the
+# columns of its own features (the posting lists) and sums them per row:
+# cost grows with the postings of the query's terms, not with the number
+# of nodes.
+#
+# Like graph_index, edits are overlays on the base matrices: changed nodes
+# get fresh vectors in a dict and their base rows are masked out, and the
+# overlay is folded back once it grows past SIMILARITY_COMPACT_MIN /
+# SIMILARITY_COMPACT_RATIO. Document frequencies are kept up to date on
+# every edit and new vectors are weighed with them, but older vectors keep
+# the weights they got; once the edits or the terms first seen since the
+# last build pass SIMILARITY_DRIFT_RATIO of it, a fresh index is built on a
+# background thread while the current one keeps answering. The index
+# follows the graph revision through change_log, so edits by any route, job
+# or worker process are picked up on the next query; when the log no longer
+# reaches back, or too much changed at once, it is rebuilt on the spot.
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+import config
+import database
+import http_cache
+from changes import TRUNCATED_KEY
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+STOP_WORDS = frozenset("""
+a an and are as at be been by for from has have in into is it its of on or that the their this to was
+were which with
+""".split())
+
+FIELDS = ("title", "content")
+
+
+def stem(word):
+    # Plural and a few verb endings; enough to merge "cells"/"cell", "studies"/"study"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "shes", "ches", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    return word
+
+
+def terms(text):
+    return [stem(w) for w in _WORD_RE.findall((text or "").lower()) if w not in STOP_WORDS]
+
+
+def features(title, summary):
+    """(title features, content features) as Counters of hashed columns."""
+    dim = config.SIMILARITY_DIM
+    words = terms(title)
+    joined = f" {' '.join(words)} "
+    title_features = Counter(hash(w) % dim for w in words)
+    title_features.update(hash("#" + joined[i:i + 3]) % dim for i in range(len(joined) - 2))
+    content = Counter(hash(w) % dim for w in words)
+    content.update(content)  # title terms count twice
+    content.update(hash(w) % dim for w in terms(summary))
+    return title_features, content
+
+
+def _weigh(counts, df, n):
+    # tf = 1 + log(count), times smoothed idf, L2-normalized; returns (columns, weights)
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    tf = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+    vals = tf * (np.log((1.0 + n) / (1.0 + df[cols])) + 1.0)
+    return cols, vals / np.sqrt((vals * vals).sum())
+
+
+def _matrix(rows):
+    # (cols, vals) rows -> CSR; queries use it as CSC, to slice out their columns
+    lengths = [len(cols) for cols, _ in rows]
+    indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    indices = np.concatenate([cols for cols, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+    data = np.concatenate([vals for _, vals in rows]) if rows else np.zeros(0)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), config.SIMILARITY_DIM))
+
+
+def _scores(matrix, cols, vals):
+    # Sum the postings of the query's columns per row into a dense accumulator
+    sub = matrix[:, cols]
+    contrib = sub.data * np.repeat(vals, np.diff(sub.indptr))
+    return np.bincount(sub.indices, weights=contrib, minlength=matrix.shape[0])
+
+
+def _top(ids, scores, k, min_score):
+    # Up to k (id, score) above min_score, unordered
+    best = np.flatnonzero(scores > min_score)
+    if len(best) > k:
+        best = best[np.argpartition(-scores[best], k - 1)[:k]]
+    return list(zip(ids[best].tolist(), scores[best].tolist()))
+
+
+class SimilarityIndex:
+    def __init__(self, rows, revision):
+        """Build from (node_id, title, summary) rows."""
+        self.revision = revision
+        ids = []
+        docs = {field: [] for field in FIELDS}
+        for node_id, title, summary in rows:
+            ids.append(node_id)
+            for field, counts in zip(FIELDS, features(title, summary)):
+                docs[field].append(counts)
+        self._lock = threading.RLock()
+        self.n = len(ids)
+        self.df = {}
+        for field in FIELDS:
+            df = self.df[field] = np.zeros(config.SIMILARITY_DIM)
+            for counts in docs[field]:
+                df[list(counts)] += 1
+        # What the drift since this build is measured against
+        self._built = (self.n, sum(int(np.count_nonzero(df)) for df in self.df.values()))
+        self.changed = self.new_terms = 0
+        self._set_base(np.asarray(ids, dtype=np.int64),
+                       {field: [_weigh(c, self.df[field], self.n) for c in docs[field]] for field in FIELDS})
+
+    def _set_base(self, ids, vectors):
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order]
+        csr = {field: _matrix([vectors[field][i] for i in order]) for field in FIELDS}
+        # (indptr, indices) per row, to find the columns a replaced node counted in df
+        self._rows = {field: (m.indptr, m.indices) for field, m in csr.items()}
+        self._matrices = {field: m.tocsc() for field, m in csr.items()}
+        self._alive = np.ones(len(self.ids), dtype=bool)
+        self._overlay = {}  # node_id -> {field: (cols, vals)}
+        self._overlay_matrices = None  # (ids, {field: CSC}) of the overlay, built on the next query
+
+    @property
+    def size(self):
+        return int(self._alive.sum()) + len(self._overlay)
+
+    def _position(self, node_id):
+        p = int(np.searchsorted(self.ids, node_id))
+        return p if p < len(self.ids) and self.ids[p] == node_id else None
+
+    def vectors(self, title, summary):
+        return {field: _weigh(counts, self.df[field], self.n)
+                for field, counts in zip(FIELDS, features(title, summary))}
+
+    # -- maintenance -------------------------------------------------------
+
+    def _columns(self, node_id):
+        # {field: feature columns} of the node's current vector, or None
+        vector = self._overlay.get(node_id)
+        if vector is not None:
+            return {field: vector[field][0] for field in FIELDS}
+        p = self._position(node_id)
+        if p is None or not self._alive[p]:
+            return None
+        return {field: self._rows[field][1][self._rows[field][0][p]:self._rows[field][0][p + 1]]
+                for field in FIELDS}
+
+    def _forget(self, node_id):
+        # Take the node out of the document frequencies and mask its base row
+        old = self._columns(node_id)
+        if old is not None:
+            self.n -= 1
+            for field in FIELDS:
+                self.df[field][old[field]] -= 1
+        p = self._position(node_id)
+        if p is not None:
+            self._alive[p] = False
+        self.changed += 1
+
+    def upsert(self, node_id, title, summary):
+        with self._lock:
+            self._forget(node_id)
+            counts = dict(zip(FIELDS, features(title, summary)))
+            self.n += 1
+            for field in FIELDS:
+                cols = list(counts[field])
+                self.new_terms += int(np.count_nonzero(self.df[field][cols] == 0))
+                self.df[field][cols] += 1
+            self._overlay[node_id] = {field: _weigh(counts[field], self.df[field], self.n) for field in FIELDS}
+            self._overlay_matrices = None
+            self._maybe_compact()
+
+    def remove(self, node_id):
+        with self._lock:
+            self._forget(node_id)
+            if self._overlay.pop(node_id, None) is not None:
+                self._overlay_matrices = None
+
+    def drifted(self):
+        """True once the edits or new terms since the build call for a fresh one."""
+        nodes, vocabulary = self._built
+        return (self.changed > max(config.SIMILARITY_COMPACT_MIN, nodes * config.SIMILARITY_DRIFT_RATIO)
+                or self.new_terms > max(config.SIMILARITY_COMPACT_MIN, vocabulary * config.SIMILARITY_DRIFT_RATIO))
+
+    def _maybe_compact(self):
+        if len(self._overlay) <= max(config.SIMILARITY_COMPACT_MIN, len(self.ids) * config.SIMILARITY_COMPACT_RATIO):
+            return
+        live = np.flatnonzero(self._alive)
+        vectors = {}
+        for field in FIELDS:
+            csr = self._matrices[field].tocsr()
+            vectors[field] = [(csr.indices[csr.indptr[p]:csr.indptr[p + 1]], csr.data[csr.indptr[p]:csr.indptr[p + 1]])
+                              for p in live]
+            vectors[field] += [v[field] for v in self._overlay.values()]
+        ids = np.concatenate([self.ids[live], np.fromiter(self._overlay, dtype=np.int64, count=len(self._overlay))])
+        self._set_base(ids, vectors)
+
+    def _overlay_state(self):
+        if self._overlay_matrices is None:
+            ids = np.fromiter(self._overlay, dtype=np.int64, count=len(self._overlay))
+            self._overlay_matrices = ids, {field: _matrix([v[field] for v in self._overlay.values()]).tocsc()
+                                           for field in FIELDS}
+        return self._overlay_matrices
+
+    # -- queries -----------------------------------------------------------
+
+    def search(self, vector, field="content", k=10, exclude=None, min_score=0.0):
+        """The k best (node_id, cosine) for a vector from vectors(), best first."""
+        cols, vals = vector[field]
+        if not len(cols):
+            return []
+        with self._lock:
+            scores = _scores(self._matrices[field], cols, vals)
+            scores[~self._alive] = 0.0
+            # k + 1 leaves room to drop the query node itself
+            candidates = _top(self.ids, scores, k + 1, min_score)
+            if self._overlay:
+                overlay_ids, matrices = self._overlay_state()
+                candidates += _top(overlay_ids, _scores(matrices[field], cols, vals), k + 1, min_score)
+        candidates = [(n, s) for n, s in candidates if n != exclude and s > min_score]
+        candidates.sort(key=lambda c: (-c[1], c[0]))
+        return [(n, round(min(s, 1.0), 6)) for n, s in candidates[:k]]
+
+
+_index = None
+_build_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def _fetch(cur, sql, params=()):
+    cur.execute(sql, params)
+    while True:
+        batch = cur.fetchmany(10000)
+        if not batch:
+            return
+        yield from batch
+
+
+def build(conn):
+    revision, _ = http_cache.current(conn)
+    return SimilarityIndex(_fetch(conn.cursor(), "SELECT id, title, summary FROM nodes"), revision)
+
+
+def _catch_up(conn, index):
+    # Apply the node edits logged since the index's revision; False when it must be rebuilt.
+    revision, _ = http_cache.current(conn)
+    if index.revision < database.get_version(conn, TRUNCATED_KEY):
+        return False
+    cur = conn.cursor()
+    # +tbl: walk the rev range of the log, not every node entry in idx_change_log_row
+    cur.execute("SELECT DISTINCT row_id FROM change_log WHERE rev > ? AND +tbl = 'nodes'", (index.revision,))
+    node_ids = [r[0] for r in cur.fetchall()]
+    if len(node_ids) > max(config.SIMILARITY_COMPACT_MIN, index.size * config.SIMILARITY_REBUILD_RATIO):
+        return False
+    found = {}
+    for i in range(0, len(node_ids), 500):
+        chunk = node_ids[i:i + 500]
+        cur.execute(f"SELECT id, title, summary FROM nodes WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        found.update((r[0], r) for r in cur.fetchall())
+    for node_id in node_ids:
+        if node_id in found:
+            index.upsert(*found[node_id])
+        else:
+            index.remove(node_id)
+    index.revision = revision
+    return True
+
+
+def _rebuild():
+    global _index
+    try:
+        with database.connection() as conn:
+            fresh = build(conn)
+        with _build_lock:
+            # The next get_index catches it up with the edits made meanwhile
+            _index = fresh
+    finally:
+        _rebuilding.clear()
+
+
+def get_index(conn):
+    """Return the process-wide index, brought up to the current revision."""
+    global _index
+    index = _index
+    if index is not None and index.revision == http_cache.current(conn)[0]:
+        return index
+    with _build_lock:
+        if _index is None or not _catch_up(conn, _index):
+            _index = build(conn)
+        index = _index
+    if index.drifted() and not _rebuilding.is_set():
+        _rebuilding.set()
+        threading.Thread(target=_rebuild, name="similarity-rebuild", daemon=True).start()
+    return index
+
+
+def similar(conn, node_id, field="content", k=None):
+    """[(node_id, score)] most similar to the node, or None when it does not exist."""
+    row = conn.execute("SELECT title, summary FROM nodes WHERE id=?", (node_id,)).fetchone()
+    if row is None:
+        return None
+    index = get_index(conn)
+    return index.search(index.vectors(*row), field, k or config.SIMILARITY_DEFAULT_K, exclude=node_id)
+
+
+def duplicates(conn, title, summary=None):
+    """Existing nodes whose title is at least SIMILARITY_DUPLICATE_THRESHOLD similar to title."""
+    index = get_index(conn)
+    return index.search(index.vectors(title, summary), "title", config.SIMILARITY_DUPLICATE_MAX,
+                        min_score=config.SIMILARITY_DUPLICATE_THRESHOLD - 1e-9)
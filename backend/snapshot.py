@@ -0,0 +1,364 @@
+# snapshot.py
+# Columnar binary snapshots of the graph, loaded by memory-mapping.
+#
+# A snapshot is a directory:
+#   manifest.json           format, source revision and versions, and per
+#                           table its DDL, row count and column kinds
+#   <table>.<column>.npy    one array per column
+#   strings.npy             every distinct text value, UTF-8, concatenated (uint8)
+#   strings.offsets.npy     int64 offsets into strings.npy (n + 1 entries)
+#
+# Column kinds:
+#   int     int64; plus <table>.<column>.null.npy (bool) when it has NULLs
+#   float   float64, NULL as NaN
+#   str     int64 index into the string table, NULL as -1
+# A column is "str" as soon as it holds one non-numeric value (e.g. the
+# 'yes'/'no' flags of the seeded relation types), so values round-trip.
+#
+# Every array is opened with np.load(mmap_mode="r"): opening a snapshot
+# reads only the manifest, and pages are faulted in as they are used and
+# shared between processes mapping the same files. graph_index builds its
+# CSR arrays straight from the relations columns when KNOWLEDGE_SNAPSHOT_PATH
+# names a snapshot of the current relations version, and restore() turns a
+# snapshot into a new database far faster than replaying an SQL dump.
+#
+# A counter value only identifies a state within one database, so every
+# database carries a random id in graph_versions (ID_KEY, migration 15)
+# and the snapshot's versions carry its source's. matches() accepts a
+# snapshot when it came from this database, or when it is the one this
+# database was restored from and nothing was written since.
+#
+# Usage:
+#   python snapshot.py export snap/ [--db db/graph.db]
+#   python snapshot.py restore snap/ replica.db
+#   python snapshot.py info snap/
+import argparse
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import tarfile
+import time
+from urllib.request import pathname2url
+
+import numpy as np
+
+import config
+
+FORMAT = 1
+TABLES = ("nodes", "relations", "relation_types", "attributes", "node_attributes", "possible_node_attributes")
+FETCH_SIZE = 10000
+
+ID_KEY = "database.id"
+RESTORED_FROM_KEY = "database.restored_from"  # ID_KEY of the snapshot's source
+RESTORED_AT_KEY = "database.restored_at"  # the snapshot's graph revision
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _version(conn, name):
+    row = conn.execute("SELECT version FROM graph_versions WHERE name=?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def install(conn):
+    """Give the database its random id."""
+    conn.execute("INSERT OR IGNORE INTO graph_versions (name, version) VALUES (?, ?)",
+                 (ID_KEY, secrets.randbits(62) + 1))
+
+
+def matches(snap, conn, key):
+    """True if snap holds this database's data as of counter key's current value."""
+    import http_cache
+
+    if snap.versions.get(key, 0) != (_version(conn, key) or 0):
+        return False
+    source = snap.versions.get(ID_KEY)
+    if source is None:
+        return False  # exported before databases had ids
+    if source == _version(conn, ID_KEY):
+        return True
+    return (source == _version(conn, RESTORED_FROM_KEY)
+            and snap.versions.get(http_cache.REVISION_KEY) == _version(conn, RESTORED_AT_KEY)
+            == _version(conn, http_cache.REVISION_KEY))
+
+
+class _StringTable:
+    def __init__(self):
+        self._index = {}
+        self._chunks = []
+        self._offsets = [0]
+
+    def add(self, value):
+        i = self._index.get(value)
+        if i is None:
+            data = value.encode("utf-8")
+            i = self._index[value] = len(self._chunks)
+            self._chunks.append(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+        return i
+
+    def save(self, path):
+        np.save(os.path.join(path, "strings.npy"), np.frombuffer(b"".join(self._chunks), dtype=np.uint8))
+        np.save(os.path.join(path, "strings.offsets.npy"), np.asarray(self._offsets, dtype=np.int64))
+
+
+def _kind(values):
+    if all(v is None or (isinstance(v, int) and not isinstance(v, bool)) for v in values):
+        return "int"
+    if all(v is None or isinstance(v, (int, float)) for v in values):
+        return "float"
+    return "str"
+
+
+def _save_column(path, table, column, values, strings):
+    base = os.path.join(path, f"{table}.{column}")
+    kind = _kind(values)
+    if kind == "int":
+        nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        np.save(base + ".npy", np.fromiter((0 if v is None else v for v in values), dtype=np.int64, count=len(values)))
+        if nulls.any():
+            np.save(base + ".null.npy", nulls)
+        return {"name": column, "kind": kind, "nulls": bool(nulls.any())}
+    if kind == "float":
+        np.save(base + ".npy", np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64,
+                                           count=len(values)))
+    else:
+        np.save(base + ".npy", np.fromiter((-1 if v is None else strings.add(str(v)) for v in values),
+                                           dtype=np.int64, count=len(values)))
+    return {"name": column, "kind": kind}
+
+
+def export(db_path, path):
+    """Write a snapshot of db_path into the new directory path; returns the manifest."""
+    if os.path.exists(path):
+        raise SnapshotError(f"{path} already exists")
+    started = time.perf_counter()
+    os.makedirs(path)
+    # A read-only connection in one read transaction: a consistent cut even
+    # while the app keeps writing (WAL).
+    uri = "file:" + pathname2url(os.path.abspath(db_path)) + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        versions = dict(conn.execute("SELECT name, version FROM graph_versions"))
+        strings = _StringTable()
+        tables = {}
+        for table in TABLES:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+            if row is None:
+                continue
+            columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+            cur = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid")
+            rows = []
+            while True:
+                batch = cur.fetchmany(FETCH_SIZE)
+                if not batch:
+                    break
+                rows.extend(batch)
+            data = list(zip(*rows)) if rows else [()] * len(columns)
+            indexes = [r[0] for r in conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,))]
+            tables[table] = {
+                "sql": row[0],
+                "indexes": indexes,
+                "rows": len(rows),
+                "columns": [_save_column(path, table, c, list(v), strings) for c, v in zip(columns, data)],
+            }
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    strings.save(path)
+    manifest = {
+        "format": FORMAT,
+        "created_at": time.time(),
+        "source": os.path.abspath(db_path),
+        "versions": versions,
+        "tables": tables,
+        "export_seconds": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class Snapshot:
+    """A snapshot directory opened for reading; arrays are memory-mapped on first use."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, "manifest.json")) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"{path} is not a snapshot: {e}")
+        if self.manifest.get("format") != FORMAT:
+            raise SnapshotError(f"Unsupported snapshot format {self.manifest.get('format')}")
+        self._arrays = {}
+        self._strings = None
+
+    @property
+    def versions(self):
+        return self.manifest["versions"]
+
+    def tables(self):
+        return list(self.manifest["tables"])
+
+    def count(self, table):
+        return self.manifest["tables"][table]["rows"]
+
+    def _load(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+        return array
+
+    def _column(self, table, column):
+        for spec in self.manifest["tables"][table]["columns"]:
+            if spec["name"] == column:
+                return spec
+        raise KeyError(f"{table}.{column}")
+
+    def array(self, table, column):
+        """The raw column: int64, float64, or int64 string indexes (-1 = NULL). Zero-copy."""
+        self._column(table, column)
+        return self._load(f"{table}.{column}")
+
+    def string(self, i):
+        blob, offsets = self._load("strings"), self._load("strings.offsets")
+        return blob[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+    def _all_strings(self):
+        if self._strings is None:
+            blob = self._load("strings").tobytes()
+            offsets = self._load("strings.offsets").tolist()
+            self._strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def values(self, table, column):
+        """The column as a list of Python values, NULLs as None."""
+        spec = self._column(table, column)
+        array = self.array(table, column)
+        if spec["kind"] == "str":
+            strings = self._all_strings()
+            return [strings[i] if i >= 0 else None for i in array.tolist()]
+        if spec["kind"] == "float":
+            return [None if v != v else v for v in array.tolist()]
+        values = array.tolist()
+        if spec.get("nulls"):
+            nulls = self._load(f"{table}.{column}.null")
+            values = [None if n else v for v, n in zip(values, nulls.tolist())]
+        return values
+
+    def rows(self, table):
+        columns = [c["name"] for c in self.manifest["tables"][table]["columns"]]
+        return columns, zip(*(self.values(table, c) for c in columns))
+
+
+def restore(path, db_path):
+    """Create db_path from the snapshot at path and migrate it; returns timing and counts."""
+    import changes
+    import graph_index
+    import http_cache
+    import migrations
+
+    if os.path.exists(db_path):
+        raise SnapshotError(f"{db_path} already exists")
+    started = time.perf_counter()
+    snap = Snapshot(path)
+    conn = sqlite3.connect(db_path)
+    try:
+        counts = {}
+        for table, spec in snap.manifest["tables"].items():
+            conn.execute(spec["sql"])
+            columns, rows = snap.rows(table)
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+            counts[table] = spec["rows"]
+        # Indexes after the data: one sort each instead of row-by-row maintenance
+        for spec in snap.manifest["tables"].values():
+            for sql in spec["indexes"]:
+                conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+    migrations.migrate(db_path)
+    # Carry the source's counters over, so ETags and a snapshot-built graph
+    # index line up with the replica. Its change log starts empty, so a
+    # client syncing from an older revision is told to resync.
+    revision = snap.versions.get(http_cache.REVISION_KEY, 0)
+    counters = {
+        http_cache.REVISION_KEY: revision,
+        graph_index.VERSION_KEY: snap.versions.get(graph_index.VERSION_KEY, 0),
+        changes.TRUNCATED_KEY: revision,
+    }
+    # The replica got its own id from the migrations; this snapshot still
+    # matches it until its first write
+    if ID_KEY in snap.versions:
+        counters.update({RESTORED_FROM_KEY: snap.versions[ID_KEY], RESTORED_AT_KEY: revision})
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, version in counters.items():
+            conn.execute(
+                "INSERT INTO graph_versions (name, version) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET version = excluded.version",
+                (name, version),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return {"tables": counts, "restore_seconds": round(time.perf_counter() - started, 3)}
+
+
+def write_tar(path, fileobj):
+    """Pack the snapshot directory at path into an uncompressed tar (arrays don't compress well)."""
+    with tarfile.open(fileobj=fileobj, mode="w") as tar:
+        for name in sorted(os.listdir(path)):
+            tar.add(os.path.join(path, name), arcname=os.path.join("snapshot", name))
+
+
+_current = None
+
+
+def current():
+    """The snapshot named by KNOWLEDGE_SNAPSHOT_PATH, or None."""
+    global _current
+    if not config.SNAPSHOT_PATH:
+        return None
+    if _current is None or _current.path != config.SNAPSHOT_PATH:
+        try:
+            _current = Snapshot(config.SNAPSHOT_PATH)
+        except SnapshotError:
+            return None
+    return _current
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, restore or inspect graph snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export")
+    p.add_argument("path")
+    p.add_argument("--db", default=config.DB_PATH)
+    p = sub.add_parser("restore")
+    p.add_argument("path")
+    p.add_argument("db")
+    p = sub.add_parser("info")
+    p.add_argument("path")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            manifest = export(args.db, args.path)
+            print(json.dumps({t: s["rows"] for t, s in manifest["tables"].items()}
+                             | {"export_seconds": manifest["export_seconds"]}))
+        elif args.command == "restore":
+            print(json.dumps(restore(args.path, args.db)))
+        else:
+            snap = Snapshot(args.path)
+            print(json.dumps({"versions": snap.versions,
+                              "tables": {t: snap.count(t) for t in snap.tables()}}, indent=2))
+    except SnapshotError as e:
+        sys.exit(str(e))
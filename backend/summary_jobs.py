@@ -0,0 +1,380 @@
+# summary_jobs.py
+# Background generation of node summaries through the LLM client.
+#
+# A job is a set of node ids. It is stored in summary_jobs/summary_job_items,
+# so any worker process can report its progress, and runs on a single job
+# thread in the process that accepted it:
+#   - titles are normalized (case and whitespace) and each distinct title is
+#     requested once, however many nodes share it
+#   - titles already in summary_cache skip the API entirely
+#   - the rest go to a thread pool of SUMMARY_CONCURRENCY workers, each call
+#     bounded by SUMMARY_TIMEOUT and retried with backoff
+#   - summaries are written to nodes.summary SUMMARY_WRITE_BATCH at a time
+#     (or at least every SUMMARY_STALE_AFTER / 4 seconds), together with the
+#     item and job progress
+#
+# A job whose updated_at is older than SUMMARY_STALE_AFTER was left behind by
+# a process that died or was recycled. resume_stale() requeues it here (on
+# worker start, on submit and when its status is read); the first process to
+# claim it picks up its queued items, and run() only starts a job it claimed.
+#
+# SUMMARY_CLIENT=stub swaps the OpenAI client for StubClient, which answers
+# locally, for tests and offline development.
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import config
+import database
+import metrics
+import parse_cache
+
+PROMPT = "Give a one-sentence explanation of '{title}' suitable for students."
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+def normalize_title(title):
+    return " ".join((title or "").split()).lower()
+
+
+class OpenAIClient:
+    def __init__(self, api_key=None, model=None, base_url=None, timeout=None):
+        from openai import OpenAI
+
+        self.model = model or config.SUMMARY_MODEL
+        # Retries are ours (see _complete), not the SDK's.
+        self._client = OpenAI(
+            api_key=api_key or config.OPENAI_API_KEY,
+            base_url=base_url or config.OPENAI_BASE_URL,
+            timeout=timeout or config.SUMMARY_TIMEOUT,
+            max_retries=0,
+        )
+
+    def complete(self, title):
+        response = self._client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": PROMPT.format(title=title)}],
+        )
+        return response.choices[0].message.content.strip()
+
+
+class StubClient:
+    """Answers locally; records every title it was asked about."""
+
+    model = "stub"
+
+    def __init__(self, delay=0.0, fail=()):
+        self.delay = delay
+        self.fail = {normalize_title(t) for t in fail}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def complete(self, title):
+        with self._lock:
+            self.calls.append(title)
+        if self.delay:
+            time.sleep(self.delay)
+        if normalize_title(title) in self.fail:
+            raise RuntimeError(f"stub failure for '{title}'")
+        return f"{title.strip()} is a concept students meet in this course."
+
+
+def make_client(name=None):
+    name = name or config.SUMMARY_CLIENT
+    if name == "stub":
+        return StubClient()
+    if name == "openai":
+        return OpenAIClient()
+    raise ValueError(f"Unknown summary client '{name}'")
+
+
+class SummaryService:
+    def __init__(self, client=None, concurrency=None):
+        self._client = client
+        self.concurrency = concurrency or config.SUMMARY_CONCURRENCY
+        self._lock = threading.Lock()
+        self._calls = None
+        self._jobs = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = make_client()
+            return self._client
+
+    def _executors(self):
+        with self._lock:
+            if self._calls is None:
+                self._calls = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                 thread_name_prefix="summary-call")
+                # One job at a time; its API calls share the bounded pool above.
+                self._jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary-job")
+            return self._calls, self._jobs
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            calls, jobs, self._calls, self._jobs = self._calls, self._jobs, None, None
+        for executor in (jobs, calls):
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    # -- single summaries --------------------------------------------------
+
+    def _complete(self, title):
+        attempt = 0
+        while True:
+            try:
+                with metrics.stage("llm"):
+                    return self.client.complete(title)
+            except Exception:
+                if attempt >= config.SUMMARY_RETRIES:
+                    raise
+                delay = config.SUMMARY_BACKOFF * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+                attempt += 1
+
+    def summarize(self, title):
+        """Summary for one title, from the cache or the client."""
+        key = normalize_title(title)
+        with database.connection() as conn:
+            cached = _cached(conn, [key])
+        if key in cached:
+            return cached[key]
+        # No pooled connection is held across the call and its retries
+        summary = self._complete(title)
+        with database.connection() as conn:
+            _store(conn, [(key, title, summary, self.client.model)])
+            conn.commit()
+        return summary
+
+    # -- jobs --------------------------------------------------------------
+
+    def submit(self, conn, node_ids, overwrite=False):
+        """Queue a job for node_ids and return its id; commits on conn."""
+        node_ids = list(dict.fromkeys(int(n) for n in node_ids))
+        now = time.time()
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO summary_jobs (status, overwrite, total, created_at, updated_at) "
+            "VALUES ('queued', ?, ?, ?, ?)",
+            (int(bool(overwrite)), len(node_ids), now, now),
+        )
+        job_id = cur.lastrowid
+        cur.executemany(
+            "INSERT INTO summary_job_items (job_id, node_id, status) VALUES (?, ?, 'queued')",
+            [(job_id, n) for n in node_ids],
+        )
+        conn.commit()
+        self.resume_stale(conn)
+        _, jobs = self._executors()
+        jobs.submit(self.run, job_id)
+        return job_id
+
+    def resume_stale(self, conn):
+        """Requeue here the jobs another process left queued or running; returns their ids."""
+        now = time.time()
+        stale = [r[0] for r in conn.execute(
+            "SELECT id FROM summary_jobs WHERE status IN ('queued', 'running') AND updated_at < ?",
+            (now - config.SUMMARY_STALE_AFTER,),
+        )]
+        resumed = []
+        for job_id in stale:
+            # Whoever moves updated_at first owns the job
+            cur = conn.execute(
+                "UPDATE summary_jobs SET status='queued', updated_at=? "
+                "WHERE id=? AND status IN ('queued', 'running') AND updated_at < ?",
+                (now, job_id, now - config.SUMMARY_STALE_AFTER),
+            )
+            if cur.rowcount == 1:
+                resumed.append(job_id)
+        conn.commit()
+        if resumed:
+            _, jobs = self._executors()
+            for job_id in resumed:
+                jobs.submit(self.run, job_id)
+        return resumed
+
+    def run(self, job_id):
+        with database.connection() as conn:
+            claimed = conn.execute(
+                "UPDATE summary_jobs SET status='running', updated_at=? WHERE id=? AND status='queued'",
+                (time.time(), job_id),
+            ).rowcount
+            conn.commit()
+            if not claimed:
+                return  # done, or another process resumed it
+            try:
+                self._run(conn, job_id)
+            except Exception as e:
+                conn.rollback()
+                _finish(conn, job_id, "failed", str(e))
+                conn.commit()
+
+    def _run(self, conn, job_id):
+        job = conn.execute("SELECT overwrite FROM summary_jobs WHERE id=?", (job_id,)).fetchone()
+        if job is None:
+            return
+        overwrite = bool(job[0])
+        rows = conn.execute("""
+            SELECT i.node_id, n.title, n.summary
+            FROM summary_job_items i LEFT JOIN nodes n ON n.id = i.node_id
+            WHERE i.job_id = ? AND i.status = 'queued'
+        """, (job_id,)).fetchall()
+
+        writer = _Writer(conn, job_id)
+        groups, titles = {}, {}
+        for node_id, title, summary in rows:
+            if title is None:
+                writer.item(node_id, "failed", error="Node not found")
+            elif summary and summary.strip() and not overwrite:
+                writer.item(node_id, "skipped")
+            else:
+                key = normalize_title(title)
+                groups.setdefault(key, []).append((node_id, summary))
+                titles.setdefault(key, title.strip())
+        writer.flush()
+
+        cached = _cached(conn, list(groups))
+        for key, summary in cached.items():
+            for node_id, old in groups.pop(key):
+                writer.summary(node_id, old, summary, cached=True)
+        writer.flush()
+
+        calls, _ = self._executors()
+        futures = {calls.submit(self._complete, titles[key]): key for key in groups}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                for node_id, _ in groups[key]:
+                    writer.item(node_id, "failed", error=str(e))
+            else:
+                writer.cache(key, titles[key], summary, self.client.model)
+                for node_id, old in groups[key]:
+                    writer.summary(node_id, old, summary)
+            if writer.pending >= config.SUMMARY_WRITE_BATCH or writer.due():
+                writer.flush()
+        writer.flush()
+
+        failed = conn.execute("SELECT failed, total FROM summary_jobs WHERE id=?", (job_id,)).fetchone()
+        _finish(conn, job_id, "failed" if failed[1] and failed[0] == failed[1] else "done")
+        conn.commit()
+
+    def job(self, conn, job_id, items=False):
+        self.resume_stale(conn)
+        row = conn.execute(
+            "SELECT id, status, overwrite, total, completed, cached, skipped, failed, error, "
+            "created_at, updated_at, finished_at FROM summary_jobs WHERE id=?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "status", "overwrite", "total", "completed", "cached", "skipped", "failed",
+                "error", "created_at", "updated_at", "finished_at")
+        result = dict(zip(keys, row))
+        result["overwrite"] = bool(result["overwrite"])
+        if items:
+            result["items"] = [
+                {"node_id": r[0], "status": r[1], "error": r[2]}
+                for r in conn.execute(
+                    "SELECT node_id, status, error FROM summary_job_items WHERE job_id=? ORDER BY node_id",
+                    (job_id,),
+                )
+            ]
+        return result
+
+
+class _Writer:
+    """Buffers one job's results and writes them in a single transaction per flush."""
+
+    def __init__(self, conn, job_id):
+        self.conn = conn
+        self.job_id = job_id
+        self._summaries = []
+        self._items = []
+        self._cache = []
+        self._stale = []
+        self._counts = dict.fromkeys(("completed", "cached", "skipped", "failed"), 0)
+        self.flushed_at = time.monotonic()
+
+    @property
+    def pending(self):
+        return len(self._items)
+
+    def item(self, node_id, status, error=None):
+        self._items.append((status, error, self.job_id, node_id))
+        self._counts["completed" if status == "done" else status] += 1
+
+    def summary(self, node_id, old, summary, cached=False):
+        self._summaries.append((summary, node_id))
+        if old and old != summary:
+            self._stale.append(old)
+        self.item(node_id, "done")
+        if cached:
+            self._counts["cached"] += 1
+
+    def cache(self, key, title, summary, model):
+        self._cache.append((key, title, summary, model))
+
+    def due(self):
+        # Keeps updated_at moving, so a slow job is not taken for an abandoned one
+        return time.monotonic() - self.flushed_at > config.SUMMARY_STALE_AFTER / 4
+
+    def flush(self):
+        conn = self.conn
+        if self._cache:
+            _store(conn, self._cache)
+        if self._summaries:
+            conn.executemany("UPDATE nodes SET summary=? WHERE id=?", self._summaries)
+        for old in self._stale:
+            parse_cache.cache.invalidate(old, conn)
+        if self._items:
+            conn.executemany(
+                "UPDATE summary_job_items SET status=?, error=? WHERE job_id=? AND node_id=?",
+                self._items,
+            )
+        c = self._counts
+        conn.execute(
+            "UPDATE summary_jobs SET completed=completed+?, cached=cached+?, skipped=skipped+?, "
+            "failed=failed+?, updated_at=? WHERE id=?",
+            (c["completed"], c["cached"], c["skipped"], c["failed"], time.time(), self.job_id),
+        )
+        conn.commit()
+        self._summaries, self._items, self._cache, self._stale = [], [], [], []
+        self._counts = dict.fromkeys(c, 0)
+        self.flushed_at = time.monotonic()
+
+
+def _cached(conn, keys):
+    found = {}
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        found.update(conn.execute(
+            f"SELECT title_key, summary FROM summary_cache WHERE title_key IN ({','.join('?' * len(chunk))})",
+            chunk,
+        ).fetchall())
+    return found
+
+
+def _store(conn, rows):
+    now = time.time()
+    conn.executemany(
+        "INSERT OR REPLACE INTO summary_cache (title_key, title, summary, model, created_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [row + (now,) for row in rows],
+    )
+
+
+def _finish(conn, job_id, status, error=None):
+    now = time.time()
+    conn.execute(
+        "UPDATE summary_jobs SET status=?, error=?, updated_at=?, finished_at=? WHERE id=?",
+        (status, error, now, now, job_id),
+    )
+
+
+service = SummaryService()
@@ -0,0 +1,56 @@
+# validation.py
+# Attribute value checks shared by the API routes and the bulk importer.
+import re
+from datetime import date
+
+# Data types whose values are also stored in node_attributes.value_num
+TYPED = ("integer", "float", "boolean", "date")
+EPOCH = date(1970, 1, 1)
+
+
+def validate_attribute_value(data_type, value, allowed_values=None):
+    if data_type == "integer":
+        try:
+            int(value)
+            return True
+        except Exception:
+            return False
+    elif data_type == "float":
+        try:
+            float(value)
+            return True
+        except Exception:
+            return False
+    elif data_type == "boolean":
+        return str(value).lower() in ("true", "false", "1", "0")
+    elif data_type == "date":
+        return bool(re.match(r"^\d{4}-\d{2}-\d{2}$", str(value)))
+    elif data_type == "array":
+        return isinstance(value, str) and len(value.strip()) > 0
+    elif data_type == "string":
+        return isinstance(value, str)
+    if allowed_values:
+        allowed = [v.strip() for v in allowed_values.split(";") if v.strip()]
+        return value in allowed
+    return True
+
+
+def typed_value(data_type, value):
+    """The sortable number stored in node_attributes.value_num, or None.
+
+    Integers and floats are stored as-is, booleans as 0/1 and dates as days
+    since 1970-01-01, so one (attribute_id, value_num) index serves range
+    and equality queries for every ordered type.
+    """
+    try:
+        if data_type == "integer":
+            return int(value)
+        if data_type == "float":
+            return float(value)
+        if data_type == "boolean":
+            return 1 if str(value).strip().lower() in ("true", "1") else 0
+        if data_type == "date":
+            return (date.fromisoformat(str(value).strip()) - EPOCH).days
+    except (TypeError, ValueError):
+        return None
+    return None
@@ -0,0 +1,62 @@
+# wsgi.py
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:application
+#
+# `python app.py` runs the single-process Werkzeug dev server with the
+# debugger on; this module serves the same app under gunicorn's preforking
+# master (settings in gunicorn.conf.py, tunables in config.py SERVER_*).
+#
+# With SERVER_PRELOAD the master imports the app and calls warm() once
+# before forking, so every worker starts with the spaCy model and the
+# graph and similarity indexes already in memory and shares their pages
+# copy-on-write, instead of each paying the load on its first request. warm() closes its
+# SQLite connections before the fork (they must not cross one), and
+# after_fork() clears the metrics the master recorded while warming and
+# picks up the summary jobs a previous worker left unfinished.
+import logging
+import time
+
+import config
+import database
+import graph_index
+import metrics
+import nlp_models
+import similarity
+import summary_jobs
+from app import app
+
+log = logging.getLogger(__name__)
+
+application = app
+
+
+def warm():
+    """Load the shared state into this process; returns what was loaded and how long it took."""
+    loaded = {}
+    started = time.perf_counter()
+    with database.connection() as conn:
+        index = graph_index.get_index(conn)
+    loaded["graph_index"] = {"edges": index.edge_count, "seconds": round(time.perf_counter() - started, 3)}
+    started = time.perf_counter()
+    with database.connection() as conn:
+        nodes = similarity.get_index(conn).size
+    loaded["similarity"] = {"nodes": nodes, "seconds": round(time.perf_counter() - started, 3)}
+    started = time.perf_counter()
+    try:
+        nlp_models.preload()
+        loaded["nlp_model"] = {"name": config.NLP_MODEL, "seconds": round(time.perf_counter() - started, 3)}
+    except (ImportError, OSError) as e:
+        # spaCy or the model is missing: the NLP routes fail, everything else works
+        log.warning("spaCy model %s not preloaded: %s", config.NLP_MODEL, e)
+    # Connections opened here must not be inherited by the workers.
+    database.get_pool().close_all()
+    return loaded
+
+
+def after_fork():
+    # warm() closed the master's connections, and the pool starts afresh on
+    # a new pid anyway. Thread and process pools (nlp_pool, summary_jobs,
+    # the change broadcaster) are started lazily on first use, so none
+    # were forked; only the samples recorded while warming are left.
+    metrics.reset()
+    with database.connection() as conn:
+        summary_jobs.service.resume_stale(conn)
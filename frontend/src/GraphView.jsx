@@ -16,6 +16,7 @@ export default function GraphView({ relationRefreshKey }) {
   const [relationTypes, setRelationTypes] = useState([]);
   const [allNodes, setAllNodes] = useState([]);
   const [relationList, setRelationList] = useState([]);
+  const [layoutPositions, setLayoutPositions] = useState({});
   const [searchQuery, setSearchQuery] = useState("");
   const expandedNodes = useRef(new Set());
   const [sidebarTab, setSidebarTab] = useState('nodes');
@@ -35,6 +36,12 @@ export default function GraphView({ relationRefreshKey }) {
       setAllNodes(data.map(n => ({ ...n, id: Number(n.id) })));
     });
     fetch('/api/relation-types').then(res => res.json()).then(setRelationTypes);
+    // Positions for the default network are computed server-side
+    fetch('/api/layout').then(res => res.json()).then(data => {
+      const positions = {};
+      (data.nodes || []).forEach(p => { positions[p.id] = p; });
+      setLayoutPositions(positions);
+    }).catch(err => console.error("Failed to load layout:", err));
     fetch('/api/relations').then(res => res.json()).then(data => {
       // Debug: log relationList
       console.log("Fetched relationList:", data);
@@ -590,7 +597,26 @@ export default function GraphView({ relationRefreshKey }) {
     svg.attr('viewBox', `0 0 ${window.innerWidth} ${window.innerHeight}`)
       .attr('preserveAspectRatio', 'xMinYMin meet');
 
-    const simulation = d3.forceSimulation(nodes)
+    // Use the server-side layout when it covers every node: scale it into the
+    // canvas and draw once. Only fall back to simulating in the browser when
+    // /api/layout is unavailable.
+    const positioned = nodes.every(n => layoutPositions[n.id]);
+    if (positioned) {
+      const xs = nodes.map(n => layoutPositions[n.id].x);
+      const ys = nodes.map(n => layoutPositions[n.id].y);
+      const minX = Math.min(...xs), minY = Math.min(...ys);
+      const pad = 40;
+      const scale = Math.min(
+        (width - 2 * pad) / ((Math.max(...xs) - minX) || 1),
+        (height - 2 * pad) / ((Math.max(...ys) - minY) || 1)
+      );
+      nodes.forEach(n => {
+        n.x = sidebarWidth + pad + (layoutPositions[n.id].x - minX) * scale;
+        n.y = headerHeight + pad + (layoutPositions[n.id].y - minY) * scale;
+      });
+    }
+
+    const simulation = positioned ? null : d3.forceSimulation(nodes)
       .force('link', d3.forceLink(links).id(d => d.id).distance(120).strength(1))
       .force('charge', d3.forceManyBody().strength(d => -40 - (degreeMap[d.id] || 0) * 10))
       .force('center', d3.forceCenter(sidebarWidth + 120, headerHeight + 80))
@@ -624,7 +650,7 @@ export default function GraphView({ relationRefreshKey }) {
         showNodeAndNeighbors(d.id);
       });
 
-    simulation.on('tick', () => {
+    const render = () => {
       arc.attr('d', d => {
         // Tapered arc path between d.source and d.target
         if (!d.source || !d.target) {
@@ -674,7 +700,13 @@ export default function GraphView({ relationRefreshKey }) {
           // Clamp vertically within canvas (avoid top and bottom overflow)
           return Math.max(headerHeight + r, Math.min(height + headerHeight - r, d.y));
         });
-    });
+    };
+
+    if (simulation) {
+      simulation.on('tick', render);
+    } else {
+      render();
+    }
   };
 
   // Only call drawDefaultNetwork when nothing is selected
@@ -692,7 +724,7 @@ export default function GraphView({ relationRefreshKey }) {
       drawGraph(nodes, links);
     }
     // eslint-disable-next-line
-  }, [selectedNode, relationList, allNodes, nodes, links]);
+  }, [selectedNode, relationList, allNodes, nodes, links, layoutPositions]);
 
   // Add a function to reset to default view
   const resetDefaultView = () => {